@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of update dispatch cost.
+
+Measures route lookup for every callback and menu text, and the full
+handler matching walk PTB performs for one update of each kind.
+
+Usage: python benchmark_dispatch.py [--number 100000]
+"""
+import argparse
+import os
+import timeit
+import warnings
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+warnings.filterwarnings("ignore")
+
+from telegram import Update
+
+import bot
+from utils.messaging import build_application
+
+
+def make_update(application, payload: dict) -> Update:
+    base = {
+        "update_id": 1,
+    }
+    base.update(payload)
+    return Update.de_json(base, application.bot)
+
+
+def match_handlers(application, update):
+    """Walk handler groups the way Application.process_update does"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if handler.check_update(update):
+                return handler
+    return None
+
+
+def report(name: str, seconds: float, number: int):
+    print(f"{name:<28} {seconds / number * 1e9:10.1f} ns/update")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure update dispatch cost")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    n = args.number
+    
+    callbacks = list(bot.CALLBACK_ROUTES) + ["diary_del_01HZX3C8Q7Y2ZP0W4M7K6N5R1T"]
+    texts = list(bot.TEXT_ROUTES) + ["произвольный текст"]
+    
+    seconds = timeit.timeit(lambda: [bot.resolve_callback(d) for d in callbacks], number=n // len(callbacks))
+    report("resolve_callback", seconds, n // len(callbacks) * len(callbacks))
+    
+    seconds = timeit.timeit(lambda: [bot.TEXT_ROUTES.get(t) for t in texts], number=n // len(texts))
+    report("text route lookup", seconds, n // len(texts) * len(texts))
+    
+    application = build_application("123456:benchmark")
+    bot.register_handlers(application)
+    user = {"id": 1, "is_bot": False, "first_name": "Bench"}
+    chat = {"id": 1, "type": "private"}
+    message = {"message_id": 1, "date": 0, "chat": chat, "from": user, "text": "🃏 Таро"}
+    callback_update = make_update(application, {
+        "callback_query": {"id": "1", "from": user, "chat_instance": "1", "data": "deepen_daily", "message": message}
+    })
+    text_update = make_update(application, {"message": message})
+    
+    seconds = timeit.timeit(lambda: match_handlers(application, callback_update), number=n // 10)
+    report("handler match (callback)", seconds, n // 10)
+    seconds = timeit.timeit(lambda: match_handlers(application, text_update), number=n // 10)
+    report("handler match (text)", seconds, n // 10)
+
+
+if __name__ == "__main__":
+    main()
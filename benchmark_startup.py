@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup-time benchmark for the webhook service.
+
+Each run imports bot_webhook in a fresh interpreter and measures the time
+until /health answers and, optionally, until /ready reports the bot ready.
+
+Usage: python benchmark_startup.py [--runs 5] [--wait-ready 30]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import bot_webhook
+imported = time.perf_counter() - start
+client = bot_webhook.app.test_client()
+client.get('/health')
+health = time.perf_counter() - start
+ready = None
+deadline = start + float(sys.argv[1])
+while time.perf_counter() < deadline:
+    if client.get('/ready').status_code == 200:
+        ready = time.perf_counter() - start
+        break
+    time.sleep(0.05)
+print(json.dumps({"import": imported, "health": health, "ready": ready}))
+"""
+
+
+def run_once(wait_ready: float) -> dict:
+    """Start a fresh interpreter and time the startup phases"""
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    env.setdefault("WEBHOOK_URL", "https://example.invalid")
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, str(wait_ready)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure webhook service cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--wait-ready", type=float, default=0,
+                        help="seconds to wait for /ready (needs network and a real token)")
+    args = parser.parse_args()
+    
+    runs = [run_once(args.wait_ready) for _ in range(args.runs)]
+    
+    for phase in ("import", "health", "ready"):
+        values = [r[phase] for r in runs if r[phase] is not None]
+        if not values:
+            print(f"{phase:>7}: not reached")
+            continue
+        print(f"{phase:>7}: median {statistics.median(values) * 1000:8.1f} ms  "
+              f"min {min(values) * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
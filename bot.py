@@ -2,10 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import os
-import random
 import logging
 from datetime import datetime
-from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, LabeledPrice
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,67 +12,78 @@ from telegram.ext import (
     CallbackQueryHandler,
     ConversationHandler,
     ContextTypes,
+    PreCheckoutQueryHandler,
+    TypeHandler,
     filters
 )
 
 # Import utilities
-from data.tarot_deck import get_full_deck, find_card
-from utils.database import UserDatabase, DiaryDatabase, DailyEnergyCache
+from data.tarot_deck import SPREADS, draw_cards, card_display_names
+from utils.database import UserDatabase, DiaryDatabase, DailyEnergyCache, DeeperInterpretationCache
+from utils.quota import QuotaEngine
+from utils.i18n import DEFAULT_LOCALE
+from utils.subscriptions import (
+    subscriptions,
+    refresh_tier,
+    start_expiry_sweep,
+    invoice_payload,
+    parse_invoice_payload,
+    PLANS,
+    PAYMENT_PROVIDER_TOKEN,
+    PAYMENT_CURRENCY,
+    PAYMENT_TEST_MODE,
+    SUBSCRIPTION_PERIOD_DAYS
+)
+from utils.conversation import ConversationContext
+from utils.singleflight import SingleFlight, content_hash
+from utils.speculative import SpeculativeCache
+from utils.scheduler import llm_scheduler, Overloaded
+from utils.executors import executors
+from utils.retention import start_retention
+from utils.recorder import RECORD_UPDATES, UpdateRecorder
+from utils.logs import setup_logging, instrument_handlers
+from utils.telemetry import Telemetry, count_tokens, format_stats
+from utils.messaging import build_application, finish_placeholder
+from utils.polling import PerUserUpdateProcessor, POLLING_TIMEOUT, POLLING_ALLOWED_UPDATES
+from utils import ui
 from utils.ai_generator import (
     generate_daily_energy,
     generate_tarot_reading,
     generate_own_deck_reading,
-    generate_deeper_interpretation
+    generate_deeper_interpretation,
+    generate_followup,
+    fallback_tarot_reading
 )
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Structured logging through a background writer thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Conversation states
-TAROT_QUESTION, TAROT_CARDS, OWN_DECK_QUESTION, OWN_DECK_CARDS, DIARY_ENTRY = range(5)
+# Concurrent presses of "Углубить" for the same reading share one generation
+deeper_flight = SingleFlight()
+# Deeper interpretations pre-generated after paid readings (opt-in)
+speculative_deeper = SpeculativeCache()
 
-# Main menu keyboard
-def get_main_menu():
-    """Get main menu keyboard"""
-    keyboard = [
-        ["⭐ Энергия дня", "🃏 Таро"],
-        ["📝 Дневник", "🔔 Уведомления"],
-        ["✨ Подписка"]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+# Telegram user ids allowed to run admin commands such as /stats
+ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+
+# Diary entries per page of "Мои записи"; free users see only the first page
+DIARY_PAGE_SIZE = 5
+
+# Conversation states
+TAROT_QUESTION, TAROT_CARDS, OWN_DECK_QUESTION, OWN_DECK_CARDS, DIARY_ENTRY, DIARY_EDIT, FOLLOW_UP = range(7)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user_id = update.effective_user.id
-    UserDatabase.get_user(user_id)  # Initialize user
+    await executors.run_io(UserDatabase.get_user, user_id)  # Initialize user
+    t = ui.for_update(update)
     
-    welcome_text = """🌿 Добро пожаловать в «Моё пространство»
-
-Это тихое место, где можно:
-— задать вопрос Таро
-— почувствовать энергию дня
-— записать свои мысли и ощущения
-
-Я не предсказываю будущее.
-Я помогаю тебе услышать себя 🤍"""
-    
-    keyboard = [
-        [InlineKeyboardButton("⭐ Энергия дня", callback_data="daily_energy")],
-        [InlineKeyboardButton("🃏 Таро", callback_data="tarot")],
-        [InlineKeyboardButton("📝 Дневник", callback_data="diary")],
-        [InlineKeyboardButton("✨ Как это работает?", callback_data="how_it_works")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup)
+    await update.message.reply_text(t.WELCOME_TEXT, reply_markup=t.START_KEYBOARD)
     await update.message.reply_text(
-        "Выбери действие:",
-        reply_markup=get_main_menu()
+        t.CHOOSE_ACTION,
+        reply_markup=t.MAIN_MENU
     )
 
 
@@ -82,17 +92,7 @@ async def how_it_works(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    text = """✨ Как это работает?
-
-🃏 **Таро** — задай вопрос, и карты помогут тебе услышать себя. Это не предсказание, а поддержка в размышлении.
-
-⭐ **Энергия дня** — короткий астро-фон и карта дня с мягким советом.
-
-📝 **Дневник** — твоё личное пространство для записей, мыслей и ощущений.
-
-Это информационный и поддерживающий формат и не заменяет профессиональную консультацию."""
-    
-    await query.edit_message_text(text)
+    await query.edit_message_text(ui.for_update(update).HOW_IT_WORKS_TEXT)
 
 
 # ============================================
@@ -102,6 +102,7 @@ async def how_it_works(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def daily_energy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle daily energy request"""
     user_id = update.effective_user.id
+    t = ui.for_update(update)
     
     # Check if message or callback
     if update.callback_query:
@@ -112,45 +113,42 @@ async def daily_energy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         send_func = update.message.reply_text
     
     # Check usage limit
-    if not UserDatabase.can_use_daily_energy(user_id):
-        await send_func(
-            "Ты уже получила энергию дня сегодня 🌿\n\n"
-            "Приходи завтра за новой энергией, или оформи подписку для доступа к архиву.",
-            reply_markup=get_main_menu()
-        )
+    if not await executors.run_io(QuotaEngine.can_use, user_id, "daily_energy"):
+        wait = await executors.run_io(QuotaEngine.available_in, user_id, "daily_energy")
+        template = t.DAILY_ENERGY_LIMIT_TEMPLATES[ui.paid_key(subscriptions.is_paid(user_id))]
+        text = template.format(wait=t.format_wait(wait))
+        await send_func(text, reply_markup=t.MAIN_MENU)
         return
     
-    await send_func("Создаю энергию дня... ✨")
-    
-    # Check cache
-    cached_energy = DailyEnergyCache.get_today()
+    # Check cache (one text per locale); the placeholder is only needed while generating
+    placeholder = None
+    spent = count_tokens()
+    cached_energy = await executors.run_io(DailyEnergyCache.get_today, t.locale)
     if cached_energy:
         energy_text = cached_energy["text"]
+        await executors.run_io(Telemetry.record, "daily_energy", cached=True, tier=subscriptions.tier(user_id))
     else:
-        energy_text = generate_daily_energy()
-        DailyEnergyCache.set_today({"text": energy_text})
+        placeholder = await send_func(t.DAILY_ENERGY_PENDING)
+        try:
+            energy_text = await llm_scheduler.submit(subscriptions.tier(user_id), generate_daily_energy, t.locale)
+        except Overloaded:
+            await finish_placeholder(placeholder, t.OVERLOADED_TEXT)
+            return
+        await executors.run_io(DailyEnergyCache.set_today, {"text": energy_text}, t.locale)
     
     # Record usage
-    UserDatabase.record_daily_energy(user_id)
+    await executors.run_io(UserDatabase.record_daily_energy, user_id, sum(spent))
     
     # Store in context for diary
     context.user_data['last_daily_energy'] = energy_text
+    ConversationContext.start(context.user_data, "daily", energy_text, locale=t.locale)
     
-    # Buttons
-    keyboard = [
-        [InlineKeyboardButton("📝 Записать в дневник", callback_data="diary_save_daily")],
-        [InlineKeyboardButton("🃏 Задать вопрос Таро", callback_data="tarot")],
-        [InlineKeyboardButton("🔔 Напоминать ежедневно", callback_data="notify_daily")]
-    ]
+    reply_markup = t.DAILY_ENERGY_KEYBOARDS[ui.paid_key(subscriptions.is_paid(user_id))]
     
-    if UserDatabase.is_paid(user_id):
-        keyboard.append([InlineKeyboardButton("🌿 Углубить", callback_data="deepen_daily")])
+    if placeholder:
+        await finish_placeholder(placeholder, energy_text, reply_markup=reply_markup)
     else:
-        keyboard.append([InlineKeyboardButton("🌿 Углубить 🔒", callback_data="upgrade_needed")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await send_func(energy_text, reply_markup=reply_markup)
+        await send_func(energy_text, reply_markup=reply_markup)
 
 
 # ============================================
@@ -169,19 +167,9 @@ async def tarot_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         send_func = update.message.reply_text
     
-    text = "🃏 Как ты хочешь получить ответ?"
-    
-    keyboard = [
-        [InlineKeyboardButton("✨ Карты выберет бот", callback_data="tarot_bot")],
-    ]
-    
-    if UserDatabase.is_premium(user_id):
-        keyboard.append([InlineKeyboardButton("🌿 У меня есть своя колода", callback_data="tarot_own")])
-    else:
-        keyboard.append([InlineKeyboardButton("🌿 У меня есть своя колода 🔒", callback_data="upgrade_premium")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await send_func(text, reply_markup=reply_markup)
+    t = ui.for_update(update)
+    reply_markup = t.TAROT_MENU_KEYBOARDS[ui.premium_key(subscriptions.is_premium(user_id))]
+    await send_func(t.TAROT_MODE_PROMPT, reply_markup=reply_markup)
 
 
 async def tarot_bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -190,19 +178,17 @@ async def tarot_bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
+    t = ui.for_update(update)
     
     # Check usage limit
-    if not UserDatabase.can_use_tarot(user_id):
-        await query.message.reply_text(
-            "Ты уже получила расклад Таро сегодня 🌿\n\n"
-            "Приходи завтра за новым раскладом, или оформи подписку для безлимитного доступа.",
-            reply_markup=get_main_menu()
-        )
+    if not await executors.run_io(QuotaEngine.can_use, user_id, "tarot"):
+        wait = await executors.run_io(QuotaEngine.available_in, user_id, "tarot")
+        template = t.TAROT_LIMIT_TEMPLATES[ui.paid_key(subscriptions.is_paid(user_id))]
+        text = template.format(wait=t.format_wait(wait))
+        await query.message.reply_text(text, reply_markup=t.MAIN_MENU)
         return ConversationHandler.END
     
-    await query.message.reply_text(
-        "Задай свой вопрос. Сформулируй его так, чтобы он был важен для тебя 🤍"
-    )
+    await query.message.reply_text(t.TAROT_QUESTION_PROMPT)
     
     return TAROT_QUESTION
 
@@ -211,21 +197,25 @@ async def tarot_question_received(update: Update, context: ContextTypes.DEFAULT_
     """Receive tarot question and ask for card count"""
     question = update.message.text
     context.user_data['tarot_question'] = question
-    
-    keyboard = [
-        [InlineKeyboardButton("1 карта — совет", callback_data="tarot_1card")],
-        [InlineKeyboardButton("3 карты — прошлое / настоящее / будущее", callback_data="tarot_3cards")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    t = ui.for_update(update)
     
     await update.message.reply_text(
-        "Сколько карт вытянуть?",
-        reply_markup=reply_markup
+        t.TAROT_SPREAD_PROMPT,
+        reply_markup=t.TAROT_SPREAD_KEYBOARDS[ui.paid_key(subscriptions.is_paid(update.effective_user.id))]
     )
     
     return TAROT_CARDS
 
 
+# Spread buttons -> spread type
+SPREAD_CALLBACKS = {
+    "tarot_1card": "1_card",
+    "tarot_3cards": "3_cards",
+    "tarot_5cards": "5_cards",
+    "tarot_celtic": "celtic_cross",
+}
+
+
 async def tarot_draw_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Draw cards and generate reading"""
     query = update.callback_query
@@ -233,45 +223,47 @@ async def tarot_draw_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     question = context.user_data.get('tarot_question', '')
+    t = ui.for_update(update)
     
     # Determine spread type
-    if query.data == "tarot_1card":
-        spread_type = "1_card"
-        num_cards = 1
-    else:
-        spread_type = "3_cards"
-        num_cards = 3
+    spread_type = SPREAD_CALLBACKS[query.data]
+    if SPREADS[spread_type]["paid_only"] and not subscriptions.is_paid(user_id):
+        await upgrade_needed(update, context)
+        return TAROT_CARDS
     
-    # Draw random cards
-    deck = get_full_deck()
-    cards = random.sample(deck, num_cards)
+    # Draw cards; the seed is kept so the draw can be reproduced
+    draw = draw_cards(spread_type)
+    cards = card_display_names(draw, t.locale)
+    context.user_data['last_tarot_draw'] = draw
+    logger.info(f"Tarot draw user={user_id} spread={spread_type} seed={draw['seed']}")
     
-    await query.message.reply_text("Вытягиваю карты... ✨")
+    placeholder = await query.message.reply_text(t.TAROT_PENDING)
     
     # Generate reading
-    reading = generate_tarot_reading(question, cards, spread_type)
+    spent = count_tokens()
+    try:
+        reading = await llm_scheduler.submit(
+            subscriptions.tier(user_id), generate_tarot_reading, question, cards, spread_type, t.locale
+        )
+    except Overloaded:
+        reading = fallback_tarot_reading(question, cards, spread_type, t.locale)
     
     # Record usage
-    UserDatabase.record_tarot(user_id)
+    await executors.run_io(UserDatabase.record_tarot, user_id, sum(spent))
     
     # Store in context for diary
     context.user_data['last_tarot_reading'] = reading
+    ConversationContext.start(context.user_data, "tarot", reading, question, t.locale)
     
-    # Buttons
-    keyboard = [
-        [InlineKeyboardButton("📝 Записать в дневник", callback_data="diary_save_tarot")],
-        [InlineKeyboardButton("🔄 Ещё вопрос", callback_data="tarot")],
-        [InlineKeyboardButton("⭐ Энергия дня", callback_data="daily_energy")]
-    ]
-    
-    if UserDatabase.is_paid(user_id):
-        keyboard.insert(1, [InlineKeyboardButton("🌿 Разобрать глубже", callback_data="deepen_tarot")])
-    else:
-        keyboard.insert(1, [InlineKeyboardButton("🌿 Разобрать глубже 🔒", callback_data="upgrade_needed")])
+    reply_markup = t.TAROT_RESULT_KEYBOARDS[ui.paid_key(subscriptions.is_paid(user_id))]
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await finish_placeholder(placeholder, reading, reply_markup=reply_markup)
     
-    await query.message.reply_text(reading, reply_markup=reply_markup)
+    if subscriptions.is_paid(user_id) and await executors.run_io(QuotaEngine.can_use, user_id, "deepen"):
+        key = deeper_key(reading, t.locale)
+        if speculative_deeper.try_begin(key, llm_scheduler.stats()["queue_depth"]):
+            history = ConversationContext.as_messages(ConversationContext.get(context.user_data, "tarot"))
+            context.application.create_task(_speculate_deeper(key, reading, history, t.locale), update=update)
     
     return ConversationHandler.END
 
@@ -281,18 +273,14 @@ async def tarot_own_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    text = """🌿 У меня есть своя колода
-
-Выбери расклад:"""
+    t = ui.for_update(update)
     
-    keyboard = [
-        [InlineKeyboardButton("1 карта — совет", callback_data="own_1card")],
-        [InlineKeyboardButton("2 карты — ситуация", callback_data="own_2cards")],
-        [InlineKeyboardButton("3 карты — прошлое / настоящее / будущее", callback_data="own_3cards")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Check usage limit before asking for the layout, question and cards
+    if not await executors.run_io(QuotaEngine.can_use, update.effective_user.id, "own_deck"):
+        await query.message.reply_text(t.OWN_DECK_LIMIT_TEXT, reply_markup=t.MAIN_MENU)
+        return ConversationHandler.END
     
-    await query.message.reply_text(text, reply_markup=reply_markup)
+    await query.message.reply_text(t.OWN_DECK_TEXT, reply_markup=t.OWN_DECK_LAYOUT_KEYBOARD)
     
     return OWN_DECK_QUESTION
 
@@ -304,19 +292,14 @@ async def own_deck_layout_selected(update: Update, context: ContextTypes.DEFAULT
     
     # Store layout type
     if query.data == "own_1card":
-        context.user_data['own_deck_layout'] = "1_card"
-        num_cards = 1
+        layout = "1_card"
     elif query.data == "own_2cards":
-        context.user_data['own_deck_layout'] = "2_cards"
-        num_cards = 2
+        layout = "2_cards"
     else:
-        context.user_data['own_deck_layout'] = "3_cards"
-        num_cards = 3
+        layout = "3_cards"
+    context.user_data['own_deck_layout'] = layout
     
-    await query.message.reply_text(
-        f"Достань {num_cards} карт{'у' if num_cards == 1 else 'ы' if num_cards < 5 else ''} из своей колоды.\n\n"
-        "Сначала напиши свой вопрос:"
-    )
+    await query.message.reply_text(ui.for_update(update).OWN_DECK_DRAW_TEXTS[layout])
     
     return OWN_DECK_QUESTION
 
@@ -327,11 +310,8 @@ async def own_deck_question_received(update: Update, context: ContextTypes.DEFAU
     context.user_data['own_deck_question'] = question
     
     layout = context.user_data.get('own_deck_layout', '1_card')
-    num_cards = int(layout[0])
     
-    await update.message.reply_text(
-        f"Теперь введи названия {num_cards} карт{'ы' if num_cards == 1 else ' карт'} через запятую:"
-    )
+    await update.message.reply_text(ui.for_update(update).OWN_DECK_CARDS_PROMPTS[layout])
     
     return OWN_DECK_CARDS
 
@@ -342,27 +322,86 @@ async def own_deck_cards_received(update: Update, context: ContextTypes.DEFAULT_
     cards_text = update.message.text
     question = context.user_data.get('own_deck_question', '')
     layout = context.user_data.get('own_deck_layout', '1_card')
+    t = ui.for_update(update)
+    
+    # Checked again: another reading may have used the quota meanwhile
+    if not await executors.run_io(QuotaEngine.can_use, user_id, "own_deck"):
+        await update.message.reply_text(t.OWN_DECK_LIMIT_TEXT, reply_markup=t.MAIN_MENU)
+        return ConversationHandler.END
     
     # Parse cards
     cards = [card.strip() for card in cards_text.split(',')]
     
-    await update.message.reply_text("Интерпретирую карты... ✨")
+    placeholder = await update.message.reply_text(t.OWN_DECK_PENDING)
     
     # Generate reading
-    reading = generate_own_deck_reading(question, cards, layout)
+    spent = count_tokens()
+    reading = await llm_scheduler.submit(
+        subscriptions.tier(user_id), generate_own_deck_reading, question, cards, layout, t.locale
+    )
+    await executors.run_io(UserDatabase.record_usage, user_id, "own_deck", sum(spent))
     
     # Store in context for diary
     context.user_data['last_tarot_reading'] = reading
+    ConversationContext.start(context.user_data, "tarot", reading, question, t.locale)
+    
+    await finish_placeholder(placeholder, reading, reply_markup=t.OWN_DECK_RESULT_KEYBOARD)
+    
+    return ConversationHandler.END
+
+
+async def continue_dialog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start follow-up question about the last reading"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
     
-    # Buttons
-    keyboard = [
-        [InlineKeyboardButton("📝 Записать в дневник", callback_data="diary_save_tarot")],
-        [InlineKeyboardButton("🌿 Продолжить диалог", callback_data="continue_own_deck")],
-        [InlineKeyboardButton("🔄 Новый расклад", callback_data="tarot_own")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    if not subscriptions.is_premium(user_id):
+        await upgrade_premium_needed(update, context)
+        return ConversationHandler.END
+    
+    t = ui.for_update(update)
+    if not ConversationContext.get(context.user_data, "tarot"):
+        await query.message.reply_text(t.NO_DIALOG_TEXT)
+        return ConversationHandler.END
+    
+    await query.message.reply_text(t.FOLLOWUP_PROMPT)
+    
+    return FOLLOW_UP
+
+
+async def followup_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer follow-up question using the compact dialog context"""
+    user_id = update.effective_user.id
+    question = update.message.text
     
-    await update.message.reply_text(reading, reply_markup=reply_markup)
+    t = ui.for_update(update)
+    
+    conversation = ConversationContext.get(context.user_data, "tarot")
+    if not conversation:
+        await update.message.reply_text(t.NO_DIALOG_TEXT, reply_markup=t.MAIN_MENU)
+        return ConversationHandler.END
+    
+    if not await executors.run_io(QuotaEngine.can_use, user_id, "followup"):
+        await update.message.reply_text(t.FOLLOWUP_LIMIT_TEXT, reply_markup=t.MAIN_MENU)
+        return ConversationHandler.END
+    
+    placeholder = await update.message.reply_text(t.FOLLOWUP_PENDING)
+    
+    spent = count_tokens()
+    answer = await llm_scheduler.submit(
+        subscriptions.tier(user_id), generate_followup, ConversationContext.as_messages(conversation), question, t.locale
+    )
+    await executors.run_io(UserDatabase.record_usage, user_id, "followup", sum(spent))
+    
+    ConversationContext.add(context.user_data, "user", question)
+    ConversationContext.add(context.user_data, "assistant", answer)
+    context.user_data['last_tarot_reading'] = answer
+    
+    await finish_placeholder(placeholder, answer, reply_markup=t.OWN_DECK_RESULT_KEYBOARD)
+    # After the answer is out: the summary waits behind real requests
+    await ConversationContext.compact(context.user_data)
     
     return ConversationHandler.END
 
@@ -383,30 +422,11 @@ async def diary_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         send_func = update.message.reply_text
     
-    entry_count = DiaryDatabase.get_entry_count(user_id)
-    
-    text = f"""📝 Дневник
-
-Это твои личные записи:
-— вопросы
-— ответы Таро
-— мысли и ощущения
-
-Всего записей: {entry_count}"""
+    entry_count = await executors.run_io(DiaryDatabase.get_entry_count, user_id)
     
-    keyboard = [
-        [InlineKeyboardButton("➕ Новая запись", callback_data="diary_new")],
-        [InlineKeyboardButton("📖 Мои записи", callback_data="diary_view")]
-    ]
-    
-    if UserDatabase.is_paid(user_id):
-        keyboard.append([InlineKeyboardButton("🏷 Мои темы", callback_data="diary_themes")])
-        keyboard.append([InlineKeyboardButton("📊 Мои паттерны", callback_data="diary_patterns")])
-    else:
-        keyboard.append([InlineKeyboardButton("🏷 Мои темы 🔒", callback_data="upgrade_needed")])
-        keyboard.append([InlineKeyboardButton("📊 Мои паттерны 🔒", callback_data="upgrade_needed")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    t = ui.for_update(update)
+    text = t.DIARY_MENU_TEMPLATE.format(entry_count=entry_count)
+    reply_markup = t.DIARY_MENU_KEYBOARDS[ui.paid_key(subscriptions.is_paid(user_id))]
     
     await send_func(text, reply_markup=reply_markup)
 
@@ -416,9 +436,7 @@ async def diary_new_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
-        "Напиши свои мысли, ощущения или всё, что хочешь сохранить 🤍"
-    )
+    await query.message.reply_text(ui.for_update(update).DIARY_ENTRY_PROMPT)
     
     return DIARY_ENTRY
 
@@ -428,12 +446,10 @@ async def diary_save_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     content = update.message.text
     
-    DiaryDatabase.add_entry(user_id, content, "note")
+    await executors.run_io(DiaryDatabase.add_entry, user_id, content, "note")
     
-    await update.message.reply_text(
-        "Запись сохранена 🤍",
-        reply_markup=get_main_menu()
-    )
+    t = ui.for_update(update)
+    await update.message.reply_text(t.DIARY_SAVED, reply_markup=t.MAIN_MENU)
     
     return ConversationHandler.END
 
@@ -445,12 +461,13 @@ async def diary_save_daily_energy(update: Update, context: ContextTypes.DEFAULT_
     
     user_id = update.effective_user.id
     content = context.user_data.get('last_daily_energy', '')
+    t = ui.for_update(update)
     
     if content:
-        DiaryDatabase.add_entry(user_id, content, "daily_energy")
-        await query.answer("Энергия дня сохранена в дневник 🤍", show_alert=True)
+        await executors.run_io(DiaryDatabase.add_entry, user_id, content, "daily_energy")
+        await query.answer(t.DIARY_SAVED_DAILY, show_alert=True)
     else:
-        await query.answer("Нет данных для сохранения", show_alert=True)
+        await query.answer(t.NOTHING_TO_SAVE, show_alert=True)
 
 
 async def diary_save_tarot(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -460,41 +477,106 @@ async def diary_save_tarot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     content = context.user_data.get('last_tarot_reading', '')
+    t = ui.for_update(update)
     
     if content:
-        DiaryDatabase.add_entry(user_id, content, "tarot")
-        await query.answer("Расклад Таро сохранён в дневник 🤍", show_alert=True)
+        await executors.run_io(DiaryDatabase.add_entry, user_id, content, "tarot")
+        await query.answer(t.DIARY_SAVED_TAROT, show_alert=True)
     else:
-        await query.answer("Нет данных для сохранения", show_alert=True)
+        await query.answer(t.NOTHING_TO_SAVE, show_alert=True)
 
 
 async def diary_view_entries(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """View diary entries"""
+    """View diary entries, one page at a time"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    is_paid = UserDatabase.is_paid(user_id)
+    is_paid = subscriptions.is_paid(user_id)
     
-    # Free users: last 5 entries, Paid users: all entries
-    limit = None if is_paid else 5
-    entries = DiaryDatabase.get_entries(user_id, limit)
+    # "diary_page_<offset>" opens a later page (paid users only)
+    offset = 0
+    if is_paid and query.data.startswith("diary_page_"):
+        offset = int(query.data[len("diary_page_"):])
+    
+    # One extra entry tells whether there is a next page; archives are read only that far
+    entries = await executors.run_io(DiaryDatabase.get_entries, user_id, DIARY_PAGE_SIZE + 1, offset)
+    t = ui.for_update(update)
     
     if not entries:
-        await query.message.reply_text("У тебя пока нет записей в дневнике 🌿")
+        await query.message.reply_text(t.DIARY_EMPTY)
         return
     
-    text = "📖 Твои записи:\n\n"
+    text = t.DIARY_LIST_HEADER
+    keyboard = []
     
-    for entry in entries[:5]:  # Show first 5
+    for i, entry in enumerate(entries[:DIARY_PAGE_SIZE], start=offset + 1):
         date_str = entry['created_at'][:10]
         content_preview = entry['content'][:100] + "..." if len(entry['content']) > 100 else entry['content']
-        text += f"📅 {date_str}\n{content_preview}\n\n"
+        text += f"{i}. 📅 {date_str}\n{content_preview}\n\n"
+        keyboard.append([
+            InlineKeyboardButton(f"✏️ {i}", callback_data=f"diary_edit_{entry['id']}"),
+            InlineKeyboardButton(f"🗑 {i}", callback_data=f"diary_del_{entry['id']}")
+        ])
+    
+    if len(entries) > DIARY_PAGE_SIZE:
+        if is_paid:
+            keyboard.append([InlineKeyboardButton(
+                t.BUTTONS["diary_more"], callback_data=f"diary_page_{offset + DIARY_PAGE_SIZE}"
+            )])
+        else:
+            text += t.DIARY_ARCHIVE_LOCKED
+    
+    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def diary_delete_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Delete diary entry"""
+    query = update.callback_query
     
-    if not is_paid and len(entries) >= 5:
-        text += "\n🔒 Оформи подписку для доступа ко всему архиву"
+    user_id = update.effective_user.id
+    entry_id = query.data[len("diary_del_"):]
+    t = ui.for_update(update)
     
-    await query.message.reply_text(text)
+    if await executors.run_io(DiaryDatabase.delete_entry, user_id, entry_id):
+        await query.answer(t.DIARY_DELETED, show_alert=True)
+    else:
+        await query.answer(t.DIARY_NOT_FOUND_ALERT, show_alert=True)
+
+
+async def diary_edit_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start editing diary entry"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    entry_id = query.data[len("diary_edit_"):]
+    t = ui.for_update(update)
+    
+    if not await executors.run_io(DiaryDatabase.get_entry, user_id, entry_id):
+        await query.message.reply_text(t.DIARY_NOT_FOUND)
+        return ConversationHandler.END
+    
+    context.user_data['diary_edit_id'] = entry_id
+    await query.message.reply_text(t.DIARY_EDIT_PROMPT)
+    
+    return DIARY_EDIT
+
+
+async def diary_update_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Save edited diary entry"""
+    user_id = update.effective_user.id
+    entry_id = context.user_data.pop('diary_edit_id', None)
+    t = ui.for_update(update)
+    
+    if entry_id and await executors.run_io(DiaryDatabase.update_entry, user_id, entry_id, update.message.text):
+        text = t.DIARY_UPDATED
+    else:
+        text = t.DIARY_NOT_FOUND
+    
+    await update.message.reply_text(text, reply_markup=t.MAIN_MENU)
+    
+    return ConversationHandler.END
 
 
 # ============================================
@@ -504,7 +586,7 @@ async def diary_view_entries(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def notifications_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show notifications menu"""
     user_id = update.effective_user.id
-    user = UserDatabase.get_user(user_id)
+    user = await executors.run_io(UserDatabase.get_user, user_id)
     
     # Check if message or callback
     if update.callback_query:
@@ -517,19 +599,10 @@ async def notifications_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     daily_status = "✅" if user['notifications']['daily_energy'] else "⭕"
     diary_status = "✅" if user['notifications']['diary_reminder'] else "⭕"
     
-    text = f"""🔔 Уведомления
-
-{daily_status} Энергия дня — ежедневно
-{diary_status} Напоминание записать мысли"""
-    
-    keyboard = [
-        [InlineKeyboardButton("⭐ Энергия дня", callback_data="toggle_daily_notif")],
-        [InlineKeyboardButton("📝 Напоминание о дневнике", callback_data="toggle_diary_notif")],
-        [InlineKeyboardButton("❌ Отключить все", callback_data="disable_all_notif")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    t = ui.for_update(update)
+    text = t.NOTIFICATIONS_TEMPLATE.format(daily_status=daily_status, diary_status=diary_status)
     
-    await send_func(text, reply_markup=reply_markup)
+    await send_func(text, reply_markup=t.NOTIFICATIONS_KEYBOARD)
 
 
 async def toggle_notification(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -538,22 +611,23 @@ async def toggle_notification(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = update.effective_user.id
-    user = UserDatabase.get_user(user_id)
+    user = await executors.run_io(UserDatabase.get_user, user_id)
+    t = ui.for_update(update)
     
     if query.data == "toggle_daily_notif":
         user['notifications']['daily_energy'] = not user['notifications']['daily_energy']
-        status = "включены" if user['notifications']['daily_energy'] else "выключены"
-        await query.answer(f"Уведомления об энергии дня {status}", show_alert=True)
+        text = t.DAILY_NOTIF_ON if user['notifications']['daily_energy'] else t.DAILY_NOTIF_OFF
+        await query.answer(text, show_alert=True)
     elif query.data == "toggle_diary_notif":
         user['notifications']['diary_reminder'] = not user['notifications']['diary_reminder']
-        status = "включены" if user['notifications']['diary_reminder'] else "выключены"
-        await query.answer(f"Напоминания о дневнике {status}", show_alert=True)
+        text = t.DIARY_NOTIF_ON if user['notifications']['diary_reminder'] else t.DIARY_NOTIF_OFF
+        await query.answer(text, show_alert=True)
     elif query.data == "disable_all_notif":
         user['notifications']['daily_energy'] = False
         user['notifications']['diary_reminder'] = False
-        await query.answer("Все уведомления отключены", show_alert=True)
+        await query.answer(t.ALL_NOTIF_OFF, show_alert=True)
     
-    UserDatabase.update_user(user_id, {"notifications": user['notifications']})
+    await executors.run_io(UserDatabase.update_user, user_id, {"notifications": user['notifications']})
     
     # Refresh menu
     await notifications_menu(update, context)
@@ -566,7 +640,6 @@ async def toggle_notification(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def subscription_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show subscription menu"""
     user_id = update.effective_user.id
-    user = UserDatabase.get_user(user_id)
     
     # Check if message or callback
     if update.callback_query:
@@ -576,57 +649,74 @@ async def subscription_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         send_func = update.message.reply_text
     
-    current_plan = user['subscription']
+    t = ui.for_update(update)
+    current_plan = subscriptions.tier(user_id)
+    plan = current_plan.upper()
+    expires_at = subscriptions.expires_at(user_id)
+    if current_plan != "free" and expires_at:
+        plan = t.PLAN_UNTIL_TEMPLATE.format(plan=plan, date=expires_at.strftime(t.DATE_FORMAT))
     
-    text = f"""✨ Подписка
-
-Текущий план: {current_plan.upper()}
-
-Подписка — это пространство поддержки, а не просто функции 🤍
-
-**BASE** (₽299/мес)
-— больше раскладов Таро
-— доступ к архиву
-— углублённая энергия дня
-
-**PREMIUM** (₽599/мес)
-— всё из Base
-— режим «Своя колода»
-— глубокие интерпретации Таро
-— темы и паттерны в дневнике"""
-    
-    keyboard = [
-        [InlineKeyboardButton("🌿 Оформить BASE", callback_data="subscribe_base")],
-        [InlineKeyboardButton("✨ Оформить PREMIUM", callback_data="subscribe_premium")]
-    ]
-    
-    if current_plan != "free":
-        keyboard.append([InlineKeyboardButton("❌ Отменить подписку", callback_data="cancel_subscription")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = t.SUBSCRIPTION_TEMPLATE.format(plan=plan, quota=await executors.run_io(QuotaEngine.summary, user_id, t.locale))
+    reply_markup = t.SUBSCRIPTION_KEYBOARDS[ui.paid_key(current_plan != "free")]
     
     await send_func(text, reply_markup=reply_markup)
 
 
 async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle subscription"""
+    """Handle subscription: send an invoice, or activate at once in test mode"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    
-    if query.data == "subscribe_base":
-        plan = "base"
-        price = "₽299"
+    plan = "base" if query.data == "subscribe_base" else "premium"
+    title, amount = PLANS[plan]
+    t = ui.for_update(update)
+    
+    if PAYMENT_PROVIDER_TOKEN:
+        await context.bot.send_invoice(
+            chat_id=update.effective_chat.id,
+            title=t.INVOICE_TITLE_TEMPLATE.format(plan=title),
+            description=t.INVOICE_DESCRIPTION_TEMPLATE.format(plan=title, days=SUBSCRIPTION_PERIOD_DAYS),
+            payload=invoice_payload(plan, user_id),
+            provider_token=PAYMENT_PROVIDER_TOKEN,
+            currency=PAYMENT_CURRENCY,
+            prices=[LabeledPrice(t.INVOICE_LABEL_TEMPLATE.format(plan=title, days=SUBSCRIPTION_PERIOD_DAYS), amount)]
+        )
+    elif PAYMENT_TEST_MODE:
+        # Local stand-in for a successful payment
+        expires = await executors.run_io(subscriptions.activate, user_id, plan)
+        await query.message.reply_text(
+            t.TEST_PAYMENT_TEMPLATE.format(plan=title, date=expires.strftime(t.DATE_FORMAT))
+        )
     else:
-        plan = "premium"
-        price = "₽599"
-    
-    # In production, integrate with payment system
-    # For now, just show message
-    await query.message.reply_text(
-        f"Для оформления подписки {plan.upper()} ({price}/мес) свяжитесь с администратором.\n\n"
-        "В реальной версии здесь будет интеграция с платёжной системой."
+        await query.message.reply_text(t.CONTACT_ADMIN_TEMPLATE.format(plan=title, price=amount // 100))
+
+
+async def precheckout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Confirm that an invoice being paid is one of ours"""
+    query = update.pre_checkout_query
+    parsed = parse_invoice_payload(query.invoice_payload)
+    
+    if parsed is None or parsed[1] != query.from_user.id or query.total_amount != PLANS[parsed[0]][1]:
+        await query.answer(ok=False, error_message=ui.for_update(update).INVOICE_EXPIRED)
+        return
+    await query.answer(ok=True)
+
+
+async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Activate the paid plan"""
+    payment = update.message.successful_payment
+    parsed = parse_invoice_payload(payment.invoice_payload)
+    if parsed is None:
+        logger.warning(f"Payment with unknown payload {payment.invoice_payload!r}")
+        return
+    
+    plan, user_id = parsed
+    expires = await executors.run_io(subscriptions.activate, user_id, plan, payment.telegram_payment_charge_id)
+    t = ui.for_update(update)
+    await update.message.reply_text(
+        t.PAYMENT_DONE_TEMPLATE.format(plan=PLANS[plan][0], date=expires.strftime(t.DATE_FORMAT)),
+        reply_markup=t.MAIN_MENU
     )
 
 
@@ -635,13 +725,8 @@ async def upgrade_needed(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
-        "Эта функция доступна по подписке 🌿\n\n"
-        "Оформи подписку, чтобы получить доступ к расширенным возможностям.",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("✨ Посмотреть планы", callback_data="subscription")]
-        ])
-    )
+    t = ui.for_update(update)
+    await query.message.reply_text(t.UPGRADE_TEXT, reply_markup=t.PLANS_KEYBOARD)
 
 
 async def upgrade_premium_needed(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -649,13 +734,8 @@ async def upgrade_premium_needed(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    await query.message.reply_text(
-        "Эта функция доступна только в PREMIUM подписке 🌿\n\n"
-        "Оформи PREMIUM, чтобы использовать свою колоду и получить глубокие интерпретации.",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("✨ Посмотреть планы", callback_data="subscription")]
-        ])
-    )
+    t = ui.for_update(update)
+    await query.message.reply_text(t.UPGRADE_PREMIUM_TEXT, reply_markup=t.PLANS_KEYBOARD)
 
 
 # ============================================
@@ -669,26 +749,116 @@ async def deepen_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     
-    if not UserDatabase.is_paid(user_id):
+    if not subscriptions.is_paid(user_id):
         await upgrade_needed(update, context)
         return
     
-    await query.message.reply_text("Создаю углублённую интерпретацию... ✨")
+    t = ui.for_update(update)
+    if not await executors.run_io(QuotaEngine.can_use, user_id, "deepen"):
+        await query.message.reply_text(t.DEEPEN_LIMIT_TEXT)
+        return
     
     # Get original content
     if query.data == "deepen_daily":
+        source = "daily"
         original = context.user_data.get('last_daily_energy', '')
     else:  # deepen_tarot
+        source = "tarot"
         original = context.user_data.get('last_tarot_reading', '')
     
     if not original:
-        await query.message.reply_text("Нет данных для углубления")
+        await query.message.reply_text(t.NOTHING_TO_DEEPEN)
         return
     
-    # Generate deeper interpretation
-    deeper = generate_deeper_interpretation(original)
+    placeholder = await query.message.reply_text(t.DEEPEN_PENDING)
+    
+    # Daily energy is the same for everyone, so its deepening is generated
+    # without personal history and shared across users via the cache
+    conversation = ConversationContext.get(context.user_data, source)
+    history = None
+    if conversation and source != "daily":
+        history = ConversationContext.as_messages(conversation)
+    
+    key = deeper_key(original, t.locale)
+    # Joining a speculation still running counts as a hit once it lands
+    joined_speculation = speculative_deeper.pending(key)
+    spent = count_tokens()
+    deeper = speculative_deeper.take(key) or await executors.run_io(DeeperInterpretationCache.get, key)
+    if deeper is None:
+        tier = subscriptions.tier(user_id)
+        if joined_speculation:
+            # The user waits for it now: it must not keep the speculative priority
+            llm_scheduler.promote(deeper_flight.task(key), tier)
+        try:
+            deeper = await deeper_flight.run(
+                key, llm_scheduler.submit, tier, _generate_deeper_cached, key, original, history, t.locale
+            )
+        except Overloaded:
+            # Only a shed speculation is sheddable here; generate for real
+            deeper = await llm_scheduler.submit(tier, _generate_deeper_cached, key, original, history, t.locale)
+        if joined_speculation:
+            # The result came from the flight; finish() may not have parked it yet
+            speculative_deeper.claim(key)
+            await executors.run_io(DeeperInterpretationCache.set, key, deeper)
+    else:
+        await executors.run_io(Telemetry.record, "deepen", cached=True, tier=subscriptions.tier(user_id))
+    
+    if conversation:
+        ConversationContext.add(context.user_data, "assistant", deeper)
+    await executors.run_io(UserDatabase.record_usage, user_id, "deepen", sum(spent))
     
-    await query.message.reply_text(deeper)
+    await finish_placeholder(placeholder, deeper)
+    await ConversationContext.compact(context.user_data)
+
+
+def deeper_key(original: str, locale: str) -> str:
+    """Cache key of a deeper interpretation: the source text and the answer language"""
+    return f"{locale}:{content_hash(original)}"
+
+
+def _generate_deeper_cached(key: str, original: str, history: list = None, locale: str = DEFAULT_LOCALE) -> str:
+    """Generate deeper interpretation and store it in the shared cache"""
+    deeper = generate_deeper_interpretation(original, history=history, locale=locale)
+    DeeperInterpretationCache.set(key, deeper)
+    return deeper
+
+
+async def _speculate_deeper(key: str, reading: str, history: list, locale: str):
+    """Pre-generate the deeper interpretation in the background"""
+    deeper = None
+    try:
+        deeper = await deeper_flight.run(
+            key, llm_scheduler.submit, "speculative", generate_deeper_interpretation, reading,
+            history=history, locale=locale
+        )
+    except Overloaded:
+        pass
+    finally:
+        speculative_deeper.finish(key, deeper)
+
+
+# ============================================
+# ADMIN
+# ============================================
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show LLM spend per feature and tier (admins only)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    t = ui.for_update(update)
+    report = await executors.run_io(format_stats, t.locale)
+    report += "\n\n" + t.STATS_SPECULATIVE_TEMPLATE.format(**speculative_deeper.stats())
+    for pool_name, pool in executors.stats().items():
+        report += "\n" + t.STATS_POOL_TEMPLATE.format(
+            pool=pool_name,
+            queue_depth=pool["queue_depth"],
+            completed=pool["completed"],
+            wait_ms=pool["wait_avg"] * 1000,
+            run_ms=pool["run_avg"] * 1000,
+            run_max_ms=pool["run_max"] * 1000
+        )
+    await update.message.reply_text(report)
 
 
 # ============================================
@@ -697,31 +867,19 @@ async def deepen_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages with menu buttons"""
-    text = update.message.text
-    
-    if text == "⭐ Энергия дня":
-        await daily_energy(update, context)
-    elif text == "🃏 Таро":
-        await tarot_menu(update, context)
-    elif text == "📝 Дневник":
-        await diary_menu(update, context)
-    elif text == "🔔 Уведомления":
-        await notifications_menu(update, context)
-    elif text == "✨ Подписка":
-        await subscription_menu(update, context)
+    handler = TEXT_ROUTES.get(update.message.text)
+    
+    if handler:
+        await handler(update, context)
     else:
-        await update.message.reply_text(
-            "Выбери действие из меню 🤍",
-            reply_markup=get_main_menu()
-        )
+        t = ui.for_update(update)
+        await update.message.reply_text(t.CHOOSE_FROM_MENU, reply_markup=t.MAIN_MENU)
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel conversation"""
-    await update.message.reply_text(
-        "Действие отменено 🤍",
-        reply_markup=get_main_menu()
-    )
+    t = ui.for_update(update)
+    await update.message.reply_text(t.CANCELLED, reply_markup=t.MAIN_MENU)
     return ConversationHandler.END
 
 
@@ -729,94 +887,164 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # CALLBACK QUERY ROUTER
 # ============================================
 
+async def notify_daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Confirm daily notification setup"""
+    await update.callback_query.answer(ui.for_update(update).NOTIFY_DAILY_SET, show_alert=True)
+
+
+# Menu button (catalog BUTTONS key) -> handler
+MENU_ROUTES = {
+    "daily_energy": daily_energy,
+    "tarot": tarot_menu,
+    "diary": diary_menu,
+    "notifications": notifications_menu,
+    "subscription": subscription_menu,
+}
+
+# Menu button text in every locale -> handler
+TEXT_ROUTES = {
+    catalog.BUTTONS[button]: handler
+    for catalog in ui.CATALOGS.values()
+    for button, handler in MENU_ROUTES.items()
+}
+
+# Callback data -> handler
+CALLBACK_ROUTES = {
+    "daily_energy": daily_energy,
+    "tarot": tarot_menu,
+    "tarot_own": tarot_own_start,
+    "diary": diary_menu,
+    "how_it_works": how_it_works,
+    "diary_save_daily": diary_save_daily_energy,
+    "diary_save_tarot": diary_save_tarot,
+    "diary_view": diary_view_entries,
+    "notify_daily": notify_daily,
+    "toggle_daily_notif": toggle_notification,
+    "toggle_diary_notif": toggle_notification,
+    "disable_all_notif": toggle_notification,
+    "subscription": subscription_menu,
+    "subscribe_base": subscribe,
+    "subscribe_premium": subscribe,
+    "upgrade_needed": upgrade_needed,
+    "upgrade_premium": upgrade_premium_needed,
+    "deepen_daily": deepen_content,
+    "deepen_tarot": deepen_content,
+}
+
+# Callback data carrying a parameter after the prefix -> handler
+CALLBACK_PREFIX_ROUTES = {
+    "diary_del_": diary_delete_entry,
+    "diary_page_": diary_view_entries,
+}
+
+
+def resolve_callback(data: str):
+    """Find handler for callback data"""
+    handler = CALLBACK_ROUTES.get(data)
+    if handler is None:
+        for prefix, prefix_handler in CALLBACK_PREFIX_ROUTES.items():
+            if data.startswith(prefix):
+                return prefix_handler
+    return handler
+
+
 async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Route callback queries"""
-    query = update.callback_query
+    handler = resolve_callback(update.callback_query.data)
     
-    if query.data == "daily_energy":
-        await daily_energy(update, context)
-    elif query.data == "tarot":
-        await tarot_menu(update, context)
-    elif query.data == "diary":
-        await diary_menu(update, context)
-    elif query.data == "how_it_works":
-        await how_it_works(update, context)
-    elif query.data == "diary_save_daily":
-        await diary_save_daily_energy(update, context)
-    elif query.data == "diary_save_tarot":
-        await diary_save_tarot(update, context)
-    elif query.data == "diary_view":
-        await diary_view_entries(update, context)
-    elif query.data == "notify_daily":
-        await query.answer("Уведомления настроены! 🔔", show_alert=True)
-    elif query.data.startswith("toggle_") or query.data == "disable_all_notif":
-        await toggle_notification(update, context)
-    elif query.data == "subscription":
-        await subscription_menu(update, context)
-    elif query.data.startswith("subscribe_"):
-        await subscribe(update, context)
-    elif query.data == "upgrade_needed":
-        await upgrade_needed(update, context)
-    elif query.data == "upgrade_premium":
-        await upgrade_premium_needed(update, context)
-    elif query.data.startswith("deepen_"):
-        await deepen_content(update, context)
-
+    if handler:
+        await handler(update, context)
 
-# ============================================
-# MAIN FUNCTION
-# ============================================
 
-def main():
-    """Start the bot"""
-    # Get bot token from environment
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        print("Error: TELEGRAM_BOT_TOKEN environment variable not set")
-        print("Please set it with: export TELEGRAM_BOT_TOKEN='your_token_here'")
-        return
-    
-    # Create application
-    application = Application.builder().token(token).build()
+def register_handlers(application: Application):
+    """Register all handlers; shared by polling and webhook entry points"""
+    # Own group: only one handler per group runs, and this one must always run first
+    application.add_handler(TypeHandler(Update, refresh_tier), group=-2)
+    if RECORD_UPDATES:
+        recorder = UpdateRecorder(RECORD_UPDATES, keep_texts=TEXT_ROUTES)
+        application.add_handler(TypeHandler(Update, recorder.record), group=-1)
     
-    # Add handlers
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(PreCheckoutQueryHandler(precheckout))
+    application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment))
     
     # Tarot conversation handler
     tarot_conv = ConversationHandler(
         entry_points=[
             CallbackQueryHandler(tarot_bot_start, pattern="^tarot_bot$"),
-            CallbackQueryHandler(own_deck_layout_selected, pattern="^own_(1|2|3)cards$")
+            CallbackQueryHandler(own_deck_layout_selected, pattern="^own_(1|2|3)cards$"),
+            CallbackQueryHandler(continue_dialog, pattern="^continue_own_deck$")
         ],
         states={
             TAROT_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, tarot_question_received)],
-            TAROT_CARDS: [CallbackQueryHandler(tarot_draw_cards, pattern="^tarot_(1|3)card")],
+            TAROT_CARDS: [CallbackQueryHandler(tarot_draw_cards, pattern="^tarot_(1card|3cards|5cards|celtic)$")],
             OWN_DECK_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, own_deck_question_received)],
-            OWN_DECK_CARDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, own_deck_cards_received)]
+            OWN_DECK_CARDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, own_deck_cards_received)],
+            FOLLOW_UP: [MessageHandler(filters.TEXT & ~filters.COMMAND, followup_received)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        per_message=False,
+        per_chat=True,
+        per_user=True
     )
     application.add_handler(tarot_conv)
     
     # Diary conversation handler
     diary_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(diary_new_entry, pattern="^diary_new$")],
+        entry_points=[
+            CallbackQueryHandler(diary_new_entry, pattern="^diary_new$"),
+            CallbackQueryHandler(diary_edit_entry, pattern="^diary_edit_")
+        ],
         states={
-            DIARY_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, diary_save_entry)]
+            DIARY_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, diary_save_entry)],
+            DIARY_EDIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, diary_update_entry)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        per_message=False,
+        per_chat=True,
+        per_user=True
     )
     application.add_handler(diary_conv)
     
-    # Callback query handler
+    # Callback query handler (must be after ConversationHandlers)
     application.add_handler(CallbackQueryHandler(callback_router))
     
     # Text message handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
+    # Update id in every log line and per-handler timings
+    instrument_handlers(application)
+
+
+# ============================================
+# MAIN FUNCTION
+# ============================================
+
+async def _post_init(application: Application):
+    """Start background jobs once the polling loop is running"""
+    start_retention(application)
+    start_expiry_sweep(application)
+
+
+def main():
+    """Start the bot"""
+    # Get bot token from environment
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        print("Error: TELEGRAM_BOT_TOKEN environment variable not set")
+        print("Please set it with: export TELEGRAM_BOT_TOKEN='your_token_here'")
+        return
+    
+    # Create application with the shared request pool and flood control;
+    # updates run concurrently but stay ordered per user
+    application = build_application(token, PerUserUpdateProcessor(), post_init=_post_init)
+    
+    register_handlers(application)
+    
     # Start bot
     print("Bot started! Press Ctrl+C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=POLLING_ALLOWED_UPDATES, timeout=POLLING_TIMEOUT)
 
 
 if __name__ == "__main__":
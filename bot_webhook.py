@@ -4,27 +4,32 @@
 Webhook version of Moe Prostranstvo bot for web service deployment
 """
 import os
+import time
 import logging
 import asyncio
+import threading
 from flask import Flask, request, jsonify
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, ContextTypes, filters
-from telegram.request import HTTPXRequest
-
-# Import bot handlers from main bot file
-import bot
-
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+
+from utils import health as health_probes
+from utils.logs import setup_logging
+from utils.scheduler import llm_scheduler
+from utils.update_queue import UPDATE_QUEUE_MODE, DurableUpdateQueue
+
+# telegram/openai and the bot module are imported lazily in the
+# initialization thread so the worker can answer /health right away
+
+# Structured logging through a background writer thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Get configuration from environment
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Your web service URL
 PORT = int(os.getenv("PORT", 10000))
+# How long an incoming update may wait for initialization to finish
+READY_TIMEOUT = float(os.getenv("WEBHOOK_READY_TIMEOUT", 30))
+# Time budget for the /ready dependency probes
+READY_PROBE_BUDGET = float(os.getenv("READY_PROBE_BUDGET", 0.5))
 
 if not TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable not set")
@@ -35,103 +40,88 @@ if not WEBHOOK_URL:
 # Initialize Flask app
 app = Flask(__name__)
 
-# Initialize bot application globally
+# Bot application lives on its own event loop thread
 application = None
 webhook_configured = False
 event_loop = None
-
-
-def setup_handlers(app_instance):
-    """Setup all bot handlers"""
-    app_instance.add_handler(CommandHandler("start", bot.start))
+ready_event = threading.Event()
+init_error = None
+process_started = time.monotonic()
+ready_after = None
+pending_updates = 0
+pending_lock = threading.Lock()
+# Ingress-only mode: updates are stored for worker.py processes
+update_queue = DurableUpdateQueue() if UPDATE_QUEUE_MODE else None
+
+
+async def _init_application():
+    """Build application, register webhook if needed and start it"""
+    global application
+    import bot
+    from utils.messaging import build_application
     
-    # Tarot conversation handler
-    tarot_conv = ConversationHandler(
-        entry_points=[
-            CallbackQueryHandler(bot.tarot_bot_start, pattern="^tarot_bot$"),
-            CallbackQueryHandler(bot.own_deck_layout_selected, pattern="^own_(1|2|3)cards$")
-        ],
-        states={
-            bot.TAROT_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.tarot_question_received)],
-            bot.TAROT_CARDS: [CallbackQueryHandler(bot.tarot_draw_cards, pattern="^tarot_(1|3)card")],
-            bot.OWN_DECK_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.own_deck_question_received)],
-            bot.OWN_DECK_CARDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.own_deck_cards_received)]
-        },
-        fallbacks=[CommandHandler("cancel", bot.cancel)],
-        per_message=False,
-        per_chat=True,
-        per_user=True
-    )
-    app_instance.add_handler(tarot_conv)
+    # Shared request pool (long timeouts for free tier cold starts) and flood control
+    app_instance = build_application(TOKEN)
+    bot.register_handlers(app_instance)
+    await app_instance.initialize()
     
-    # Diary conversation handler
-    diary_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(bot.diary_new_entry, pattern="^diary_new$")],
-        states={
-            bot.DIARY_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.diary_save_entry)]
-        },
-        fallbacks=[CommandHandler("cancel", bot.cancel)],
-        per_message=False,
-        per_chat=True,
-        per_user=True
-    )
-    app_instance.add_handler(diary_conv)
+    # Every worker runs this, so only call set_webhook when it changed
+    webhook_url = f"{WEBHOOK_URL}/{TOKEN}"
+    info = await app_instance.bot.get_webhook_info()
+    if info.url != webhook_url:
+        logger.info(f"Setting webhook to: {WEBHOOK_URL}/<token>")
+        await app_instance.bot.set_webhook(url=webhook_url)
+        logger.info("✅ Webhook set successfully!")
+    else:
+        logger.info("Webhook already set, skipping set_webhook")
+    
+    await app_instance.start()
+    # In queue mode the workers own storage upkeep
+    if not UPDATE_QUEUE_MODE:
+        from utils.retention import start_retention
+        from utils.subscriptions import start_expiry_sweep
+        start_retention(app_instance)
+        start_expiry_sweep(app_instance)
+    application = app_instance
+    logger.info("✅ Application started successfully!")
+
+
+def _run_event_loop():
+    """Initialize the bot with retries, then keep its event loop running"""
+    global webhook_configured, init_error, ready_after
+    
+    asyncio.set_event_loop(event_loop)
+    
+    delay = 1
+    while True:
+        try:
+            event_loop.run_until_complete(_init_application())
+            break
+        except Exception as e:
+            init_error = str(e)
+            logger.error(f"❌ Error initializing bot: {e}, retrying in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
     
-    # Callback query handler (must be after ConversationHandlers)
-    app_instance.add_handler(CallbackQueryHandler(bot.callback_router))
+    init_error = None
+    webhook_configured = True
+    ready_after = time.monotonic() - process_started
+    ready_event.set()
+    logger.info(f"Bot ready in {ready_after:.2f}s")
     
-    # Text message handler
-    app_instance.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_text_message))
+    event_loop.run_forever()
 
 
 def init_bot():
-    """Initialize bot application and setup webhook"""
-    global application, webhook_configured, event_loop
+    """Start bot initialization in the background"""
+    global event_loop
     
     logger.info("Initializing bot application...")
-    
-    # Create persistent event loop
     event_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(event_loop)
-    
-    try:
-        # Create custom request with longer timeout for free tier cold starts
-        request = HTTPXRequest(
-            connection_pool_size=8,
-            connect_timeout=60.0,
-            read_timeout=60.0,
-            write_timeout=60.0,
-            pool_timeout=60.0
-        )
-        
-        # Initialize application with custom request
-        application = Application.builder().token(TOKEN).request(request).build()
-        
-        # Setup handlers
-        setup_handlers(application)
-        
-        # Initialize the application
-        event_loop.run_until_complete(application.initialize())
-        event_loop.run_until_complete(application.bot.initialize())
-        
-        # Setup webhook
-        webhook_url = f"{WEBHOOK_URL}/{TOKEN}"
-        logger.info(f"Setting webhook to: {webhook_url}")
-        event_loop.run_until_complete(application.bot.set_webhook(url=webhook_url))
-        logger.info("✅ Webhook set successfully!")
-        
-        # Start the application
-        event_loop.run_until_complete(application.start())
-        logger.info("✅ Application started successfully!")
-        
-        webhook_configured = True
-        
-    except Exception as e:
-        logger.error(f"❌ Error initializing bot: {e}")
-        raise
+    threading.Thread(target=_run_event_loop, name="bot-event-loop", daemon=True).start()
 
 
-# Initialize bot on startup
+# Initialize bot on startup without blocking the worker
 logger.info("=" * 60)
 logger.info("Starting Moe Prostranstvo Bot (Webhook Mode)")
 logger.info("=" * 60)
@@ -140,17 +130,13 @@ init_bot()
 
 @app.route('/')
 def index():
-    """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "bot": "moe_prostranstvo",
-        "webhook_configured": webhook_configured
-    })
+    """Liveness endpoint"""
+    return health()
 
 
 @app.route('/health')
 def health():
-    """Health check endpoint"""
+    """Liveness endpoint, answers even while the bot is starting"""
     return jsonify({
         "status": "healthy",
         "bot": "moe_prostranstvo",
@@ -158,29 +144,80 @@ def health():
     })
 
 
+@app.route('/ready')
+def ready():
+    """Readiness endpoint, 503 until the bot can process updates or while degraded"""
+    if not ready_event.is_set():
+        return jsonify({
+            "status": "starting",
+            "uptime_seconds": round(time.monotonic() - process_started, 3),
+            "error": init_error
+        }), 503
+    
+    # A queue backlog belongs to the workers, not to the ingress.
+    # Scheduler stats are read on the bot loop, which mutates them
+    result = health_probes.collect(
+        event_loop,
+        0 if update_queue else pending_updates + application.update_queue.qsize(),
+        llm_scheduler.stats,
+        READY_PROBE_BUDGET
+    )
+    status_code = 200 if result["ready"] else 503
+    body = {
+        "status": "ready" if result["ready"] else "degraded",
+        "startup_seconds": round(ready_after, 3),
+        "checks": result["checks"]
+    }
+    if update_queue:
+        body["queue_depth"] = update_queue.depth()
+    return jsonify(body), status_code
+
+
 @app.route(f'/{TOKEN}', methods=['POST'])
 def webhook():
     """Handle incoming updates from Telegram"""
-    if not application or not event_loop:
+    # Telegram retries on non-2xx, so early updates are not lost
+    global pending_updates
+    
+    if update_queue:
+        # Durable before acknowledging; Telegram retries are deduplicated by update_id
+        try:
+            update_queue.enqueue(request.get_json(force=True))
+        except Exception as e:
+            logger.error(f"Error enqueuing update: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+        return jsonify({"ok": True})
+    
+    if not ready_event.wait(timeout=READY_TIMEOUT):
         logger.error("Application not initialized")
-        return jsonify({"error": "Bot not initialized"}), 500
+        return jsonify({"error": "Bot not initialized"}), 503
     
+    with pending_lock:
+        pending_updates += 1
+    update_data = None
     try:
+        from telegram import Update
+        
         # Get update from request
         update_data = request.get_json(force=True)
         
         # Create Update object
         update = Update.de_json(update_data, application.bot)
         
-        # Process update using the persistent event loop
-        asyncio.set_event_loop(event_loop)
-        event_loop.run_until_complete(application.process_update(update))
+        # Process update on the bot's event loop
+        future = asyncio.run_coroutine_threadsafe(application.process_update(update), event_loop)
+        future.result()
         
         return jsonify({"ok": True})
     
     except Exception as e:
-        logger.error(f"Error processing update: {e}", exc_info=True)
+        update_id = update_data.get("update_id") if isinstance(update_data, dict) else None
+        logger.error(f"Error processing update: {e}", exc_info=True, extra={"update_id": update_id})
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        with pending_lock:
+            pending_updates -= 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check that UpdateRecorder.sanitize leaves no real user or chat id behind.
+
+Sanitizes sample updates that carry ids in every place the Bot API puts
+them (sender, chat, forwards, contacts, mentions, joins, shared users)
+and fails if any original id survives anywhere in the result or if one
+id maps to different pseudonyms. Exits with status 1 on failure.
+
+Usage:
+    python check_recorder.py
+"""
+import os
+import sys
+
+os.environ.setdefault("OPENAI_API_KEY", "check")
+
+from utils.recorder import UpdateRecorder
+
+USER_ID = 731004261
+OTHER_USER_ID = 482913577
+GROUP_ID = -1001234567890
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Анна", "username": "anna", "language_code": "ru"}
+
+
+SAMPLES = [
+    {
+        "update_id": 1,
+        "message": {
+            "message_id": 10, "date": 1700000000,
+            "from": user(USER_ID),
+            "chat": {"id": USER_ID, "type": "private", "first_name": "Анна"},
+            "forward_origin": {"type": "user", "date": 1700000000, "sender_user": user(OTHER_USER_ID)},
+            "forward_from": user(OTHER_USER_ID),
+            "via_bot": {"id": OTHER_USER_ID, "is_bot": True, "first_name": "Bot"},
+            "text": "Привет, Анна",
+            "entities": [{"type": "text_mention", "offset": 0, "length": 6, "user": user(OTHER_USER_ID)}],
+            "reply_to_message": {
+                "message_id": 9, "date": 1700000000,
+                "from": user(OTHER_USER_ID),
+                "chat": {"id": USER_ID, "type": "private", "first_name": "Анна"},
+                "contact": {"phone_number": "+70000000000", "first_name": "Анна", "user_id": OTHER_USER_ID,
+                            "vcard": "BEGIN:VCARD"},
+            },
+        },
+    },
+    {
+        "update_id": 2,
+        "message": {
+            "message_id": 11, "date": 1700000000,
+            "from": user(USER_ID),
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "Таро"},
+            "sender_chat": {"id": GROUP_ID, "type": "supergroup", "title": "Таро"},
+            "new_chat_members": [user(OTHER_USER_ID)],
+            "left_chat_member": user(OTHER_USER_ID),
+            "users_shared": {"request_id": 1, "user_ids": [OTHER_USER_ID]},
+            "chat_shared": {"request_id": 2, "chat_id": GROUP_ID},
+        },
+    },
+    {
+        "update_id": 3,
+        "chat_join_request": {
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "Таро"},
+            "from": user(OTHER_USER_ID),
+            "user_chat_id": OTHER_USER_ID,
+            "date": 1700000000,
+        },
+    },
+]
+
+
+def leaks(data, path: str = "") -> list:
+    """Paths of original ids left in sanitized data"""
+    found = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            found.extend(leaks(value, f"{path}.{key}"))
+    elif isinstance(data, list):
+        for i, item in enumerate(data):
+            found.extend(leaks(item, f"{path}[{i}]"))
+    elif data in (USER_ID, OTHER_USER_ID, GROUP_ID) and not isinstance(data, bool):
+        found.append(path)
+    elif isinstance(data, str) and any(str(abs(i)) in data for i in (USER_ID, OTHER_USER_ID, GROUP_ID)):
+        found.append(path)
+    return found
+
+
+def main():
+    recorder = UpdateRecorder(os.devnull)
+    failures = []
+    for sample in SAMPLES:
+        clean = recorder.sanitize(sample)
+        failures.extend(f"update {sample['update_id']}: id left at {path}" for path in leaks(clean))
+        if "username" in str(clean) or "+70000000000" in str(clean) or "VCARD" in str(clean):
+            failures.append(f"update {sample['update_id']}: personal field kept")
+
+    first = recorder.sanitize(SAMPLES[0])["message"]
+    if first["from"]["id"] != first["chat"]["id"]:
+        failures.append("one user id got different pseudonyms")
+    if first["forward_from"]["id"] != first["forward_origin"]["sender_user"]["id"]:
+        failures.append("forwarded sender got different pseudonyms")
+
+    if failures:
+        print("Failed checks:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"Sanitized {len(SAMPLES)} sample updates, no ids left")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Statistical checks of the card-draw engine in data/tarot_deck.py.
+
+Draws many spreads and verifies that every position gets every card
+equally often (chi-square), that about half of the cards come out
+reversed, that no card repeats within a draw and that a seed always
+reproduces the same draw. Exits with status 1 if any check fails.
+
+The bulk checks run the draw algorithm (draw_indices) over one seeded
+stream and count into flat lists: a million draws split across the
+spreads take a few seconds and leave over 3000 hits per card and
+position, enough to flag a card that is 15% more or less likely than the
+rest. A smaller sample goes through draw_cards with a fresh seed per
+draw, the way the bot draws.
+
+Usage:
+    python check_tarot_deck.py
+    python check_tarot_deck.py --draws 4000000 --seed 7
+"""
+import argparse
+import math
+import sys
+from random import Random
+
+from data.tarot_deck import FULL_DECK, SPREADS, draw_cards, draw_indices
+
+DECK_SIZE = len(FULL_DECK)
+
+
+def chi2_sf(statistic: float, dof: int) -> float:
+    """Upper tail of the chi-square distribution (Wilson-Hilferty approximation)"""
+    if statistic <= 0:
+        return 1.0
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def uniformity_p_value(counts: list, total: int) -> float:
+    """p-value of the hypothesis that all cards of the deck are equally likely"""
+    expected = total / DECK_SIZE
+    statistic = sum((count - expected) ** 2 / expected for count in counts)
+    return chi2_sf(statistic, DECK_SIZE - 1)
+
+
+def evaluate(label: str, counts: list, reversed_count: int, draws: int, positions: int, alpha: float) -> list:
+    """Chi-square per position and the reversal rate of counted draws"""
+    failures = []
+    p_values = [uniformity_p_value(counts[i * DECK_SIZE:(i + 1) * DECK_SIZE], draws) for i in range(positions)]
+    for position, p_value in enumerate(p_values, start=1):
+        if p_value < alpha:
+            failures.append(f"{label}: position {position} is not uniform (p={p_value:.2g})")
+
+    # Reversals are fair coin flips: normal approximation of the binomial
+    cards = draws * positions
+    z = (reversed_count - cards / 2) / math.sqrt(cards / 4)
+    p_value = math.erfc(abs(z) / math.sqrt(2))
+    if p_value < alpha:
+        failures.append(f"{label}: reversal rate {reversed_count / cards:.4f} (p={p_value:.2g})")
+
+    print(f"{label:<24} {draws:>9} draws, reversed {reversed_count / cards:.4f}, min position p={min(p_values):.3f}")
+    return failures
+
+
+def check_spread(spread_type: str, draws: int, rng: Random, alpha: float) -> list:
+    """Failures found in `draws` draws of one spread from a single stream"""
+    positions = len(SPREADS[spread_type]["positions"])
+    # counts[position * DECK_SIZE + card index]
+    counts = [0] * (positions * DECK_SIZE)
+    offsets = range(0, positions * DECK_SIZE, DECK_SIZE)
+    reversed_count = 0
+
+    for _ in range(draws):
+        indices, reversed_flags = draw_indices(rng, positions)
+        if len(set(indices)) != positions:
+            return [f"{spread_type}: drew {[FULL_DECK[i] for i in indices]} for {positions} positions"]
+        for offset, index in zip(offsets, indices):
+            counts[offset + index] += 1
+        reversed_count += reversed_flags.count(True)
+
+    return evaluate(spread_type, counts, reversed_count, draws, positions, alpha)
+
+
+def check_seeded(spread_type: str, draws: int, rng: Random, alpha: float) -> list:
+    """Same checks through draw_cards, one fresh seed per draw"""
+    positions = len(SPREADS[spread_type]["positions"])
+    index_of = {card: i for i, card in enumerate(FULL_DECK)}
+    counts = [0] * (positions * DECK_SIZE)
+    reversed_count = 0
+
+    for _ in range(draws):
+        draw = draw_cards(spread_type, seed=rng.getrandbits(64))
+        if len(set(draw["cards"])) != positions:
+            return [f"{spread_type}: seed {draw['seed']} drew {draw['cards']}"]
+        for position, card in enumerate(draw["cards"]):
+            counts[position * DECK_SIZE + index_of[card]] += 1
+        reversed_count += sum(draw["reversed"])
+
+    return evaluate(f"{spread_type} (seeded)", counts, reversed_count, draws, positions, alpha)
+
+
+def check_determinism(rng: Random) -> list:
+    """Failures of seed reproducibility and the allow_reversed switch"""
+    failures = []
+    for spread_type in SPREADS:
+        seed = rng.getrandbits(64)
+        first, second = draw_cards(spread_type, seed=seed), draw_cards(spread_type, seed=seed)
+        if first != second:
+            failures.append(f"{spread_type}: seed {seed} gave different draws")
+        upright = draw_cards(spread_type, seed=seed, allow_reversed=False)
+        if any(upright["reversed"]):
+            failures.append(f"{spread_type}: reversed cards with allow_reversed=False")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistical checks of the tarot card draws")
+    parser.add_argument("--draws", type=int, default=1000000, help="draws from one stream, split across spreads")
+    parser.add_argument("--seeded-draws", type=int, default=20000, help="draws per spread through draw_cards")
+    parser.add_argument("--seed", type=int, default=2024, help="seed of the per-draw seeds, for reproducible runs")
+    parser.add_argument("--alpha", type=float, default=0.001, help="significance level of each test")
+    args = parser.parse_args()
+
+    rng = Random(args.seed)
+    failures = check_determinism(rng)
+    for spread_type in SPREADS:
+        failures.extend(check_spread(spread_type, args.draws // len(SPREADS), Random(rng.getrandbits(64)), args.alpha))
+    for spread_type in SPREADS:
+        failures.extend(check_seeded(spread_type, args.seeded_draws, rng, args.alpha))
+
+    if failures:
+        print("\nFailed checks:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll draw checks passed")
+
+
+if __name__ == "__main__":
+    main()
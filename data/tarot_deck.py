@@ -1,4 +1,11 @@
-# Tarot deck with Russian names and meanings
+# Tarot deck. Russian card names are the ids used in draws and logs;
+# display names come from the "cards" section of the locale catalogs.
+
+import functools
+import secrets
+from random import Random
+
+from utils.i18n import DEFAULT_LOCALE, prompts
 
 MAJOR_ARCANA = [
     "Шут", "Маг", "Верховная Жрица", "Императрица", "Император",
@@ -31,6 +38,86 @@ def get_full_deck():
             deck.append(f"{card} {suit}")
     return deck
 
+# Precomputed once; draws pick indices into this tuple
+FULL_DECK = tuple(get_full_deck())
+
+# Spread type -> positions and whether it needs a paid subscription
+SPREADS = {
+    "1_card": {
+        "title": "1 карта — совет",
+        "positions": ["Совет"],
+        "paid_only": False
+    },
+    "3_cards": {
+        "title": "3 карты — прошлое / настоящее / будущее",
+        "positions": ["Прошлое", "Настоящее", "Будущее"],
+        "paid_only": False
+    },
+    "5_cards": {
+        "title": "5 карт — ситуация и путь",
+        "positions": ["Ситуация", "Препятствие", "Скрытое влияние", "Совет", "Возможный итог"],
+        "paid_only": True
+    },
+    "celtic_cross": {
+        "title": "Кельтский крест — 10 карт",
+        "positions": [
+            "Суть ситуации", "Препятствие", "Основа", "Прошлое", "Сознательное",
+            "Ближайшее будущее", "Ты сама", "Окружение", "Надежды и страхи", "Итог"
+        ],
+        "paid_only": True
+    },
+}
+
+
+def draw_indices(rng, num_cards, allow_reversed=True):
+    """Deck indices and reversed flags of one draw from rng; the draw algorithm itself"""
+    indices = rng.sample(range(len(FULL_DECK)), num_cards)
+    if allow_reversed:
+        reversed_flags = [rng.random() < 0.5 for _ in indices]
+    else:
+        reversed_flags = [False] * num_cards
+    return indices, reversed_flags
+
+
+def draw_cards(spread_type, seed=None, allow_reversed=True):
+    """Draw cards for a spread without repetition.
+
+    Each draw uses its own RNG seeded from the OS CSPRNG (or the given
+    seed), so any draw can be reproduced and audited from its seed.
+    Returns dict with card names, reversed flags and the seed.
+    """
+    if seed is None:
+        seed = secrets.randbits(64)
+    indices, reversed_flags = draw_indices(Random(seed), len(SPREADS[spread_type]["positions"]), allow_reversed)
+    
+    return {
+        "spread_type": spread_type,
+        "cards": [FULL_DECK[i] for i in indices],
+        "reversed": reversed_flags,
+        "seed": seed
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def card_names(locale):
+    """Card id -> display name in the locale"""
+    names = prompts(locale)["cards"]
+    display = {card: names["major"][card] for card in MAJOR_ARCANA}
+    for suit, cards in MINOR_ARCANA.items():
+        for card in cards:
+            display[f"{card} {suit}"] = names["minor"].format(rank=names["ranks"][card], suit=names["suits"][suit])
+    return display
+
+
+def card_display_names(draw, locale=DEFAULT_LOCALE):
+    """Card names with reversed marker for prompts and messages, in the locale"""
+    names = card_names(locale)
+    reversed_template = prompts(locale)["cards"]["reversed"]
+    return [
+        reversed_template.format(card=names[card]) if is_reversed else names[card]
+        for card, is_reversed in zip(draw["cards"], draw["reversed"])
+    ]
+
 def normalize_card_name(name):
     """Normalize card name for matching"""
     return name.lower().strip()
@@ -38,7 +125,7 @@ def normalize_card_name(name):
 def find_card(user_input):
     """Find card by partial name match"""
     normalized_input = normalize_card_name(user_input)
-    all_cards = get_full_deck()
+    all_cards = FULL_DECK
     
     # Exact match
     for card in all_cards:
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local OpenAI-compatible stand-in for development and CI.
+
+Serves /v1/chat/completions with canned tarot-formatted answers (streaming
+included), so the bot and performance tests run offline:
+
+    python mock_openai_server.py --port 8765 --latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python bot.py
+
+Latency and error injection can be changed at runtime:
+
+    curl -X POST localhost:8765/_control -d '{"error_rate": 0.2, "error_status": 429}'
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Runtime-tunable behaviour
+settings = {
+    "latency": 0.0,        # seconds before the first byte
+    "jitter": 0.0,         # extra random latency, up to this many seconds
+    "chunk_delay": 0.02,   # seconds between streamed chunks
+    "error_rate": 0.0,     # share of requests answered with an error
+    "error_status": 500,   # HTTP status of injected errors
+}
+settings_lock = threading.Lock()
+stats = {"requests": 0, "errors": 0}
+
+DAILY_ENERGY = """🌙 Астро-фон: день мягкой ясности и спокойных решений.
+
+Ключ дня: тишина, доверие, шаг
+
+🃏 Карта дня: «Звезда»
+Смысл: время восстановить силы и довериться своему пути.
+
+✨ Мягкий совет: оставь себе десять минут тишины без телефона.
+
+Вопрос для дневника: что сегодня помогает мне чувствовать опору?"""
+
+TAROT_READING = """🃏 Ответ Таро
+
+Карта: «Императрица»
+Смысл: забота о себе сейчас важнее спешки. Позволь вещам созреть.
+
+✨ Мягкий совет: сделай сегодня одну вещь только для себя.
+
+Вопрос для дневника: где в моей жизни просит места нежность?"""
+
+DEEPER = """🌿 Углублённая интерпретация
+
+Карты говорят о периоде внутреннего роста. Обрати внимание на то, что даёт тебе силы, и на то, что их забирает.
+
+Вопросы для размышления:
+— Что я хочу сохранить?
+— От чего готова мягко отказаться?
+
+Практика: вечером запиши три момента дня, за которые благодарна."""
+
+SUMMARY = "Пользователь спрашивал о своём пути; выпали карты о росте и заботе о себе, вывод — двигаться мягко и без спешки."
+
+
+def pick_answer(messages):
+    """Choose canned answer from the prompt contents"""
+    text = " ".join(str(m.get("content", "")) for m in messages)
+    if "Перескажи" in text or "Summarize" in text:
+        return SUMMARY
+    if "энергию дня" in text or "энергетические прогнозы" in text or "energy of the day" in text:
+        return DAILY_ENERGY
+    if "Углуби" in text or "глубокую интерпретацию" in text or "Deepen" in text:
+        return DEEPER
+    return TAROT_READING
+
+
+def estimate_tokens(text):
+    return len(text) // 3 + 1
+
+
+def simulate_latency():
+    with settings_lock:
+        delay = settings["latency"] + random.uniform(0, settings["jitter"])
+    if delay > 0:
+        time.sleep(delay)
+
+
+def injected_error():
+    """Return an error response if this request should fail"""
+    with settings_lock:
+        error_rate = settings["error_rate"]
+        status = settings["error_status"]
+    if random.random() >= error_rate:
+        return None
+    stats["errors"] += 1
+    body = {"error": {"message": "Injected error from mock server", "type": "mock_error", "code": status}}
+    response = jsonify(body)
+    response.status_code = status
+    if status == 429:
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    stats["requests"] += 1
+    payload = request.get_json(force=True)
+    messages = payload.get("messages", [])
+    model = payload.get("model", "mock-model")
+    
+    simulate_latency()
+    error = injected_error()
+    if error is not None:
+        return error
+    
+    answer = pick_answer(messages)
+    max_tokens = payload.get("max_tokens")
+    if max_tokens:
+        answer = answer[:max_tokens * 3]
+    
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": estimate_tokens(answer),
+        "total_tokens": prompt_tokens + estimate_tokens(answer)
+    }
+    
+    if payload.get("stream"):
+        return Response(stream_chunks(completion_id, created, model, answer), mimetype="text/event-stream")
+    
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop"
+        }],
+        "usage": usage
+    })
+
+
+def stream_chunks(completion_id, created, model, answer):
+    """Yield the answer as server-sent chat.completion.chunk events"""
+    with settings_lock:
+        chunk_delay = settings["chunk_delay"]
+    
+    def event(delta, finish_reason=None):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    
+    yield event({"role": "assistant", "content": ""})
+    words = answer.split(" ")
+    for i, word in enumerate(words):
+        yield event({"content": word if i == len(words) - 1 else word + " "})
+        if chunk_delay:
+            time.sleep(chunk_delay)
+    yield event({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.route("/v1/models", methods=["GET"])
+def models():
+    return jsonify({"object": "list", "data": [{"id": "gpt-4.1-mini", "object": "model", "owned_by": "mock"}]})
+
+
+@app.route("/_control", methods=["GET", "POST"])
+def control():
+    """Read or update latency/error settings at runtime"""
+    if request.method == "POST":
+        updates = request.get_json(force=True) or {}
+        with settings_lock:
+            for key, value in updates.items():
+                if key in settings:
+                    settings[key] = type(settings[key])(value)
+    with settings_lock:
+        return jsonify({"settings": dict(settings), "stats": dict(stats)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    
+    settings.update({
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "chunk_delay": args.chunk_delay,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+    })
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Replay recorded updates through the real handlers and check for regressions.
+
+Updates recorded with RECORD_UPDATES=<file> (or the sample in replays/) are
+fed through Application.process_update one by one, with Telegram and OpenAI
+replaced by in-process fakes and storage in a temporary directory. For every
+handler it reports CPU time, storage I/O operations and peak allocations per
+call, and exits with status 1 if storage I/O or allocations regress past the
+baseline. CPU time is measured against a fixed calibration loop so that
+machines of different speed can share a baseline; CPU growth is reported as
+a warning unless --strict-cpu is given.
+
+Usage:
+    python replay_updates.py replays/tarot_conversation.jsonl
+    python replay_updates.py replays/tarot_conversation.jsonl --update-baseline
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from collections import defaultdict
+from types import SimpleNamespace
+
+# Storage goes to a throwaway directory; must be set before importing bot
+DATA_DIR = tempfile.mkdtemp(prefix="replay-data-")
+os.environ["BOT_DATA_DIR"] = DATA_DIR
+os.environ.setdefault("OPENAI_API_KEY", "replay")
+os.environ["SPECULATIVE_DEEPEN"] = "0"
+os.environ.pop("RECORD_UPDATES", None)
+warnings.filterwarnings("ignore")
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+from telegram.request import BaseRequest
+
+import bot
+from mock_openai_server import pick_answer
+from utils import ai_generator
+from utils.database import UsageLog
+from utils.telemetry import Telemetry
+
+DEFAULT_BASELINE = os.path.join("replays", "baseline.json")
+# Cards of a Celtic Cross as the calibration workload: JSON round trips like the handlers do
+_CALIBRATION_PAYLOAD = {"cards": [f"card {i}" for i in range(10)], "reversed": [i % 2 == 0 for i in range(10)]}
+
+# Storage operations seen by the audit hook
+io_ops = [0]
+
+
+def _count_io(event, args):
+    if event == "open" and isinstance(args[0], str) and args[0].startswith(DATA_DIR):
+        io_ops[0] += 1
+    elif event == "sqlite3.connect":
+        io_ops[0] += 1
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers every Bot API call locally with a plausible result"""
+
+    def __init__(self):
+        self._message_id = 0
+        self.calls = defaultdict(int)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+        elif endpoint.startswith("send") or endpoint.startswith("edit"):
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 1), "type": "private"},
+                "text": params.get("text", "")
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class FakeCompletions:
+    """Canned chat completions, same answers as mock_openai_server.py"""
+
+    def create(self, model, messages, **kwargs):
+        text = pick_answer(messages)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(prompt_tokens=sum(len(str(m["content"])) // 3 for m in messages),
+                                  completion_tokens=len(text) // 3)
+        )
+
+
+def handler_label(callback, update: Update) -> str:
+    """Name the handler that actually runs behind the routers"""
+    callback = inspect.unwrap(callback)
+    if callback is bot.callback_router and update.callback_query:
+        target = bot.resolve_callback(update.callback_query.data)
+        return target.__name__ if target else "callback_router"
+    if callback is bot.handle_text_message and update.message:
+        target = bot.TEXT_ROUTES.get(update.message.text)
+        return target.__name__ if target else "handle_text_message"
+    return callback.__name__
+
+
+def instrument(application: Application, metrics):
+    """Wrap every handler callback to measure CPU, I/O and allocations"""
+
+    def wrap(handler):
+        callback = handler.callback
+
+        async def measured(update, context):
+            io_before = io_ops[0]
+            tracemalloc.reset_peak()
+            mem_before = tracemalloc.get_traced_memory()[0]
+            cpu_before = time.process_time()
+            try:
+                return await callback(update, context)
+            finally:
+                cpu = time.process_time() - cpu_before
+                peak = tracemalloc.get_traced_memory()[1] - mem_before
+                m = metrics[handler_label(callback, update)]
+                m["calls"] += 1
+                m["cpu"] += cpu
+                m["io"] += io_ops[0] - io_before
+                m["alloc"] = max(m["alloc"], peak)
+
+        handler.callback = measured
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                nested = list(handler.entry_points) + list(handler.fallbacks)
+                for state_handlers in handler.states.values():
+                    nested.extend(state_handlers)
+                for sub in nested:
+                    wrap(sub)
+            else:
+                wrap(handler)
+
+
+def reset_storage():
+    """Start each round from empty storage"""
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    UsageLog._day = None
+    UsageLog._reset()
+    Telemetry._conn = None
+
+
+async def replay_round(payloads):
+    """Replay all updates once on a fresh application"""
+    reset_storage()
+    request = FakeTelegramRequest()
+    application = (
+        Application.builder()
+        .token("123456:replay")
+        .request(request)
+        .get_updates_request(FakeTelegramRequest())
+        .build()
+    )
+    bot.register_handlers(application)
+    metrics = defaultdict(lambda: {"calls": 0, "cpu": 0.0, "io": 0, "alloc": 0})
+    instrument(application, metrics)
+
+    await application.initialize()
+    try:
+        for payload in payloads:
+            await application.process_update(Update.de_json(payload, application.bot))
+    finally:
+        await application.shutdown()
+    return metrics, request.calls
+
+
+def calibrate(runs: int = 7) -> float:
+    """CPU ms of a fixed pure-Python workload, best of several runs"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.process_time()
+        for _ in range(2000):
+            json.loads(json.dumps(_CALIBRATION_PAYLOAD, ensure_ascii=False))
+        best = min(best, time.process_time() - start)
+    return best * 1000
+
+
+def per_call(metrics) -> dict:
+    return {
+        name: {
+            "calls": m["calls"],
+            "cpu_ms": m["cpu"] / m["calls"] * 1000,
+            "io": m["io"] / m["calls"],
+            "alloc_kb": m["alloc"] / 1024,
+        }
+        for name, m in metrics.items() if m["calls"]
+    }
+
+
+def merge_rounds(rounds) -> dict:
+    """Least noisy view: fastest CPU and smallest allocation across rounds"""
+    merged = {}
+    for result in rounds:
+        for name, m in result.items():
+            best = merged.setdefault(name, dict(m))
+            best["cpu_ms"] = min(best["cpu_ms"], m["cpu_ms"])
+            best["alloc_kb"] = min(best["alloc_kb"], m["alloc_kb"])
+    return merged
+
+
+def compare(current: dict, baseline: dict, cpu_scale: float, tolerance: float, min_cpu_ms: float,
+            min_alloc_kb: float):
+    """(regressions, CPU regressions) against the baseline.
+
+    Baseline CPU times are first scaled by cpu_scale, the ratio of this
+    machine's calibration time to the baseline's.
+    """
+    regressions, cpu_regressions = [], []
+    for name, m in sorted(current.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        expected_cpu = base["cpu_ms"] * cpu_scale
+        if m["cpu_ms"] > expected_cpu * (1 + tolerance) and m["cpu_ms"] - expected_cpu > min_cpu_ms:
+            cpu_regressions.append(f"{name}: CPU {expected_cpu:.2f} -> {m['cpu_ms']:.2f} ms/call (calibrated)")
+        if m["io"] > base["io"]:
+            regressions.append(f"{name}: storage I/O {base['io']:.1f} -> {m['io']:.1f} ops/call")
+        if m["alloc_kb"] > base["alloc_kb"] * (1 + tolerance) and m["alloc_kb"] - base["alloc_kb"] > min_alloc_kb:
+            regressions.append(f"{name}: peak alloc {base['alloc_kb']:.0f} -> {m['alloc_kb']:.0f} KB")
+    return regressions, cpu_regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded updates and check handler performance")
+    parser.add_argument("recording", help="JSONL file of updates")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative CPU/alloc growth")
+    parser.add_argument("--min-cpu-ms", type=float, default=0.5, help="ignore CPU changes below this")
+    parser.add_argument("--strict-cpu", action="store_true", help="fail on CPU regressions too, not just warn")
+    parser.add_argument("--min-alloc-kb", type=float, default=16, help="ignore allocation changes below this")
+    args = parser.parse_args()
+
+    with open(args.recording, 'r', encoding='utf-8') as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+
+    ai_generator.set_client(SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions())))
+    sys.addaudithook(_count_io)
+    tracemalloc.start()
+
+    # Calibrated under the same tracing as the handlers, which slows both alike
+    calibration_ms = calibrate()
+    rounds = []
+    try:
+        for _ in range(args.rounds):
+            metrics, api_calls = asyncio.run(replay_round(payloads))
+            rounds.append(per_call(metrics))
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+    current = merge_rounds(rounds)
+
+    print(f"{len(payloads)} updates x {args.rounds} rounds, Bot API calls per round: {sum(api_calls.values())}, "
+          f"CPU calibration {calibration_ms:.1f} ms")
+    print(f"{'handler':<28} {'calls':>6} {'cpu ms':>9} {'io ops':>7} {'peak KB':>8}")
+    for name, m in sorted(current.items(), key=lambda item: -item[1]["cpu_ms"]):
+        print(f"{name:<28} {m['calls']:>6} {m['cpu_ms']:>9.2f} {m['io']:>7.1f} {m['alloc_kb']:>8.0f}")
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"calibration_ms": calibration_ms, "handlers": current}, f, ensure_ascii=False, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions, cpu_regressions = compare(
+        current, baseline["handlers"], calibration_ms / baseline["calibration_ms"],
+        args.tolerance, args.min_cpu_ms, args.min_alloc_kb
+    )
+    if args.strict_cpu:
+        regressions.extend(cpu_regressions)
+    elif cpu_regressions:
+        print("\nCPU above baseline (advisory, see --strict-cpu):")
+        for line in cpu_regressions:
+            print(f"  {line}")
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
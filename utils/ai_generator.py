@@ -1,164 +1,211 @@
+import logging
 import os
 import random
-from openai import OpenAI
+import time
 from datetime import date
 
-client = OpenAI()
-
-def generate_daily_energy():
-    """Generate daily energy with astro background and tarot card"""
-    today = date.today().strftime("%d.%m.%Y")
+from data.tarot_deck import SPREADS
+from utils.i18n import DEFAULT_LOCALE, prompts
+from utils.model_router import model_router
+from utils.telemetry import Telemetry, current_tier
+
+logger = logging.getLogger(__name__)
+
+# Point at any OpenAI-compatible server, e.g. mock_openai_server.py.
+# An empty value means api.openai.com: the SDK would take "" as the URL itself
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+_client = None
+
+
+def get_client():
+    """Create the OpenAI client on first use to keep imports cheap"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(base_url=OPENAI_BASE_URL)
+    return _client
+
+
+def set_client(client):
+    """Inject a client (stand-in server, stub) instead of the default one"""
+    global _client
+    _client = client
+
+
+def _complete(feature: str, messages: list, temperature: float, max_tokens: int, call_type: str = None):
+    """Run one chat completion on the routed model and record its usage and latency"""
+    model = model_router.choose(call_type or feature, current_tier.get())
+    start = time.perf_counter()
+    try:
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    except Exception:
+        latency = time.perf_counter() - start
+        model_router.observe(model, latency, ok=False)
+        Telemetry.record(feature, model, latency=latency, ok=False)
+        raise
     
-    prompt = f"""Ты — мягкий, поддерживающий гид для женщин. Создай энергию дня на {today}.
-
-Структура:
-🌙 Астро-фон: [1 короткое предложение об энергии дня]
+    latency = time.perf_counter() - start
+    model_router.observe(model, latency)
+    Telemetry.record(feature, model, response.usage, latency)
+    logger.debug(f"LLM {call_type or feature} on {model}: {latency:.2f}s")
+    return response.choices[0].message.content.strip()
 
-Ключ дня: [2-3 ключевых слова через запятую]
 
-🃏 Карта дня: «[название карты Таро]»
-Смысл: [1-2 простых предложения]
+def _spread(locale: str, spread_type: str) -> dict:
+    """Spread title and positions in the prompt language"""
+    return prompts(locale).get("spreads", {}).get(spread_type, SPREADS[spread_type])
 
-✨ Мягкий совет: [1 практичное поддерживающее предложение]
 
-Вопрос для дневника: [1 рефлексивный вопрос]
+def _position_lines(locale: str, spread_type: str, cards: list) -> str:
+    line = prompts(locale)["position_line"]
+    positions = _spread(locale, spread_type)["positions"]
+    return "\n".join(
+        line.format(number=i + 1, position=position, card=card) for i, (position, card) in enumerate(zip(positions, cards))
+    )
 
-Тон: тёплый, женственный, без страха и абсолютных предсказаний. Помни: ты помогаешь услышать себя, а не предсказываешь судьбу."""
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
+def generate_daily_energy(locale: str = DEFAULT_LOCALE):
+    """Generate daily energy with astro background and tarot card"""
+    p = prompts(locale)
+    today = date.today().strftime("%d.%m.%Y")
+    
+    return _complete(
+        "daily_energy",
         messages=[
-            {"role": "system", "content": "Ты — мягкий поддерживающий гид, создающий ежедневные энергетические прогнозы с картами Таро."},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": p["daily_energy_system"]},
+            {"role": "user", "content": p["daily_energy"].format(today=today)}
         ],
         temperature=0.8,
         max_tokens=500
     )
-    
-    return response.choices[0].message.content.strip()
 
 
-def generate_tarot_reading(question: str, cards: list, spread_type: str):
+def generate_tarot_reading(question: str, cards: list, spread_type: str, locale: str = DEFAULT_LOCALE):
     """Generate tarot reading based on question and cards drawn"""
+    p = prompts(locale)
     
     if spread_type == "1_card":
-        prompt = f"""Ты — мягкий, поддерживающий гид для женщин. Пользователь задал вопрос: "{question}"
-
-Выпала карта: «{cards[0]}»
-
-Создай ответ в формате:
-
-🃏 Ответ Таро
-
-Карта: «{cards[0]}»
-Смысл: [короткое объяснение карты в контексте вопроса]
-
-✨ Мягкий совет: [1 предложение]
-
-Вопрос для дневника: [1 рефлексивный вопрос]
-
-Тон: тёплый, женственный, без страха и абсолютных предсказаний. Помни: ты помогаешь услышать себя, а не предсказываешь судьбу."""
-
-    else:  # 3_cards
-        prompt = f"""Ты — мягкий, поддерживающий гид для женщин. Пользователь задал вопрос: "{question}"
-
-Выпали карты:
-1️⃣ Прошлое — «{cards[0]}»
-2️⃣ Настоящее — «{cards[1]}»
-3️⃣ Будущее — «{cards[2]}»
-
-Создай ответ в формате:
-
-🃏 Расклад Таро
-
-1️⃣ Прошлое — «{cards[0]}»
-[короткое значение]
-
-2️⃣ Настоящее — «{cards[1]}»
-[короткое значение]
-
-3️⃣ Будущее — «{cards[2]}»
-[короткое значение]
-
-✨ Итог: [1 спокойное поддерживающее предложение]
-
-Вопрос для дневника: [1 рефлексивный вопрос]
-
-Тон: тёплый, женственный, без страха и абсолютных предсказаний. Помни: ты помогаешь услышать себя, а не предсказываешь судьбу."""
-
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
+        prompt = p["tarot_1_card"].format(question=question, card1=cards[0])
+    elif spread_type == "3_cards":
+        prompt = p["tarot_3_cards"].format(question=question, card1=cards[0], card2=cards[1], card3=cards[2])
+    else:  # 5_cards, celtic_cross
+        prompt = p["tarot_spread"].format(
+            question=question,
+            title=_spread(locale, spread_type)["title"],
+            cards_text=_position_lines(locale, spread_type, cards)
+        )
+    
+    return _complete(
+        "tarot",
+        call_type=f"tarot_{spread_type}",
         messages=[
-            {"role": "system", "content": "Ты — мягкий поддерживающий гид, интерпретирующий карты Таро."},
+            {"role": "system", "content": p["tarot_system"]},
             {"role": "user", "content": prompt}
         ],
         temperature=0.8,
-        max_tokens=800
+        max_tokens=800 if len(cards) <= 3 else 1400
     )
-    
-    return response.choices[0].message.content.strip()
 
 
-def generate_own_deck_reading(question: str, cards: list, spread_type: str):
-    """Generate reading for user's own deck"""
-    
-    cards_text = "\n".join([f"{i+1}. «{card}»" for i, card in enumerate(cards)])
+def fallback_tarot_reading(question: str, cards: list, spread_type: str, locale: str = DEFAULT_LOCALE):
+    """Templated reading used when generation is shed under load"""
+    p = prompts(locale)
     
     if spread_type == "1_card":
-        layout_desc = "1 карта — совет"
-    elif spread_type == "2_cards":
-        layout_desc = "2 карты — ситуация"
+        cards_text = p["fallback_card"].format(card=cards[0])
     else:
-        layout_desc = "3 карты — прошлое / настоящее / будущее"
+        cards_text = _position_lines(locale, spread_type, cards)
     
-    prompt = f"""Ты — мягкий, поддерживающий гид для женщин. Пользователь вытянул карты из своей колоды.
+    return p["fallback"].format(cards_text=cards_text, question=question)
 
-Вопрос: "{question}"
-Расклад: {layout_desc}
 
-Карты:
-{cards_text}
-
-Объясни каждую карту кратко и мягко. Закончи вопросом для дневника.
-
-Тон: тёплый, женственный, без страха и абсолютных предсказаний. Помни: ты помогаешь услышать себя, а не предсказываешь судьбу."""
-
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
+def generate_own_deck_reading(question: str, cards: list, spread_type: str, locale: str = DEFAULT_LOCALE):
+    """Generate reading for user's own deck"""
+    p = prompts(locale)
+    cards_text = "\n".join(p["own_card_line"].format(number=i + 1, card=card) for i, card in enumerate(cards))
+    layouts = p["own_deck_layouts"]
+    
+    prompt = p["own_deck"].format(
+        question=question,
+        layout=layouts.get(spread_type, layouts["3_cards"]),
+        cards_text=cards_text
+    )
+    
+    return _complete(
+        "own_deck",
         messages=[
-            {"role": "system", "content": "Ты — мягкий поддерживающий гид, интерпретирующий карты Таро."},
+            {"role": "system", "content": p["tarot_system"]},
             {"role": "user", "content": prompt}
         ],
         temperature=0.8,
         max_tokens=800
     )
-    
-    return response.choices[0].message.content.strip()
 
 
-def generate_deeper_interpretation(original_reading: str, user_question: str = ""):
-    """Generate deeper interpretation for paid users"""
+def generate_deeper_interpretation(original_reading: str, user_question: str = "", history: list = None,
+                                   locale: str = DEFAULT_LOCALE):
+    """Generate deeper interpretation for paid users
     
-    prompt = f"""Ты — мягкий, поддерживающий гид для женщин. Пользователь хочет углубить понимание расклада.
-
-Исходный расклад:
-{original_reading}
-
-Создай более глубокую интерпретацию:
-- Добавь нюансы и детали
-- Предложи дополнительные вопросы для размышления
-- Дай практические рекомендации
+    When the dialog history already contains the reading, it is sent as
+    context instead of pasting the reading into the prompt again.
+    """
+    p = prompts(locale)
+    
+    if history:
+        return _complete(
+            "deepen",
+            messages=[
+                {"role": "system", "content": p["deepen_system"]},
+                *history,
+                {"role": "user", "content": p["deepen_with_history"]}
+            ],
+            temperature=0.8,
+            max_tokens=1000
+        )
+    
+    return _complete(
+        "deepen",
+        messages=[
+            {"role": "system", "content": p["deepen_system"]},
+            {"role": "user", "content": p["deepen"].format(original=original_reading)}
+        ],
+        temperature=0.8,
+        max_tokens=1000
+    )
 
-Тон: тёплый, женственный, без страха и абсолютных предсказаний."""
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
+def generate_followup(history: list, question: str, locale: str = DEFAULT_LOCALE):
+    """Answer a follow-up question within an ongoing reading dialog"""
+    p = prompts(locale)
+    
+    return _complete(
+        "followup",
         messages=[
-            {"role": "system", "content": "Ты — мягкий поддерживающий гид, создающий глубокие интерпретации Таро."},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": p["followup_system"]},
+            *history,
+            {"role": "user", "content": p["followup"].format(question=question)}
         ],
         temperature=0.8,
-        max_tokens=1000
+        max_tokens=600
     )
+
+
+def summarize_dialog(dialog: str, locale: str = DEFAULT_LOCALE):
+    """Compress older dialog turns into a short summary"""
+    p = prompts(locale)
     
-    return response.choices[0].message.content.strip()
+    return _complete(
+        "summary",
+        messages=[
+            {"role": "system", "content": p["summary_system"]},
+            {"role": "user", "content": p["summary"].format(dialog=dialog)}
+        ],
+        temperature=0.3,
+        max_tokens=200
+    )
@@ -0,0 +1,127 @@
+import logging
+import os
+from typing import Dict, List
+
+from utils.ai_generator import summarize_dialog
+from utils.i18n import DEFAULT_LOCALE, prompts
+from utils.scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Token budget for history sent with follow-up requests
+MAX_CONTEXT_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1200))
+# Hard cap on turns kept verbatim
+MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", 8))
+# Scheduler tier of history summaries: they yield to every real request
+SUMMARY_TIER = "speculative"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (Cyrillic text averages ~3 characters per token)"""
+    return len(text) // 3 + 1
+
+
+class ConversationContext:
+    """Bounded per-user dialog history kept in context.user_data.
+
+    Recent turns are kept verbatim; when the history exceeds the token
+    budget the oldest turns are folded into a short running summary, so a
+    follow-up sends a compact context instead of the whole reading again.
+    All changes to user_data happen on the event loop; only the summary
+    itself is generated in the LLM scheduler.
+    """
+    
+    KEY = "conversation"
+    
+    @staticmethod
+    def start(user_data: Dict, source: str, reading: str, question: str = "", locale: str = DEFAULT_LOCALE):
+        """Start new dialog around a reading"""
+        messages = []
+        if question:
+            messages.append({"role": "user", "content": question})
+        messages.append({"role": "assistant", "content": reading})
+        
+        user_data[ConversationContext.KEY] = {
+            "source": source,
+            "locale": locale,
+            "summary": "",
+            "messages": messages
+        }
+    
+    @staticmethod
+    def get(user_data: Dict, source: str = None):
+        """Get dialog state, optionally only if it was started by source"""
+        conversation = user_data.get(ConversationContext.KEY)
+        if conversation and (source is None or conversation["source"] == source):
+            return conversation
+        return None
+    
+    @staticmethod
+    def add(user_data: Dict, role: str, content: str):
+        """Append a turn; call compact() afterwards to keep the history within budget"""
+        conversation = user_data.get(ConversationContext.KEY)
+        if conversation is None:
+            return
+        conversation["messages"].append({"role": role, "content": content})
+    
+    @staticmethod
+    def as_messages(conversation: Dict) -> List[Dict]:
+        """Build chat messages: running summary first, then recent turns"""
+        messages = []
+        if conversation["summary"]:
+            template = prompts(conversation.get("locale", DEFAULT_LOCALE))["summary_context"]
+            messages.append({
+                "role": "system",
+                "content": template.format(summary=conversation["summary"])
+            })
+        messages.extend(conversation["messages"])
+        return messages
+    
+    @staticmethod
+    def token_count(conversation: Dict) -> int:
+        """Estimated tokens of the context sent to the model"""
+        return estimate_tokens(conversation["summary"]) + sum(
+            estimate_tokens(m["content"]) for m in conversation["messages"]
+        )
+    
+    @staticmethod
+    async def compact(user_data: Dict):
+        """Fold oldest turns into the summary until within budget.
+
+        If the summary cannot be made (shed under load or failed), the
+        turns go back and the next compaction tries again.
+        """
+        conversation = user_data.get(ConversationContext.KEY)
+        if conversation is None:
+            return
+        messages = conversation["messages"]
+        evicted = []
+        while len(messages) > 1 and (
+            len(messages) > MAX_MESSAGES
+            or ConversationContext.token_count(conversation) > MAX_CONTEXT_TOKENS
+        ):
+            evicted.append(messages.pop(0))
+        
+        if not evicted:
+            return
+        
+        locale = conversation.get("locale", DEFAULT_LOCALE)
+        p = prompts(locale)
+        dialog = "\n\n".join(
+            f"{p['dialog_user'] if m['role'] == 'user' else p['dialog_guide']}: {m['content']}" for m in evicted
+        )
+        if conversation["summary"]:
+            dialog = f"{conversation['summary']}\n\n{dialog}"
+        try:
+            summary = await llm_scheduler.submit(SUMMARY_TIER, summarize_dialog, dialog, locale)
+        except Exception as e:
+            logger.warning(f"Dialog summary skipped: {e!r}")
+            messages[:0] = evicted
+            return
+        conversation["summary"] = summary
+        
+        # A single oversized turn is truncated rather than dropped
+        if ConversationContext.token_count(conversation) > MAX_CONTEXT_TOKENS:
+            last = messages[-1]
+            budget_chars = max(MAX_CONTEXT_TOKENS - estimate_tokens(conversation["summary"]), 100) * 3
+            last["content"] = last["content"][-budget_chars:]
@@ -1,11 +1,17 @@
+import bisect
+import fcntl
+import gzip
 import json
 import os
-from datetime import datetime, date
+import secrets
+import threading
+import time
+from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
 
 # Use relative path for cloud deployment
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.getenv("BOT_DATA_DIR", os.path.join(BASE_DIR, "data"))
 
 # Create data directory if it doesn't exist
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -13,6 +19,99 @@ os.makedirs(DATA_DIR, exist_ok=True)
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 DIARY_FILE = os.path.join(DATA_DIR, "diary.json")
 DAILY_ENERGY_FILE = os.path.join(DATA_DIR, "daily_energy.json")
+DEEPER_CACHE_FILE = os.path.join(DATA_DIR, "deeper_cache.json")
+USAGE_LOG_FILE = os.path.join(DATA_DIR, "usage_events.jsonl")
+USAGE_ARCHIVE_DIR = os.path.join(DATA_DIR, "usage")
+DIARY_ARCHIVE_DIR = os.path.join(DATA_DIR, "diary_archive")
+
+# Retention: diary entries older than this many days, or beyond the newest
+# DIARY_HOT_MAX_ENTRIES of a user, move to compressed archive segments
+DIARY_HOT_DAYS = int(os.getenv("DIARY_HOT_DAYS", 90))
+DIARY_HOT_MAX_ENTRIES = int(os.getenv("DIARY_HOT_MAX_ENTRIES", 100))
+# Diary storage: "json" (diary.json + archive) or "segments" (per-user logs)
+DIARY_BACKEND = os.getenv("DIARY_BACKEND", "json")
+# Days of daily energy kept in daily_energy.json
+DAILY_ENERGY_RETENTION_DAYS = int(os.getenv("DAILY_ENERGY_RETENTION_DAYS", 7))
+
+# Crockford base32 alphabet used for time-ordered entry IDs
+_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_last_id_ms = 0
+_last_id_rand = 0
+
+
+def generate_entry_id() -> str:
+    """Generate a ULID-style ID: 48-bit ms timestamp + 80 random bits.
+
+    IDs sort by creation time and stay monotonic within one millisecond,
+    so no existing entries have to be read to pick the next one.
+    """
+    global _last_id_ms, _last_id_rand
+    now_ms = int(time.time() * 1000)
+    if now_ms <= _last_id_ms:
+        now_ms = _last_id_ms
+        rand = _last_id_rand + 1
+    else:
+        rand = secrets.randbits(80)
+    _last_id_ms, _last_id_rand = now_ms, rand
+
+    value = (now_ms << 80) | (rand & ((1 << 80) - 1))
+    chars = []
+    for _ in range(26):
+        chars.append(_ID_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class _FileLock:
+    """Reentrant lock on one file, shared by threads and processes.
+
+    Threads of this process queue on an RLock; the outermost holder also
+    takes an flock on <file>.lock, so other workers wait as well.
+    """
+    
+    def __init__(self, filepath: str):
+        self.path = filepath + ".lock"
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+    
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                # The locked file may live in a directory its first writer has not created yet
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the descriptor releases the flock
+            fd, self._fd = self._fd, None
+            os.close(fd)
+        self._lock.release()
+
+
+_file_locks: Dict[str, _FileLock] = {}
+_file_locks_guard = threading.Lock()
+
+
+def file_lock(filepath) -> _FileLock:
+    """Lock serializing read-modify-write of one JSON file across threads and processes"""
+    with _file_locks_guard:
+        return _file_locks.setdefault(filepath, _FileLock(filepath))
+
 
 def load_json(filepath):
     """Load JSON file or return empty dict"""
@@ -22,9 +121,176 @@ def load_json(filepath):
     return {}
 
 def save_json(filepath, data):
-    """Save data to JSON file"""
-    with open(filepath, 'w', encoding='utf-8') as f:
+    """Save data to JSON file; readers never see a half-written file"""
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, filepath)
+
+class UsageLog:
+    """Append-only log of usage events with an in-memory recent window.
+
+    Every worker appends one JSON line per event, so increments never race.
+    Each worker tails the shared log to keep per-user event timestamps for
+    the last WINDOW seconds; older days are folded into users.json by
+    compact().
+    """
+    
+    # Longest quota window that can be answered from memory
+    WINDOW = 24 * 60 * 60
+    
+    # Counter field in users.json for each action
+    COUNTER_FIELDS = {
+        "daily_energy": ("daily_energy_count", "last_daily_energy"),
+        "tarot": ("tarot_count", "last_tarot"),
+    }
+    
+    _day = None
+    _inode = None
+    _offset = 0
+    _events: Dict[tuple, List[float]] = {}
+    # Quota checks run in the I/O threads; the tail state is shared
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def append(user_id: int, action: str, tokens: int = 0):
+        """Record a usage event"""
+        event = {
+            "user_id": user_id,
+            "action": action,
+            "ts": datetime.now().isoformat(),
+            "tokens": tokens
+        }
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        # Shared with other appenders, exclusive with compact()
+        with open(USAGE_LOG_FILE + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            with open(USAGE_LOG_FILE, 'a', encoding='utf-8') as f:
+                f.write(line)
+    
+    @classmethod
+    def count_recent(cls, user_id: int, action: str, window: int) -> int:
+        """Number of events of this action by the user in the last window seconds"""
+        with cls._lock:
+            cls._refresh()
+            timestamps = cls._events.get((str(user_id), action))
+            if not timestamps:
+                return 0
+            
+            now = time.time()
+            expired = bisect.bisect_left(timestamps, now - cls.WINDOW)
+            if expired:
+                del timestamps[:expired]
+            return len(timestamps) - bisect.bisect_left(timestamps, now - window)
+    
+    @classmethod
+    def freed_at(cls, user_id: int, action: str, window: int, limit: int) -> Optional[float]:
+        """Time the user gets back under `limit` events in the window, None if already under"""
+        with cls._lock:
+            cls._refresh()
+            timestamps = cls._events.get((str(user_id), action)) or []
+            recent = timestamps[bisect.bisect_left(timestamps, time.time() - window):]
+            if len(recent) < limit:
+                return None
+            # The window has to slide past every event above limit - 1
+            return recent[len(recent) - limit] + window
+    
+    @classmethod
+    def _refresh(cls):
+        """Read events appended since the last refresh"""
+        today = date.today().isoformat()
+        if cls._day != today:
+            cls._day = today
+            cls._reset()
+            cls.compact()
+        
+        try:
+            stat = os.stat(USAGE_LOG_FILE)
+        except FileNotFoundError:
+            cls._reset()
+            return
+        
+        # Log was replaced by compaction or truncated: start over
+        if stat.st_ino != cls._inode or stat.st_size < cls._offset:
+            cls._reset()
+            cls._inode = stat.st_ino
+        
+        if stat.st_size == cls._offset:
+            return
+        
+        with open(USAGE_LOG_FILE, 'rb') as f:
+            f.seek(cls._offset)
+            chunk = f.read()
+        
+        # Only consume complete lines; a partial write is picked up next time
+        end = chunk.rfind(b"\n") + 1
+        cls._offset += end
+        horizon = time.time() - cls.WINDOW
+        for raw in chunk[:end].splitlines():
+            if not raw.strip():
+                continue
+            event = json.loads(raw)
+            ts = datetime.fromisoformat(event["ts"]).timestamp()
+            if ts >= horizon:
+                key = (str(event["user_id"]), event["action"])
+                bisect.insort(cls._events.setdefault(key, []), ts)
+    
+    @classmethod
+    def _reset(cls):
+        cls._inode = None
+        cls._offset = 0
+        cls._events = {}
+    
+    @staticmethod
+    def compact():
+        """Fold events older than yesterday into user counters and archive them"""
+        if not os.path.exists(USAGE_LOG_FILE):
+            return
+        
+        # Yesterday stays in the live log so day-long windows survive midnight
+        keep_from = (date.today() - timedelta(days=1)).isoformat()
+        # Appenders wait while the log is rewritten, so no event lands in a replaced file
+        with file_lock(USAGE_LOG_FILE):
+            with open(USAGE_LOG_FILE, 'r', encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+            
+            archive = {}
+            keep = []
+            for line in lines:
+                day = json.loads(line)["ts"][:10]
+                if day >= keep_from:
+                    keep.append(line)
+                else:
+                    archive.setdefault(day, []).append(line)
+            if not archive:
+                return
+            
+            with file_lock(USERS_FILE):
+                users = load_json(USERS_FILE)
+                for day, day_lines in sorted(archive.items()):
+                    for line in day_lines:
+                        event = json.loads(line)
+                        user = users.get(str(event["user_id"]))
+                        fields = UsageLog.COUNTER_FIELDS.get(event["action"])
+                        if user is None or fields is None:
+                            continue
+                        count_field, last_field = fields
+                        user[count_field] = user.get(count_field, 0) + 1
+                        if (user.get(last_field) or "") < day:
+                            user[last_field] = day
+                save_json(USERS_FILE, users)
+            
+            os.makedirs(USAGE_ARCHIVE_DIR, exist_ok=True)
+            for day, day_lines in archive.items():
+                with open(os.path.join(USAGE_ARCHIVE_DIR, f"{day}.jsonl"), 'a', encoding='utf-8') as f:
+                    f.writelines(day_lines)
+            
+            # A new inode tells tailing workers to re-read the log
+            tmp_path = USAGE_LOG_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(keep)
+            os.replace(tmp_path, USAGE_LOG_FILE)
+
 
 class UserDatabase:
     """Manage user data and subscription status"""
@@ -34,8 +300,15 @@ class UserDatabase:
         """Get user data"""
         users = load_json(USERS_FILE)
         user_id_str = str(user_id)
+        if user_id_str in users:
+            return users[user_id_str]
         
-        if user_id_str not in users:
+        with file_lock(USERS_FILE):
+            # Re-read under the lock: another worker may have written since
+            users = load_json(USERS_FILE)
+            if user_id_str in users:
+                return users[user_id_str]
+            
             users[user_id_str] = {
                 "user_id": user_id,
                 "subscription": "free",  # free, base, premium
@@ -50,58 +323,37 @@ class UserDatabase:
                 "created_at": datetime.now().isoformat()
             }
             save_json(USERS_FILE, users)
-        
-        return users[user_id_str]
+            return users[user_id_str]
     
     @staticmethod
     def update_user(user_id: int, updates: Dict):
         """Update user data"""
-        users = load_json(USERS_FILE)
         user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            users[user_id_str].update(updates)
-            save_json(USERS_FILE, users)
+        with file_lock(USERS_FILE):
+            users = load_json(USERS_FILE)
+            if user_id_str in users:
+                users[user_id_str].update(updates)
+                save_json(USERS_FILE, users)
     
     @staticmethod
-    def can_use_daily_energy(user_id: int) -> bool:
-        """Check if user can request daily energy"""
-        user = UserDatabase.get_user(user_id)
-        today = date.today().isoformat()
-        
-        if user["subscription"] != "free":
-            return True
-        
-        return user["last_daily_energy"] != today
+    def record_usage(user_id: int, feature: str, tokens: int = 0):
+        """Record usage of a metered feature"""
+        UsageLog.append(user_id, feature, tokens)
     
     @staticmethod
-    def can_use_tarot(user_id: int) -> bool:
-        """Check if user can request tarot reading"""
-        user = UserDatabase.get_user(user_id)
-        today = date.today().isoformat()
-        
-        if user["subscription"] != "free":
-            return True
-        
-        return user["last_tarot"] != today
-    
-    @staticmethod
-    def record_daily_energy(user_id: int):
+    def record_daily_energy(user_id: int, tokens: int = 0):
         """Record daily energy usage"""
-        today = date.today().isoformat()
-        UserDatabase.update_user(user_id, {
-            "last_daily_energy": today,
-            "daily_energy_count": UserDatabase.get_user(user_id)["daily_energy_count"] + 1
-        })
+        UserDatabase.record_usage(user_id, "daily_energy", tokens)
     
     @staticmethod
-    def record_tarot(user_id: int):
+    def record_tarot(user_id: int, tokens: int = 0):
         """Record tarot reading usage"""
-        today = date.today().isoformat()
-        UserDatabase.update_user(user_id, {
-            "last_tarot": today,
-            "tarot_count": UserDatabase.get_user(user_id)["tarot_count"] + 1
-        })
+        UserDatabase.record_usage(user_id, "tarot", tokens)
+    
+    @staticmethod
+    def get_tier(user_id: int) -> str:
+        """Get user's subscription tier"""
+        return UserDatabase.get_user(user_id)["subscription"]
     
     @staticmethod
     def is_premium(user_id: int) -> bool:
@@ -116,64 +368,297 @@ class UserDatabase:
         return user["subscription"] in ["base", "premium"]
 
 
+class DiaryArchive:
+    """Old diary entries in gzip-compressed per-user monthly segments.
+
+    Segments live in diary_archive/<user_id>/<YYYY-MM>.jsonl.gz with an
+    index.json of entry counts per segment, so counting never opens a
+    segment and reads only decompress the months they need.
+    """
+    
+    @staticmethod
+    def _user_dir(user_id_str: str) -> str:
+        return os.path.join(DIARY_ARCHIVE_DIR, user_id_str)
+    
+    @staticmethod
+    def _segment_path(user_id_str: str, segment: str) -> str:
+        return os.path.join(DIARY_ARCHIVE_DIR, user_id_str, f"{segment}.jsonl.gz")
+    
+    @staticmethod
+    def _index(user_id_str: str) -> Dict[str, int]:
+        return load_json(os.path.join(DiaryArchive._user_dir(user_id_str), "index.json"))
+    
+    @staticmethod
+    def _save_index(user_id_str: str, index: Dict[str, int]):
+        save_json(os.path.join(DiaryArchive._user_dir(user_id_str), "index.json"), index)
+    
+    @staticmethod
+    def segments(user_id_str: str) -> List[str]:
+        """Segment names, newest first"""
+        return sorted(DiaryArchive._index(user_id_str), reverse=True)
+    
+    @staticmethod
+    def count(user_id_str: str) -> int:
+        return sum(DiaryArchive._index(user_id_str).values())
+    
+    @staticmethod
+    def load_segment(user_id_str: str, segment: str) -> List[Dict]:
+        path = DiaryArchive._segment_path(user_id_str, segment)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    
+    @staticmethod
+    def append(user_id_str: str, entries: List[Dict]):
+        """Add entries to their monthly segments"""
+        os.makedirs(DiaryArchive._user_dir(user_id_str), exist_ok=True)
+        index = DiaryArchive._index(user_id_str)
+        by_segment: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            by_segment.setdefault(entry["created_at"][:7], []).append(entry)
+        
+        for segment, segment_entries in by_segment.items():
+            # Each append adds a gzip member; readers see one continuous stream
+            with gzip.open(DiaryArchive._segment_path(user_id_str, segment), 'at', encoding='utf-8') as f:
+                for entry in segment_entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            index[segment] = index.get(segment, 0) + len(segment_entries)
+        DiaryArchive._save_index(user_id_str, index)
+    
+    @staticmethod
+    def rewrite_segment(user_id_str: str, segment: str, entries: List[Dict]):
+        """Replace a segment after an archived entry was edited or deleted"""
+        path = DiaryArchive._segment_path(user_id_str, segment)
+        index = DiaryArchive._index(user_id_str)
+        if entries:
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, path)
+            index[segment] = len(entries)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            index.pop(segment, None)
+        DiaryArchive._save_index(user_id_str, index)
+    
+    @staticmethod
+    def find(user_id_str: str, entry_id):
+        """(segment, segment entries, position) of an archived entry, or None"""
+        for segment in DiaryArchive.segments(user_id_str):
+            entries = DiaryArchive.load_segment(user_id_str, segment)
+            for i, entry in enumerate(entries):
+                if str(entry["id"]) == str(entry_id):
+                    return segment, entries, i
+        return None
+
+
 class DiaryDatabase:
-    """Manage diary entries"""
+    """Manage diary entries.
+    
+    diary.json holds only recent entries; compact() moves the rest into
+    DiaryArchive, which reads fall back to on demand.
+    """
     
     @staticmethod
     def add_entry(user_id: int, content: str, entry_type: str = "note"):
         """Add diary entry"""
-        diary = load_json(DIARY_FILE)
-        user_id_str = str(user_id)
-        
-        if user_id_str not in diary:
-            diary[user_id_str] = []
-        
-        entry = {
-            "id": len(diary[user_id_str]) + 1,
-            "content": content,
-            "type": entry_type,  # note, tarot, daily_energy
-            "created_at": datetime.now().isoformat()
-        }
-        
-        diary[user_id_str].append(entry)
-        save_json(DIARY_FILE, diary)
-        return entry
+        with file_lock(DIARY_FILE):
+            diary = load_json(DIARY_FILE)
+            user_id_str = str(user_id)
+            
+            if user_id_str not in diary:
+                diary[user_id_str] = []
+            
+            entry = {
+                "id": generate_entry_id(),
+                "content": content,
+                "type": entry_type,  # note, tarot, daily_energy
+                "created_at": datetime.now().isoformat()
+            }
+            
+            diary[user_id_str].append(entry)
+            save_json(DIARY_FILE, diary)
+            return entry
     
     @staticmethod
-    def get_entries(user_id: int, limit: Optional[int] = None) -> List[Dict]:
-        """Get user's diary entries"""
+    def get_entries(user_id: int, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Get user's diary entries, newest first, skipping the newest `offset`"""
         diary = load_json(DIARY_FILE)
         user_id_str = str(user_id)
         
         entries = diary.get(user_id_str, [])
         entries.sort(key=lambda x: x["created_at"], reverse=True)
         
+        # Archived entries are all older than hot ones; open only what is needed
+        for segment in DiaryArchive.segments(user_id_str):
+            if limit and len(entries) >= offset + limit:
+                break
+            archived = DiaryArchive.load_segment(user_id_str, segment)
+            archived.sort(key=lambda x: x["created_at"], reverse=True)
+            entries.extend(archived)
+        
         if limit:
-            return entries[:limit]
-        return entries
+            return entries[offset:offset + limit]
+        return entries[offset:]
+    
+    @staticmethod
+    def get_entry(user_id: int, entry_id) -> Optional[Dict]:
+        """Get single diary entry by ID"""
+        diary = load_json(DIARY_FILE)
+        for entry in diary.get(str(user_id), []):
+            if str(entry["id"]) == str(entry_id):
+                return entry
+        
+        found = DiaryArchive.find(str(user_id), entry_id)
+        if found:
+            segment, entries, i = found
+            return entries[i]
+        return None
+    
+    @staticmethod
+    def update_entry(user_id: int, entry_id, content: str) -> Optional[Dict]:
+        """Edit diary entry content"""
+        with file_lock(DIARY_FILE):
+            diary = load_json(DIARY_FILE)
+            for entry in diary.get(str(user_id), []):
+                if str(entry["id"]) == str(entry_id):
+                    entry["content"] = content
+                    entry["updated_at"] = datetime.now().isoformat()
+                    save_json(DIARY_FILE, diary)
+                    return entry
+            
+            found = DiaryArchive.find(str(user_id), entry_id)
+            if found is None:
+                return None
+            segment, entries, i = found
+            entries[i]["content"] = content
+            entries[i]["updated_at"] = datetime.now().isoformat()
+            DiaryArchive.rewrite_segment(str(user_id), segment, entries)
+            return entries[i]
+    
+    @staticmethod
+    def delete_entry(user_id: int, entry_id) -> bool:
+        """Delete diary entry"""
+        with file_lock(DIARY_FILE):
+            diary = load_json(DIARY_FILE)
+            user_id_str = str(user_id)
+            entries = diary.get(user_id_str, [])
+            remaining = [e for e in entries if str(e["id"]) != str(entry_id)]
+            
+            if len(remaining) < len(entries):
+                diary[user_id_str] = remaining
+                save_json(DIARY_FILE, diary)
+                return True
+            
+            found = DiaryArchive.find(user_id_str, entry_id)
+            if found is None:
+                return False
+            segment, archived, i = found
+            del archived[i]
+            DiaryArchive.rewrite_segment(user_id_str, segment, archived)
+            return True
     
     @staticmethod
     def get_entry_count(user_id: int) -> int:
         """Get total number of entries"""
         diary = load_json(DIARY_FILE)
         user_id_str = str(user_id)
-        return len(diary.get(user_id_str, []))
+        return len(diary.get(user_id_str, [])) + DiaryArchive.count(user_id_str)
+    
+    @staticmethod
+    def compact() -> int:
+        """Move old entries out of diary.json; returns how many were archived"""
+        cutoff = (datetime.now() - timedelta(days=DIARY_HOT_DAYS)).isoformat()
+        archived_total = 0
+        
+        with file_lock(DIARY_FILE):
+            diary = load_json(DIARY_FILE)
+            
+            for user_id_str, entries in diary.items():
+                entries.sort(key=lambda x: x["created_at"], reverse=True)
+                hot = [e for e in entries[:DIARY_HOT_MAX_ENTRIES] if e["created_at"] >= cutoff]
+                cold = entries[len(hot):]
+                if cold:
+                    DiaryArchive.append(user_id_str, cold)
+                    diary[user_id_str] = hot
+                    archived_total += len(cold)
+            
+            if archived_total:
+                save_json(DIARY_FILE, diary)
+        return archived_total
+
+
+JsonDiaryDatabase = DiaryDatabase
+
+if DIARY_BACKEND == "segments":
+    from utils.diary_segments import SegmentDiaryDatabase as DiaryDatabase
 
 
 class DailyEnergyCache:
-    """Cache daily energy to avoid regenerating"""
+    """Cache daily energy to avoid regenerating; one text per day and locale"""
     
     @staticmethod
-    def get_today() -> Optional[Dict]:
-        """Get today's energy if cached"""
-        cache = load_json(DAILY_ENERGY_FILE)
-        today = date.today().isoformat()
-        return cache.get(today)
+    def _locales(day_entry: Optional[Dict]) -> Dict:
+        # Days cached before localization hold a single Russian text
+        if day_entry and "text" in day_entry:
+            return {"ru": day_entry}
+        return day_entry or {}
     
     @staticmethod
-    def set_today(energy_data: Dict):
-        """Cache today's energy"""
+    def get_today(locale: str = "ru") -> Optional[Dict]:
+        """Get today's energy in this locale if cached"""
         cache = load_json(DAILY_ENERGY_FILE)
         today = date.today().isoformat()
-        cache[today] = energy_data
-        save_json(DAILY_ENERGY_FILE, cache)
+        return DailyEnergyCache._locales(cache.get(today)).get(locale)
+    
+    @staticmethod
+    def set_today(energy_data: Dict, locale: str = "ru"):
+        """Cache today's energy, dropping days past retention"""
+        with file_lock(DAILY_ENERGY_FILE):
+            cache = DailyEnergyCache._expire(load_json(DAILY_ENERGY_FILE))
+            today = date.today().isoformat()
+            day_entry = DailyEnergyCache._locales(cache.get(today))
+            day_entry[locale] = energy_data
+            cache[today] = day_entry
+            save_json(DAILY_ENERGY_FILE, cache)
+    
+    @staticmethod
+    def prune() -> int:
+        """Drop days past retention; returns how many were removed"""
+        with file_lock(DAILY_ENERGY_FILE):
+            cache = load_json(DAILY_ENERGY_FILE)
+            kept = DailyEnergyCache._expire(cache)
+            if len(kept) < len(cache):
+                save_json(DAILY_ENERGY_FILE, kept)
+            return len(cache) - len(kept)
+    
+    @staticmethod
+    def _expire(cache: Dict) -> Dict:
+        oldest = (date.today() - timedelta(days=DAILY_ENERGY_RETENTION_DAYS)).isoformat()
+        return {day: value for day, value in cache.items() if day > oldest}
+
+
+class DeeperInterpretationCache:
+    """Cache deeper interpretations by content hash of the source reading"""
+    
+    @staticmethod
+    def get(content_hash: str) -> Optional[str]:
+        """Get cached interpretation generated today"""
+        cache = load_json(DEEPER_CACHE_FILE)
+        entry = cache.get(content_hash)
+        if entry and entry["date"] == date.today().isoformat():
+            return entry["text"]
+        return None
+    
+    @staticmethod
+    def set(content_hash: str, text: str):
+        """Cache interpretation, dropping entries from previous days"""
+        with file_lock(DEEPER_CACHE_FILE):
+            cache = load_json(DEEPER_CACHE_FILE)
+            today = date.today().isoformat()
+            cache = {k: v for k, v in cache.items() if v["date"] == today}
+            cache[content_hash] = {"text": text, "date": today}
+            save_json(DEEPER_CACHE_FILE, cache)
@@ -0,0 +1,262 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.database import DATA_DIR, DIARY_FILE, file_lock, generate_entry_id, load_json
+
+DIARY_SEGMENTS_DIR = os.path.join(DATA_DIR, "diary_segments")
+
+# Index slot per entry in creation order: entry id, record offset, record length.
+# Edits point the slot at a newly appended record; deletes zero its length
+# and compaction drops the emptied slots.
+_SLOT = struct.Struct("<26sQI")
+# Rewrite a user's log once this share of it is dead records
+GARBAGE_RATIO = 0.5
+
+
+def _paths(user_id_str: str) -> Tuple[str, str]:
+    base = os.path.join(DIARY_SEGMENTS_DIR, user_id_str)
+    return base + ".log", base + ".idx"
+
+
+def _slot_id(entry_id) -> bytes:
+    return str(entry_id).encode("ascii").ljust(26)[:26]
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    """Read-only map of a file, or None when it is missing or empty"""
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def _user_lock(user_id_str: str, mode: int):
+    """Cross-process lock on a user's files: shared for reads, exclusive for writes.
+
+    The lock file is never replaced, unlike the log and index that
+    compaction swaps out.
+    """
+    os.makedirs(DIARY_SEGMENTS_DIR, exist_ok=True)
+    log_path, idx_path = _paths(user_id_str)
+    with open(log_path[:-len(".log")] + ".lock", 'a') as lock:
+        fcntl.flock(lock, mode)
+        # Finish a compaction that stopped between its two renames
+        if os.path.exists(idx_path + ".tmp") and not os.path.exists(log_path + ".tmp"):
+            try:
+                os.replace(idx_path + ".tmp", idx_path)
+            except FileNotFoundError:
+                pass  # another reader finished it
+        yield
+
+
+@contextmanager
+def _mapped(user_id_str: str):
+    """(log, index) maps of a user's files under a shared lock"""
+    log_path, idx_path = _paths(user_id_str)
+    with _user_lock(user_id_str, fcntl.LOCK_SH):
+        log, idx = _map(log_path), _map(idx_path)
+        try:
+            yield log, idx
+        finally:
+            for m in (log, idx):
+                if m is not None:
+                    m.close()
+
+
+class SegmentDiaryDatabase:
+    """Diary as append-only per-user logs with a fixed-width offset index.
+
+    Same interface as DiaryDatabase. Adding an entry appends one JSON
+    record to <user>.log and one slot to <user>.idx; reading the newest
+    N entries walks the last index slots and reads just those records
+    through mmap, without touching other users' data.
+    """
+    
+    @staticmethod
+    def _append(user_id_str: str, entry: Dict, slot: Optional[int] = None):
+        """Append a record and add (or repoint) its index slot"""
+        log_path, idx_path = _paths(user_id_str)
+        record = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        
+        with _user_lock(user_id_str, fcntl.LOCK_EX):
+            with open(log_path, 'ab') as log:
+                offset = log.seek(0, os.SEEK_END)
+                log.write(record)
+            packed = _SLOT.pack(_slot_id(entry["id"]), offset, len(record))
+            if slot is None:
+                with open(idx_path, 'ab') as idx:
+                    idx.write(packed)
+            else:
+                SegmentDiaryDatabase._write_slot(idx_path, slot, packed)
+    
+    @staticmethod
+    def _write_slot(idx_path: str, slot: int, packed: bytes):
+        with open(idx_path, 'r+b') as idx:
+            idx.seek(slot * _SLOT.size)
+            idx.write(packed)
+    
+    @staticmethod
+    def _slots(idx: Optional[mmap.mmap], newest_first: bool = True) -> Iterator[Tuple[int, bytes, int, int]]:
+        """(slot, id, offset, length) of live entries"""
+        if idx is None:
+            return
+        count = len(idx) // _SLOT.size
+        order = range(count - 1, -1, -1) if newest_first else range(count)
+        for slot in order:
+            slot_id, offset, length = _SLOT.unpack_from(idx, slot * _SLOT.size)
+            if length:
+                yield slot, slot_id, offset, length
+    
+    @staticmethod
+    def _find(user_id_str: str, entry_id) -> Optional[Tuple[int, Dict]]:
+        wanted = _slot_id(entry_id)
+        with _mapped(user_id_str) as (log, idx):
+            for slot, slot_id, offset, length in SegmentDiaryDatabase._slots(idx):
+                if slot_id == wanted:
+                    return slot, json.loads(log[offset:offset + length])
+        return None
+    
+    @staticmethod
+    def add_entry(user_id: int, content: str, entry_type: str = "note"):
+        """Add diary entry"""
+        entry = {
+            "id": generate_entry_id(),
+            "content": content,
+            "type": entry_type,  # note, tarot, daily_energy
+            "created_at": datetime.now().isoformat()
+        }
+        with file_lock(_paths(str(user_id))[0]):
+            SegmentDiaryDatabase._append(str(user_id), entry)
+        return entry
+    
+    @staticmethod
+    def get_entries(user_id: int, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Get user's diary entries, newest first, skipping the newest `offset`"""
+        entries = []
+        with _mapped(str(user_id)) as (log, idx):
+            for i, (_, _, record_offset, length) in enumerate(SegmentDiaryDatabase._slots(idx)):
+                if i < offset:
+                    continue
+                entries.append(json.loads(log[record_offset:record_offset + length]))
+                if limit and len(entries) >= limit:
+                    break
+        return entries
+    
+    @staticmethod
+    def get_entry(user_id: int, entry_id) -> Optional[Dict]:
+        """Get single diary entry by ID"""
+        found = SegmentDiaryDatabase._find(str(user_id), entry_id)
+        return found[1] if found else None
+    
+    @staticmethod
+    def update_entry(user_id: int, entry_id, content: str) -> Optional[Dict]:
+        """Edit diary entry content"""
+        user_id_str = str(user_id)
+        with file_lock(_paths(user_id_str)[0]):
+            found = SegmentDiaryDatabase._find(user_id_str, entry_id)
+            if found is None:
+                return None
+            slot, entry = found
+            entry["content"] = content
+            entry["updated_at"] = datetime.now().isoformat()
+            SegmentDiaryDatabase._append(user_id_str, entry, slot)
+            return entry
+    
+    @staticmethod
+    def delete_entry(user_id: int, entry_id) -> bool:
+        """Delete diary entry"""
+        user_id_str = str(user_id)
+        log_path, idx_path = _paths(user_id_str)
+        with file_lock(log_path):
+            found = SegmentDiaryDatabase._find(user_id_str, entry_id)
+            if found is None:
+                return False
+            with _user_lock(user_id_str, fcntl.LOCK_EX):
+                SegmentDiaryDatabase._write_slot(idx_path, found[0], _SLOT.pack(_slot_id(entry_id), 0, 0))
+            return True
+    
+    @staticmethod
+    def get_entry_count(user_id: int) -> int:
+        """Get total number of entries"""
+        with _mapped(str(user_id)) as (_, idx):
+            return sum(1 for _ in SegmentDiaryDatabase._slots(idx))
+    
+    @staticmethod
+    def compact() -> int:
+        """Rewrite logs dominated by edited or deleted records; returns bytes reclaimed"""
+        if not os.path.isdir(DIARY_SEGMENTS_DIR):
+            return 0
+        
+        reclaimed = 0
+        for name in os.listdir(DIARY_SEGMENTS_DIR):
+            if name.endswith(".log"):
+                reclaimed += SegmentDiaryDatabase._compact_user(name[:-len(".log")])
+        return reclaimed
+    
+    @staticmethod
+    def _compact_user(user_id_str: str) -> int:
+        log_path, idx_path = _paths(user_id_str)
+        with file_lock(log_path), _user_lock(user_id_str, fcntl.LOCK_EX):
+            log, idx = _map(log_path), _map(idx_path)
+            if log is None or idx is None:
+                return 0
+            with log, idx:
+                size = len(log)
+                slots = list(_SLOT.iter_unpack(idx[:len(idx) - len(idx) % _SLOT.size]))
+                live = sum(length for _, _, length in slots)
+                if live >= size * (1 - GARBAGE_RATIO):
+                    return 0
+                # Deleted slots are dropped: slot numbers are only held under file_lock, which we hold
+                with open(log_path + ".tmp", 'wb') as new_log, open(idx_path + ".tmp", 'wb') as new_idx:
+                    for slot_id, offset, length in slots:
+                        if length:
+                            new_idx.write(_SLOT.pack(slot_id, new_log.tell(), length))
+                            new_log.write(log[offset:offset + length])
+            # Log first: an index .tmp left behind alone is finished by _user_lock
+            os.replace(log_path + ".tmp", log_path)
+            os.replace(idx_path + ".tmp", idx_path)
+            return size - live
+
+
+def migrate_json_diary():
+    """Copy entries from the JSON diary and its archive into segment logs.
+
+    Entries whose id is already in the user's index are skipped, so an
+    interrupted migration can simply be run again. Run it before switching
+    the backend: once compaction has dropped deleted slots, a rerun would
+    bring those entries back.
+    """
+    from utils.database import DIARY_ARCHIVE_DIR, JsonDiaryDatabase
+    
+    user_ids = set(load_json(DIARY_FILE))
+    if os.path.isdir(DIARY_ARCHIVE_DIR):
+        user_ids.update(os.listdir(DIARY_ARCHIVE_DIR))
+    
+    migrated = 0
+    for user_id_str in user_ids:
+        with file_lock(_paths(user_id_str)[0]):
+            with _mapped(user_id_str) as (_, idx):
+                # Deleted slots count too, until compaction drops them
+                slots = _SLOT.iter_unpack(idx[:len(idx) - len(idx) % _SLOT.size]) if idx else ()
+                known = {slot_id for slot_id, _, _ in slots}
+            # Oldest first so slot order matches creation order
+            for entry in reversed(JsonDiaryDatabase.get_entries(user_id_str)):
+                if _slot_id(entry["id"]) in known:
+                    continue
+                SegmentDiaryDatabase._append(user_id_str, entry)
+                migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    print(f"Migrated {migrate_json_diary()} diary entries to {DIARY_SEGMENTS_DIR}")
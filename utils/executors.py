@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict
+
+# Threads for blocking file I/O (load_json/save_json and friends)
+IO_WORKERS = int(os.getenv("IO_WORKERS", 8))
+# Processes for CPU-heavy jobs (analytics, indexing, archiving, matching)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", 2))
+
+
+def _timed(func: Callable, args: tuple, kwargs: dict):
+    """Run func and report when it started and how long it took"""
+    started_at = time.time()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, started_at, time.perf_counter() - start
+
+
+class Executors:
+    """Shared pools that keep blocking and CPU-bound work off the event loop.
+
+    run_io() uses a thread pool and carries context variables along;
+    run_cpu() uses a process pool, so its function and arguments must be
+    picklable (module-level functions, plain data). Both pools start on
+    first use.
+    """
+    
+    def __init__(self, io_workers: int = IO_WORKERS, cpu_workers: int = CPU_WORKERS):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self._io = None
+        self._cpu = None
+        self._metrics: Dict[str, Dict] = {}
+    
+    def _io_pool(self):
+        if self._io is None:
+            self._io = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io")
+        return self._io
+    
+    def _cpu_pool(self):
+        if self._cpu is None:
+            # Forking a process that runs threads is unsafe; forkserver keeps startup cheap
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._cpu = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context(method))
+        return self._cpu
+    
+    async def run_io(self, func: Callable, *args, **kwargs):
+        """Run blocking I/O in the thread pool"""
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, _timed, func, args, kwargs)
+        return await self._run("io", self._io_pool(), call)
+    
+    async def run_cpu(self, func: Callable, *args, **kwargs):
+        """Run CPU-heavy work in the process pool"""
+        call = functools.partial(_timed, func, args, kwargs)
+        return await self._run("cpu", self._cpu_pool(), call)
+    
+    async def _run(self, pool_name: str, pool, call: Callable):
+        metrics = self._pool_metrics(pool_name)
+        submitted_at = time.time()
+        metrics["in_flight"] += 1
+        try:
+            result, started_at, duration = await asyncio.get_running_loop().run_in_executor(pool, call)
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        finally:
+            metrics["in_flight"] -= 1
+        
+        metrics["completed"] += 1
+        metrics["wait_total"] += max(0.0, started_at - submitted_at)
+        metrics["run_total"] += duration
+        metrics["run_max"] = max(metrics["run_max"], duration)
+        return result
+    
+    def _pool_metrics(self, pool_name: str) -> Dict:
+        return self._metrics.setdefault(pool_name, {
+            "in_flight": 0, "completed": 0, "failed": 0, "wait_total": 0.0, "run_total": 0.0, "run_max": 0.0
+        })
+    
+    def stats(self) -> Dict:
+        """Queue depth and task times per pool"""
+        workers = {"io": self.io_workers, "cpu": self.cpu_workers}
+        pools = {}
+        for pool_name, m in self._metrics.items():
+            done = m["completed"] or 1
+            pools[pool_name] = {
+                "queue_depth": max(0, m["in_flight"] - workers[pool_name]),
+                "running": min(m["in_flight"], workers[pool_name]),
+                "completed": m["completed"],
+                "failed": m["failed"],
+                "wait_avg": m["wait_total"] / done,
+                "run_avg": m["run_total"] / done,
+                "run_max": m["run_max"],
+            }
+        return pools
+    
+    def shutdown(self):
+        for pool in (self._io, self._cpu):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._io = self._cpu = None
+
+
+executors = Executors()
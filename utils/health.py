@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict
+
+from utils.database import DATA_DIR
+
+# Degradation thresholds for the readiness probe
+MAX_LOOP_LAG = float(os.getenv("READY_MAX_LOOP_LAG", 0.25))
+MAX_STORAGE_LATENCY = float(os.getenv("READY_MAX_STORAGE_LATENCY", 0.2))
+MAX_PENDING_UPDATES = int(os.getenv("READY_MAX_PENDING_UPDATES", 10))
+MAX_ERROR_RATE = float(os.getenv("READY_MAX_ERROR_RATE", 0.5))
+
+PROBE_FILE = os.path.join(DATA_DIR, f".ready_probe_{os.getpid()}")
+
+# Storage probes run here so a hung disk cannot block the request thread
+_probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ready-probe")
+
+
+def _storage_roundtrip() -> float:
+    start = time.perf_counter()
+    with open(PROBE_FILE, 'w', encoding='utf-8') as f:
+        f.write(str(time.time()))
+    with open(PROBE_FILE, 'r', encoding='utf-8') as f:
+        f.read()
+    os.remove(PROBE_FILE)
+    return time.perf_counter() - start
+
+
+def start_storage_probe():
+    """Start a write/read/delete roundtrip on the data volume"""
+    return _probe_executor.submit(_storage_roundtrip)
+
+
+def start_loop_probe(loop: asyncio.AbstractEventLoop, snapshot: Callable[[], Dict]):
+    """Call snapshot() on the bot loop; the delay before it runs is the loop lag.
+
+    Loop-owned state such as scheduler metrics is mutated by the loop
+    without locks, so it is read there rather than on the request thread.
+    """
+    async def _snapshot():
+        return snapshot()
+    
+    started = time.perf_counter()
+    future = asyncio.run_coroutine_threadsafe(_snapshot(), loop)
+    return started, future
+
+
+def collect(loop, pending_updates: int, scheduler_stats: Callable[[], Dict], budget: float) -> Dict:
+    """Run all probes within budget seconds and evaluate them.
+
+    Returns a dict with per-check results and an overall "ready" flag.
+    A probe that does not finish in time counts as failed.
+    """
+    deadline = time.perf_counter() + budget
+    storage_future = start_storage_probe()
+    loop_started, loop_future = start_loop_probe(loop, scheduler_stats)
+    checks = {}
+    
+    stats = None
+    try:
+        stats = loop_future.result(timeout=max(deadline - time.perf_counter(), 0))
+        lag = time.perf_counter() - loop_started
+        checks["event_loop"] = {"ok": lag <= MAX_LOOP_LAG, "lag": round(lag, 4)}
+    except FutureTimeout:
+        loop_future.cancel()
+        checks["event_loop"] = {"ok": False, "lag": None, "error": "timeout"}
+    
+    try:
+        latency = storage_future.result(timeout=max(deadline - time.perf_counter(), 0))
+        checks["storage"] = {"ok": latency <= MAX_STORAGE_LATENCY, "latency": round(latency, 4)}
+    except FutureTimeout:
+        checks["storage"] = {"ok": False, "latency": None, "error": "timeout"}
+    except OSError as e:
+        checks["storage"] = {"ok": False, "latency": None, "error": str(e)}
+    
+    checks["pending_updates"] = {
+        "ok": pending_updates <= MAX_PENDING_UPDATES,
+        "count": pending_updates,
+        "llm_queue_depth": stats["queue_depth"] if stats else None
+    }
+    if stats is None:
+        # The loop did not answer, so there is no consistent snapshot
+        checks["upstream"] = {"ok": False, "error_rate": None, "error": "timeout"}
+    else:
+        checks["upstream"] = {
+            "ok": stats["error_rate"] <= MAX_ERROR_RATE,
+            "error_rate": round(stats["error_rate"], 3)
+        }
+    
+    return {"ready": all(c["ok"] for c in checks.values()), "checks": checks}
@@ -0,0 +1,59 @@
+import functools
+import json
+import os
+from typing import Dict, Optional
+
+from utils.database import BASE_DIR
+
+LOCALES_DIR = os.path.join(BASE_DIR, "locales")
+# Locale for users whose Telegram language has no catalog
+DEFAULT_LOCALE = os.getenv("DEFAULT_LOCALE", "ru")
+
+
+def _merge(base: Dict, override: Dict) -> Dict:
+    """Override's keys on top of base, recursing into sections"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merged[key] = _merge(base[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _load_catalogs() -> Dict[str, Dict]:
+    """Read locales/*.json once; missing keys fall back to the default locale"""
+    raw = {}
+    for name in sorted(os.listdir(LOCALES_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(LOCALES_DIR, name), 'r', encoding='utf-8') as f:
+                raw[name[:-len(".json")]] = json.load(f)
+    
+    if DEFAULT_LOCALE not in raw:
+        raise ValueError(f"No catalog for DEFAULT_LOCALE={DEFAULT_LOCALE!r} in {LOCALES_DIR}")
+    return {locale: _merge(raw[DEFAULT_LOCALE], catalog) for locale, catalog in raw.items()}
+
+
+# Locale -> {"messages": {...}, "prompts": {...}}
+CATALOGS = _load_catalogs()
+
+
+@functools.lru_cache(maxsize=256)
+def resolve_locale(language_code: Optional[str]) -> str:
+    """Catalog locale for a Telegram language code such as "en" or "pt-br" """
+    if language_code:
+        language = language_code.lower().replace("_", "-")
+        for candidate in (language, language.split("-")[0]):
+            if candidate in CATALOGS:
+                return candidate
+    return DEFAULT_LOCALE
+
+
+def locale_for(user) -> str:
+    """Locale of a Telegram user (or DEFAULT_LOCALE when unknown)"""
+    return resolve_locale(getattr(user, "language_code", None))
+
+
+def prompts(locale: str) -> Dict:
+    """Prompt templates of a locale"""
+    return CATALOGS.get(locale, CATALOGS[DEFAULT_LOCALE])["prompts"]
@@ -0,0 +1,218 @@
+import atexit
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# json (one object per line) or text (the classic format)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Share of high-volume info logs (handler timings, HTTP requests) that is kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.1))
+# Handlers slower than this are always logged, as warnings
+LOG_SLOW_HANDLER_MS = float(os.getenv("LOG_SLOW_HANDLER_MS", 2000))
+# Records waiting for the writer thread; further records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Repeats of the same error within this many seconds are logged without a stack trace
+LOG_TRACEBACK_WINDOW = float(os.getenv("LOG_TRACEBACK_WINDOW", 60))
+
+# Loggers whose info records are sampled
+SAMPLED_LOGGERS = ("httpx", "werkzeug", "handlers")
+
+# Update being processed; set by the handler wrapper and carried into
+# worker threads with the rest of the context
+current_update_id: ContextVar[Optional[int]] = ContextVar("current_update_id", default=None)
+
+# Bot tokens, e.g. in Bot API URLs and the webhook path
+_TOKEN_PATTERN = re.compile(r"\d{5,}:[A-Za-z0-9_-]{30,}")
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled"}
+
+handler_logger = logging.getLogger("handlers")
+
+
+def redact(text: str) -> str:
+    return _TOKEN_PATTERN.sub("<token>", text)
+
+
+def _redact_value(value):
+    """Redact strings inside an extra field of any shape"""
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {key: _redact_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(item) for item in value]
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: samples, stamps the update id and drops repeated tracebacks"""
+    
+    def __init__(self):
+        super().__init__()
+        self._seen_errors: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        sampled = getattr(record, "sampled", record.name.split(".")[0] in SAMPLED_LOGGERS)
+        if sampled and record.levelno <= logging.INFO and random.random() >= LOG_SAMPLE_RATE:
+            return False
+        
+        if getattr(record, "update_id", None) is None:
+            record.update_id = current_update_id.get()
+        if record.exc_info and record.exc_info[1] is not None:
+            self._dedupe_traceback(record)
+        return True
+    
+    def _dedupe_traceback(self, record: logging.LogRecord):
+        exc_type, exc, tb = record.exc_info
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        key = (exc_type, tb.tb_frame.f_code.co_filename if tb else None, tb.tb_lineno if tb else None)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._seen_errors.get(key, float("-inf")) < LOG_TRACEBACK_WINDOW:
+                record.error = f"{exc_type.__name__}: {exc}"
+                record.exc_info = None
+                return
+            self._seen_errors[key] = now
+            if len(self._seen_errors) > 1000:
+                self._seen_errors.clear()
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting them here"""
+    
+    dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve %-args; formatting and tracebacks happen on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            AsyncQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with extra fields at the top level"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = _redact_value(value)
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=lambda value: redact(str(value)))
+
+
+class RedactingFormatter(logging.Formatter):
+    """Classic text format without bot tokens"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        # A repeated error whose traceback was dropped still shows what it was
+        error = getattr(record, "error", None)
+        if error:
+            text = f"{text}\n{error}"
+        return redact(text)
+
+
+_listener = None
+
+
+def setup_logging():
+    """Route all logging through a bounded queue to a writer thread; safe to call twice"""
+    global _listener
+    if _listener is not None:
+        return
+    
+    if LOG_FORMAT == "text":
+        formatter = RedactingFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    else:
+        formatter = JsonFormatter()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+    
+    handler = AsyncQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+    
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def timed_handler(callback, name: Optional[str] = None):
+    """Wrap a handler callback to tag its logs with the update id and log its duration"""
+    name = name or callback.__name__
+    
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        token = current_update_id.set(getattr(update, "update_id", None))
+        callback_query = getattr(update, "callback_query", None)
+        route = callback_query.data if callback_query else None
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await callback(update, context)
+            ok = True
+            return result
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            if duration_ms >= LOG_SLOW_HANDLER_MS:
+                handler_logger.warning("slow handler", extra={
+                    "handler": name, "route": route, "duration_ms": duration_ms, "ok": ok, "sampled": False
+                })
+            else:
+                handler_logger.info("handler", extra={
+                    "handler": name, "route": route, "duration_ms": duration_ms, "ok": ok
+                })
+            current_update_id.reset(token)
+    
+    return wrapper
+
+
+def instrument_handlers(application):
+    """Apply timed_handler to the bot's handlers, including conversation steps"""
+    from telegram.ext import ConversationHandler
+    
+    def wrap(handler):
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            for sub in nested:
+                wrap(sub)
+        else:
+            handler.callback = timed_handler(handler.callback)
+    
+    for group, handlers in application.handlers.items():
+        # Negative groups hold bookkeeping handlers such as the update recorder
+        if group < 0:
+            continue
+        for handler in handlers:
+            wrap(handler)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import Application, BaseRateLimiter
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects longer messages, so such texts can't replace a placeholder
+MAX_MESSAGE_LENGTH = 4096
+
+# Bot API limits: ~30 messages/s overall, ~1 message/s per private chat
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", 1))
+PER_CHAT_BURST = int(os.getenv("TELEGRAM_PER_CHAT_BURST", 3))
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 3))
+
+# Connection pool shared by all outgoing Bot API calls
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 16))
+TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", 60))
+
+# Set per queued update by worker.py: endpoints of Bot API calls that may
+# have changed something (sent, edited, answered), attempted or not
+write_calls: ContextVar[Optional[List[str]]] = ContextVar("write_calls", default=None)
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens/s up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+    
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FloodControlRateLimiter(BaseRateLimiter):
+    """Per-chat and global rate limiting with automatic RetryAfter handling.
+
+    Only requests addressed to a chat are throttled; callback answers and
+    getUpdates pass straight through.
+    """
+    
+    def __init__(self, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 per_chat_burst: int = PER_CHAT_BURST, max_retries: int = MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, int(global_rate))
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        # Monotonic time before which Telegram asked us not to send
+        self.resume_at = 0.0
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Drop buckets that have fully refilled, they carry no state
+                now = time.monotonic()
+                self.chat_buckets = {
+                    k: b for k, b in self.chat_buckets.items()
+                    if b.tokens + (now - b.updated) * b.rate < b.capacity
+                }
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self.chat_buckets[key] = bucket
+        return bucket
+    
+    async def _wait_resume(self):
+        """Sleep until the latest flood-control deadline has passed"""
+        while (delay := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        max_retries = rate_limit_args or self.max_retries
+        chat_id = data.get("chat_id")
+        writes = write_calls.get()
+        if writes is not None and not endpoint.startswith("get"):
+            writes.append(endpoint)
+        
+        for attempt in range(max_retries + 1):
+            await self._wait_resume()
+            if chat_id is not None:
+                await self._chat_bucket(chat_id).acquire()
+                await self.global_bucket.acquire()
+            
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                logger.warning(f"Flood control on {endpoint}, pausing sends for {seconds}s")
+                # Concurrent RetryAfters only ever push the deadline later
+                self.resume_at = max(self.resume_at, time.monotonic() + seconds + 0.1)
+
+
+def build_request(connection_pool_size: int = POOL_SIZE, read_timeout: float = TIMEOUT) -> HTTPXRequest:
+    """Tuned HTTPX request shared by polling and webhook modes"""
+    return HTTPXRequest(
+        connection_pool_size=connection_pool_size,
+        connect_timeout=TIMEOUT,
+        read_timeout=read_timeout,
+        write_timeout=TIMEOUT,
+        pool_timeout=TIMEOUT
+    )
+
+
+def build_application(token: str, update_processor=None, post_init=None) -> Application:
+    """Application with the shared request pool and flood-control limiter"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(build_request())
+        .get_updates_request(build_request(connection_pool_size=1))
+        .rate_limiter(FloodControlRateLimiter())
+    )
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    return builder.build()
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split text into messages of at most limit characters, at paragraph or line breaks when possible"""
+    chunks = []
+    while len(text) > limit:
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, 0, limit + 1)
+            if cut > 0:
+                break
+        else:
+            cut = limit
+        chunk = text[:cut].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        text = text[cut:].lstrip()
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+async def finish_placeholder(placeholder, text: str, reply_markup=None):
+    """Replace a "working on it" message with the result.
+
+    Text over Telegram's limit (a Celtic Cross reading can be) goes out as
+    several messages with the keyboard on the last one. Falls back to a
+    new message when the placeholder can no longer be edited.
+    """
+    chunks = split_message(text)
+    markups = [None] * (len(chunks) - 1) + [reply_markup]
+    try:
+        message = await placeholder.edit_text(chunks[0], reply_markup=markups[0])
+    except BadRequest as e:
+        logger.info(f"Could not edit placeholder, sending new message: {e}")
+        message = await placeholder.reply_text(chunks[0], reply_markup=markups[0])
+    for chunk, markup in zip(chunks[1:], markups[1:]):
+        message = await placeholder.reply_text(chunk, reply_markup=markup)
+    return message
@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+MODEL_SMALL = os.getenv("MODEL_SMALL", "gpt-4.1-nano")
+MODEL_FAST = os.getenv("MODEL_FAST", "gpt-4.1-mini")
+MODEL_STRONG = os.getenv("MODEL_STRONG", "gpt-4.1")
+
+# Model per call type and tier; "*" covers tiers not listed
+ROUTES = {
+    "daily_energy": {"*": MODEL_FAST},
+    "tarot_1_card": {"*": MODEL_FAST},
+    "tarot_3_cards": {"free": MODEL_FAST, "*": MODEL_STRONG},
+    "tarot_5_cards": {"*": MODEL_STRONG},
+    "tarot_celtic_cross": {"*": MODEL_STRONG},
+    "own_deck": {"*": MODEL_FAST},
+    "deepen": {"*": MODEL_STRONG},
+    "followup": {"premium": MODEL_STRONG, "*": MODEL_FAST},
+    "summary": {"*": MODEL_SMALL},
+}
+
+# Where a call goes while its primary model is too slow
+FALLBACKS = {
+    MODEL_STRONG: MODEL_FAST,
+    MODEL_FAST: MODEL_SMALL,
+}
+
+# Smoothed latency, in seconds, above which a model is bypassed
+LATENCY_THRESHOLD = float(os.getenv("MODEL_LATENCY_THRESHOLD", 12))
+# While bypassed, one call per this many seconds still probes the primary
+PROBE_INTERVAL = float(os.getenv("MODEL_PROBE_INTERVAL", 30))
+# Weight of the newest sample in the moving average
+EWMA_ALPHA = 0.3
+
+
+class ModelRouter:
+    """Pick a model per call type and tier, bypassing slow primaries.
+
+    Latency of every call is folded into a per-model moving average.
+    When a primary's average exceeds LATENCY_THRESHOLD its calls go to
+    the fallback model, except for an occasional probe that lets the
+    average recover once the primary is fast again.
+    """
+
+    def __init__(self, routes: Dict = ROUTES, fallbacks: Dict = FALLBACKS, threshold: float = LATENCY_THRESHOLD):
+        self.routes = routes
+        self.fallbacks = fallbacks
+        self.threshold = threshold
+        self._latency: Dict[str, float] = {}
+        self._last_probe: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def primary(self, call_type: str, tier: str) -> str:
+        route = self.routes.get(call_type, {})
+        return route.get(tier, route.get("*", MODEL_FAST))
+
+    def choose(self, call_type: str, tier: str) -> str:
+        """Model to use for this call"""
+        model = self.primary(call_type, tier)
+        fallback = self.fallbacks.get(model)
+
+        with self._lock:
+            latency = self._latency.get(model, 0.0)
+            if fallback is None or latency <= self.threshold:
+                return model
+
+            now = time.monotonic()
+            if now - self._last_probe.setdefault(model, now) >= PROBE_INTERVAL:
+                self._last_probe[model] = now
+                logger.info(f"Model route {call_type}/{tier}: probing {model} (avg {latency:.1f}s)")
+                return model
+
+        logger.info(
+            f"Model route {call_type}/{tier}: {model} -> {fallback} "
+            f"(avg {latency:.1f}s > {self.threshold:.1f}s, fallback avg {self._latency.get(fallback, 0.0):.1f}s)"
+        )
+        return fallback
+
+    def observe(self, model: str, latency: float, ok: bool = True):
+        """Fold a finished call into the model's latency average"""
+        # A failed call counts as slow so a broken model is bypassed too
+        sample = latency if ok else max(latency, self.threshold * 2)
+        with self._lock:
+            previous = self._latency.get(model)
+            self._latency[model] = sample if previous is None else (
+                EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * previous
+            )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._latency)
+
+
+model_router = ModelRouter()
@@ -0,0 +1,73 @@
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Deque, Dict
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Production polling profile, configurable via environment
+POLLING_CONCURRENCY = int(os.getenv("POLLING_CONCURRENCY", 16))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", 30))
+# Only the update types the handlers actually use
+POLLING_ALLOWED_UPDATES = [
+    u.strip() for u in os.getenv("POLLING_ALLOWED_UPDATES", "message,callback_query,pre_checkout_query").split(",") if u.strip()
+]
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each user's updates in order.
+
+    Up to max_concurrent_updates updates run at once (bounded by the base
+    class semaphore). An update from a user who already has one running is
+    queued behind it and its slot is released at once: the running update
+    works through the user's queue, so one busy user holds one slot
+    instead of stalling everyone else.
+    """
+    
+    def __init__(self, max_concurrent_updates: int = POLLING_CONCURRENCY):
+        super().__init__(max_concurrent_updates)
+        # User -> updates not yet finished; the first one is running
+        self._queues: Dict[int, Deque[Awaitable]] = {}
+    
+    @staticmethod
+    def _ordering_key(update):
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+    
+    async def do_process_update(self, update, coroutine):
+        key = self._ordering_key(update)
+        if key is None:
+            await coroutine
+            return
+        
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+        
+        queue = self._queues[key] = deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception as e:
+                    # Later updates of the user must still run
+                    logger.error(f"Error processing update of {key}: {e}", exc_info=True)
+                finally:
+                    queue.popleft()
+        finally:
+            del self._queues[key]
+            # Cancelled while others were queued: they will never run
+            for pending in queue:
+                pending.close()
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
@@ -0,0 +1,85 @@
+import math
+import time
+from collections import namedtuple
+from typing import Dict, Optional
+
+from utils.database import UsageLog
+from utils.i18n import CATALOGS, DEFAULT_LOCALE
+from utils.subscriptions import subscriptions
+
+# A feature may be used `limit` times within any `window` seconds
+QuotaRule = namedtuple("QuotaRule", ["limit", "window"])
+
+DAY = 24 * 60 * 60
+
+# Declarative limits per subscription tier and feature.
+# Features missing from a tier are not available to it.
+QUOTAS: Dict[str, Dict[str, QuotaRule]] = {
+    "free": {
+        "daily_energy": QuotaRule(1, DAY),
+        "tarot": QuotaRule(1, DAY),
+    },
+    "base": {
+        "daily_energy": QuotaRule(20, DAY),
+        "tarot": QuotaRule(10, DAY),
+        "deepen": QuotaRule(5, DAY),
+    },
+    "premium": {
+        "daily_energy": QuotaRule(50, DAY),
+        "tarot": QuotaRule(50, DAY),
+        "deepen": QuotaRule(20, DAY),
+        "own_deck": QuotaRule(30, DAY),
+        "followup": QuotaRule(30, DAY),
+    },
+}
+
+
+class QuotaEngine:
+    """Evaluate per-tier feature quotas against the in-memory usage window"""
+    
+    @staticmethod
+    def get_rule(tier: str, feature: str) -> QuotaRule:
+        """Get quota rule for tier and feature"""
+        return QUOTAS.get(tier, QUOTAS["free"]).get(feature, QuotaRule(0, DAY))
+    
+    @staticmethod
+    def remaining(user_id: int, feature: str, tier: str = None) -> int:
+        """Get number of uses left in the current window"""
+        if tier is None:
+            tier = subscriptions.tier(user_id)
+        
+        rule = QuotaEngine.get_rule(tier, feature)
+        if rule.limit <= 0:
+            return 0
+        
+        used = UsageLog.count_recent(user_id, feature, rule.window)
+        return max(rule.limit - used, 0)
+    
+    @staticmethod
+    def can_use(user_id: int, feature: str) -> bool:
+        """Check if user has quota left for feature"""
+        return QuotaEngine.remaining(user_id, feature) > 0
+    
+    @staticmethod
+    def available_in(user_id: int, feature: str) -> Optional[int]:
+        """Seconds until the next use frees up in the rolling window, None if the tier lacks the feature"""
+        rule = QuotaEngine.get_rule(subscriptions.tier(user_id), feature)
+        if rule.limit <= 0:
+            return None
+        
+        freed_at = UsageLog.freed_at(user_id, feature, rule.window, rule.limit)
+        if freed_at is None:
+            return 0
+        return max(math.ceil(freed_at - time.time()), 0)
+    
+    @staticmethod
+    def summary(user_id: int, locale: str = DEFAULT_LOCALE) -> str:
+        """Format remaining quota of user's tier for display"""
+        messages = CATALOGS.get(locale, CATALOGS[DEFAULT_LOCALE])["messages"]
+        names, line = messages["FEATURE_NAMES"], messages["QUOTA_LINE_TEMPLATE"]
+        tier = subscriptions.tier(user_id)
+        lines = []
+        for feature, rule in QUOTAS.get(tier, QUOTAS["free"]).items():
+            left = QuotaEngine.remaining(user_id, feature, tier)
+            lines.append(line.format(feature=names.get(feature, feature), left=left, limit=rule.limit))
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+from typing import Dict, Iterable
+
+from utils.executors import executors
+
+# Append sanitized incoming updates to this JSONL file (for replay_updates.py)
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")
+
+# Personal fields dropped from users, chats and contacts
+_PERSONAL_FIELDS = ("last_name", "username", "bio", "vcard")
+# Required by the Bot API objects, so replaced rather than dropped
+_PLACEHOLDERS = {"first_name": "User", "title": "Chat", "phone_number": "+0000000000"}
+_WORD = re.compile(r"\w", re.UNICODE)
+_CHAT_TYPES = ("private", "group", "supergroup", "channel")
+
+
+def _is_identity(data: Dict) -> bool:
+    """Whether a dict is a User or Chat object, wherever it is nested"""
+    return "is_bot" in data or "first_name" in data or data.get("type") in _CHAT_TYPES
+
+
+def _is_id_key(key: str) -> bool:
+    """user_id, chat_id, user_chat_id and the like"""
+    return key.endswith("user_id") or key.endswith("chat_id")
+
+
+class UpdateRecorder:
+    """Write incoming updates with identities and free text masked.
+
+    User and chat ids map to stable pseudonyms within one recording: the
+    id of every User or Chat object at any depth and every *user_id or
+    *chat_id field. Names are replaced, and free text keeps its length and
+    punctuation but not its letters. Menu texts and commands stay readable so replays take the
+    same handler paths.
+    """
+    
+    def __init__(self, path: str, keep_texts: Iterable[str] = ()):
+        self.path = path
+        self.keep_texts = set(keep_texts)
+        self._salt = secrets.token_bytes(16)
+    
+    def _pseudonym(self, value: int) -> int:
+        digest = hashlib.sha256(self._salt + str(value).encode()).digest()
+        return int.from_bytes(digest[:4], "big") % 10**9 + 1
+    
+    def _mask_text(self, text: str) -> str:
+        if text in self.keep_texts or text.startswith("/"):
+            return text
+        return _WORD.sub("ж", text)
+    
+    def sanitize(self, data):
+        if isinstance(data, dict):
+            identity = _is_identity(data)
+            clean = {}
+            for key, value in data.items():
+                if key in _PERSONAL_FIELDS:
+                    continue
+                if key in _PLACEHOLDERS:
+                    clean[key] = _PLACEHOLDERS[key]
+                    continue
+                if isinstance(value, int) and ((key == "id" and identity) or _is_id_key(key)):
+                    clean[key] = self._pseudonym(value)
+                elif key.endswith("user_ids") and isinstance(value, list):
+                    clean[key] = [self._pseudonym(item) for item in value]
+                elif key in ("text", "caption") and isinstance(value, str):
+                    clean[key] = self._mask_text(value)
+                else:
+                    clean[key] = self.sanitize(value)
+            return clean
+        if isinstance(data, list):
+            return [self.sanitize(item) for item in data]
+        return data
+    
+    def _write(self, payload: Dict):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    
+    async def record(self, update, context):
+        """TypeHandler callback; runs in its own group so handlers are unaffected"""
+        await executors.run_io(self._write, self.sanitize(update.to_dict()))
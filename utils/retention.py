@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import os
+
+from utils.database import DiaryDatabase, DailyEnergyCache, UsageLog
+from utils.executors import executors
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background compaction runs
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 6 * 60 * 60))
+# Delay before the first run so startup is not slowed down
+RETENTION_INITIAL_DELAY = float(os.getenv("RETENTION_INITIAL_DELAY", 60))
+
+
+def run_compaction() -> tuple:
+    """Apply all retention rules once.
+
+    Runs in the CPU pool: archiving is gzip work, and the file locks it
+    takes are flocks, so they hold across processes. Returns what was
+    done for the caller to log.
+    """
+    # Entries archived (JSON backend) or bytes reclaimed (segment backend)
+    diary_compacted = DiaryDatabase.compact()
+    expired_days = DailyEnergyCache.prune()
+    UsageLog.compact()
+    return diary_compacted, expired_days
+
+
+async def retention_loop():
+    """Run compaction periodically in the CPU pool"""
+    await asyncio.sleep(RETENTION_INITIAL_DELAY)
+    while True:
+        try:
+            diary_compacted, expired_days = await executors.run_cpu(run_compaction)
+            if diary_compacted or expired_days:
+                logger.info(f"Retention: diary compacted ({diary_compacted}), dropped {expired_days} daily energy days")
+        except Exception as e:
+            logger.error(f"Retention compaction failed: {e}", exc_info=True)
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+
+def start_retention(application):
+    """Schedule background compaction on the application's event loop"""
+    application.create_task(retention_loop())
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from utils.telemetry import current_tier
+
+logger = logging.getLogger(__name__)
+
+# Seconds of queue head start per tier: a premium request enqueued now is
+# served before a free request that has waited less than 30 seconds.
+# Free requests still age forward, so they are never starved.
+TIER_WEIGHTS = {
+    "premium": 30.0,
+    "base": 15.0,
+    "free": 0.0,
+    # Background pre-generation always yields to real requests
+    "speculative": -60.0,
+}
+
+# Tiers dropped instead of queued when the queue is full
+SHEDDABLE_TIERS = ("free", "speculative")
+
+# Parallel OpenAI calls allowed per worker
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+# Waiting requests beyond which free users are shed
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 20))
+# Window for the upstream error rate, in seconds
+ERROR_WINDOW = 300
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed because the queue is full"""
+
+
+class LLMScheduler:
+    """Priority queue in front of the blocking OpenAI generators.
+
+    At most `concurrency` generations run at once (each in a worker
+    thread); the rest wait ordered by enqueue time minus the tier weight.
+    """
+    
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._metrics: Dict[str, Dict] = {}
+        # Task -> its queue entry, enqueue time and tier while it waits, for promote()
+        self._waiting: Dict[asyncio.Task, Dict] = {}
+        # (finished_at, ok) of recent calls for the upstream error rate
+        self._outcomes = deque(maxlen=1000)
+    
+    async def submit(self, tier: str, func: Callable, *args, **kwargs):
+        """Run func(*args, **kwargs) when a slot is free for this tier"""
+        if tier in SHEDDABLE_TIERS and len(self._heap) >= self.max_queue:
+            self._tier_metrics(tier)["shed"] += 1
+            logger.warning(f"LLM queue full ({len(self._heap)}), shedding {tier} request")
+            raise Overloaded()
+        
+        enqueued_at = time.monotonic()
+        if self._active >= self.concurrency:
+            waiter = asyncio.get_running_loop().create_future()
+            priority = enqueued_at - TIER_WEIGHTS.get(tier, 0.0)
+            entry = (priority, next(self._seq), waiter)
+            heapq.heappush(self._heap, entry)
+            task = asyncio.current_task()
+            self._waiting[task] = {"entry": entry, "enqueued_at": enqueued_at, "tier": tier}
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.cancelled():
+                    self._heap.remove(self._waiting[task]["entry"])
+                    heapq.heapify(self._heap)
+                else:
+                    # Slot was handed over just before cancellation
+                    self._release()
+                raise
+            finally:
+                # promote() may have raised the tier while waiting
+                tier = self._waiting.pop(task)["tier"]
+        else:
+            self._active += 1
+        
+        metrics = self._tier_metrics(tier)
+        wait = time.monotonic() - enqueued_at
+        metrics["count"] += 1
+        metrics["wait_total"] += wait
+        metrics["wait_max"] = max(metrics["wait_max"], wait)
+        if wait > 1.0:
+            logger.info(f"LLM request ({tier}) waited {wait:.2f}s in queue")
+        
+        try:
+            # Lets telemetry attribute the call; to_thread copies the context
+            current_tier.set(tier)
+            result = await asyncio.to_thread(func, *args, **kwargs)
+            self._outcomes.append((time.monotonic(), True))
+            return result
+        except Exception:
+            self._outcomes.append((time.monotonic(), False))
+            raise
+        finally:
+            self._release()
+    
+    def promote(self, task: asyncio.Task, tier: str):
+        """Serve a waiting request at a higher tier, e.g. a speculation a user now waits for.
+
+        A request that is already running (or not in this scheduler) is
+        left as it is.
+        """
+        waiting = self._waiting.get(task)
+        if waiting is None or TIER_WEIGHTS.get(tier, 0.0) <= TIER_WEIGHTS.get(waiting["tier"], 0.0):
+            return
+        _, seq, waiter = waiting["entry"]
+        self._heap.remove(waiting["entry"])
+        heapq.heapify(self._heap)
+        entry = (waiting["enqueued_at"] - TIER_WEIGHTS.get(tier, 0.0), seq, waiter)
+        heapq.heappush(self._heap, entry)
+        waiting.update(entry=entry, tier=tier)
+    
+    def _release(self):
+        """Hand the slot to the next waiter or free it"""
+        if self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            waiter.set_result(None)
+        else:
+            self._active -= 1
+    
+    def _tier_metrics(self, tier: str) -> Dict:
+        return self._metrics.setdefault(tier, {"count": 0, "wait_total": 0.0, "wait_max": 0.0, "shed": 0})
+    
+    def error_rate(self, window: float = ERROR_WINDOW) -> float:
+        """Share of failed upstream calls within the last window seconds"""
+        since = time.monotonic() - window
+        recent = [ok for finished_at, ok in self._outcomes if finished_at >= since]
+        if not recent:
+            return 0.0
+        return recent.count(False) / len(recent)
+    
+    def stats(self) -> Dict:
+        """Queue depth, running calls and per-tier wait metrics"""
+        tiers = {}
+        for tier, m in self._metrics.items():
+            tiers[tier] = {
+                "count": m["count"],
+                "shed": m["shed"],
+                "wait_avg": m["wait_total"] / m["count"] if m["count"] else 0.0,
+                "wait_max": m["wait_max"],
+            }
+        return {
+            "queue_depth": len(self._heap),
+            "active": self._active,
+            "error_rate": self.error_rate(),
+            "tiers": tiers
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,37 @@
+import asyncio
+import hashlib
+from typing import Callable, Dict, Optional
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of text used as a cache key"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    Callers that arrive while the coroutine is running await the same task
+    instead of starting another.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    async def run(self, key: str, coro_func: Callable, *args, **kwargs):
+        """Await coro_func(*args, **kwargs) once per key at a time"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one cancelled caller does not cancel the others
+        return await asyncio.shield(task)
+    
+    def task(self, key: str) -> Optional[asyncio.Task]:
+        """The call in flight for key, if any"""
+        return self._inflight.get(key)
+    
+    def pending(self) -> int:
+        """Number of calls currently in flight"""
+        return len(self._inflight)
@@ -0,0 +1,106 @@
+import os
+import time
+from datetime import date
+from typing import Dict, Optional, Set, Tuple
+
+# Opt-in: pre-generate deeper interpretations right after a paid reading
+SPECULATIVE_DEEPEN = os.getenv("SPECULATIVE_DEEPEN", "0") == "1"
+# Seconds a parked interpretation waits for the "Углубить" press
+SPECULATIVE_TTL = float(os.getenv("SPECULATIVE_TTL", 600))
+# Speculative generations allowed at once and per day
+SPECULATIVE_MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", 2))
+SPECULATIVE_DAILY_BUDGET = int(os.getenv("SPECULATIVE_DAILY_BUDGET", 200))
+
+
+class SpeculativeCache:
+    """Short-lived store for results generated before they are asked for.
+
+    Entries are keyed like DeeperInterpretationCache (content hash of the
+    reading), handed out once by take() and silently dropped after the
+    TTL. Counters track how many speculations paid off.
+    """
+
+    def __init__(self, enabled: bool = SPECULATIVE_DEEPEN, ttl: float = SPECULATIVE_TTL,
+                 max_inflight: int = SPECULATIVE_MAX_INFLIGHT, daily_budget: int = SPECULATIVE_DAILY_BUDGET):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_inflight = max_inflight
+        self.daily_budget = daily_budget
+        self._parked: Dict[str, Tuple[float, str]] = {}
+        self._inflight: Set[str] = set()
+        # Speculations a user joined while running; their result is already used
+        self._claimed: Set[str] = set()
+        self._day = None
+        self._spent_today = 0
+        self._counts = {"started": 0, "hits": 0, "expired": 0, "failed": 0, "skipped": 0}
+
+    def try_begin(self, key: str, queue_depth: int = 0) -> bool:
+        """Reserve budget for a speculation; False when it should not run"""
+        if not self.enabled or key in self._inflight or key in self._parked:
+            return False
+
+        today = date.today()
+        if self._day != today:
+            self._day = today
+            self._spent_today = 0
+
+        # Never compete with requests users are already waiting for
+        if queue_depth or len(self._inflight) >= self.max_inflight or self._spent_today >= self.daily_budget:
+            self._counts["skipped"] += 1
+            return False
+
+        self._inflight.add(key)
+        self._spent_today += 1
+        self._counts["started"] += 1
+        return True
+
+    def finish(self, key: str, text: Optional[str]):
+        """Park the result of a speculation, or record that it failed"""
+        self._inflight.discard(key)
+        if text is None:
+            self._claimed.discard(key)
+            self._counts["failed"] += 1
+            return
+        if key in self._claimed:
+            self._claimed.discard(key)
+            self._counts["hits"] += 1
+            return
+        self._evict()
+        self._parked[key] = (time.monotonic() + self.ttl, text)
+
+    def pending(self, key: str) -> bool:
+        return key in self._inflight
+
+    def take(self, key: str) -> Optional[str]:
+        """Hand out a parked result once, counting it as a hit"""
+        self._evict()
+        entry = self._parked.pop(key, None)
+        if entry is None:
+            return None
+        self._counts["hits"] += 1
+        return entry[1]
+
+    def claim(self, key: str):
+        """Count a speculation whose result a user got by joining it while it ran"""
+        if key in self._inflight:
+            # Counted by finish(), which then does not park the result
+            self._claimed.add(key)
+        elif self._parked.pop(key, None) is not None:
+            self._counts["hits"] += 1
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._parked.items() if expires_at <= now]
+        for key in expired:
+            del self._parked[key]
+        self._counts["expired"] += len(expired)
+
+    def stats(self) -> Dict:
+        self._evict()
+        finished = self._counts["hits"] + self._counts["expired"]
+        return {
+            **self._counts,
+            "parked": len(self._parked),
+            "inflight": len(self._inflight),
+            "hit_rate": self._counts["hits"] / finished if finished else 0.0,
+        }
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from utils.database import DATA_DIR, USERS_FILE, UserDatabase, file_lock, load_json, save_json
+from utils.executors import executors
+
+logger = logging.getLogger(__name__)
+
+# Telegram Payments provider token; without it invoices cannot be sent
+PAYMENT_PROVIDER_TOKEN = os.getenv("PAYMENT_PROVIDER_TOKEN", "")
+PAYMENT_CURRENCY = os.getenv("PAYMENT_CURRENCY", "RUB")
+# Local stand-in for the payment provider: "subscribe" activates at once
+PAYMENT_TEST_MODE = os.getenv("PAYMENT_TEST_MODE", "0") == "1"
+# Length of one paid period, days
+SUBSCRIPTION_PERIOD_DAYS = int(os.getenv("SUBSCRIPTION_PERIOD_DAYS", 30))
+# Seconds between expiry sweeps
+SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", 300))
+
+# One line per subscription change (the user id) so other processes refresh those users
+SUBSCRIPTIONS_CHANGES_FILE = os.path.join(DATA_DIR, "subscriptions.changes")
+
+# Plan -> (title, price in minor units)
+PLANS = {
+    "base": ("BASE", 29900),
+    "premium": ("PREMIUM", 59900),
+}
+
+
+def invoice_payload(plan: str, user_id: int) -> str:
+    return f"sub:{plan}:{user_id}"
+
+
+def parse_invoice_payload(payload: str) -> Optional[Tuple[str, int]]:
+    """(plan, user_id) from an invoice payload, None if it is not ours"""
+    parts = payload.split(":")
+    if len(parts) != 3 or parts[0] != "sub" or parts[1] not in PLANS or not parts[2].isdigit():
+        return None
+    return parts[1], int(parts[2])
+
+
+def _expiry_ts(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+class SubscriptionService:
+    """Tier lookups from memory, kept in sync by pushes instead of rereads.
+
+    refresh() runs in the I/O pool once per update: it applies changes
+    other processes logged since the last call and loads the user on a
+    cache miss. tier() and friends then answer from memory. Payments and
+    expiries update users.json and the cache, and append the user id to
+    the changes file, so other processes reload just those users. Paid
+    periods end at the time stored with them even before the sweep
+    downgrades them.
+    """
+    
+    def __init__(self):
+        self._tiers: Dict[str, Tuple[str, Optional[float]]] = {}
+        # Read position in the changes file; earlier changes are in users.json already
+        self._changes_inode, self._changes_offset = self._changes_position()
+        # (expires_at, user id) of paid users, earliest first; stale items are skipped
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._heap_loaded = False
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _changes_position() -> Tuple[Optional[int], int]:
+        try:
+            stat = os.stat(SUBSCRIPTIONS_CHANGES_FILE)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+    
+    def _log_change(self, user_ids: List[str]):
+        # One short append is atomic, so concurrent writers do not interleave lines
+        with open(SUBSCRIPTIONS_CHANGES_FILE, 'a', encoding='utf-8') as f:
+            f.write("".join(f"{user_id_str}\n" for user_id_str in user_ids))
+    
+    def _sync_changes(self):
+        """Reload the users whose subscription changed in any process"""
+        inode, size = self._changes_position()
+        with self._lock:
+            if inode != self._changes_inode:
+                # Changes file was removed or replaced: nothing to trust, start over
+                self._tiers.clear()
+                self._expiry_heap = []
+                self._heap_loaded = False
+                self._changes_inode, self._changes_offset = inode, size
+                return
+            if size <= self._changes_offset:
+                return
+            with open(SUBSCRIPTIONS_CHANGES_FILE, 'rb') as f:
+                f.seek(self._changes_offset)
+                chunk = f.read(size - self._changes_offset)
+            # Only consume complete lines; a partial write is picked up next time
+            end = chunk.rfind(b"\n") + 1
+            self._changes_offset += end
+            changed = set(chunk[:end].decode().split())
+        if not changed:
+            return
+        
+        users = load_json(USERS_FILE)
+        with self._lock:
+            for user_id_str in changed:
+                user = users.get(user_id_str)
+                if user is None:
+                    self._tiers.pop(user_id_str, None)
+                    continue
+                expires_at = _expiry_ts(user.get("subscription_expires_at"))
+                self._tiers[user_id_str] = (user["subscription"], expires_at)
+                if self._heap_loaded and user["subscription"] != "free" and expires_at:
+                    heapq.heappush(self._expiry_heap, (expires_at, user_id_str))
+    
+    def refresh(self, user_id: int):
+        """Bring one user's tier up to date; blocking, call through executors.run_io"""
+        self._sync_changes()
+        user_id_str = str(user_id)
+        if user_id_str not in self._tiers:
+            user = UserDatabase.get_user(user_id)
+            self._tiers[user_id_str] = (user["subscription"], _expiry_ts(user.get("subscription_expires_at")))
+    
+    def tier(self, user_id: int) -> str:
+        """Current tier: free, base or premium"""
+        cached = self._tiers.get(str(user_id))
+        if cached is None:
+            # Not refreshed for this update (e.g. a background job): load it here
+            self.refresh(user_id)
+            cached = self._tiers[str(user_id)]
+        
+        tier, expires_at = cached
+        if expires_at is not None and expires_at <= time.time():
+            return "free"
+        return tier
+    
+    def is_paid(self, user_id: int) -> bool:
+        return self.tier(user_id) in ("base", "premium")
+    
+    def is_premium(self, user_id: int) -> bool:
+        return self.tier(user_id) == "premium"
+    
+    def expires_at(self, user_id: int) -> Optional[datetime]:
+        self.tier(user_id)
+        expires_at = self._tiers[str(user_id)][1]
+        return datetime.fromtimestamp(expires_at) if expires_at else None
+    
+    def activate(self, user_id: int, plan: str, charge_id: Optional[str] = None,
+                 days: int = SUBSCRIPTION_PERIOD_DAYS) -> datetime:
+        """Grant a paid period; renewing the same plan extends it. Returns the new expiry"""
+        user_id_str = str(user_id)
+        UserDatabase.get_user(user_id)
+        with file_lock(USERS_FILE):
+            users = load_json(USERS_FILE)
+            user = users[user_id_str]
+            current = _expiry_ts(user.get("subscription_expires_at"))
+            
+            # Telegram may deliver the same successful_payment twice
+            if charge_id and charge_id == user.get("last_charge_id") and current:
+                return datetime.fromtimestamp(current)
+            
+            start = datetime.now()
+            if user["subscription"] == plan and current and current > start.timestamp():
+                start = datetime.fromtimestamp(current)
+            expires = start + timedelta(days=days)
+            
+            user["subscription"] = plan
+            user["subscription_expires_at"] = expires.isoformat()
+            if charge_id:
+                user["last_charge_id"] = charge_id
+            save_json(USERS_FILE, users)
+        
+        self._log_change([user_id_str])
+        with self._lock:
+            self._tiers[user_id_str] = (plan, expires.timestamp())
+            if self._heap_loaded:
+                heapq.heappush(self._expiry_heap, (expires.timestamp(), user_id_str))
+        logger.info(f"Subscription {plan} for user {user_id} until {expires.isoformat(timespec='minutes')}")
+        return expires
+    
+    def _load_heap(self):
+        """Build the expiry index with one scan of users.json"""
+        heap = []
+        for user_id_str, user in load_json(USERS_FILE).items():
+            expires_at = _expiry_ts(user.get("subscription_expires_at"))
+            if user.get("subscription") != "free" and expires_at:
+                heap.append((expires_at, user_id_str))
+        heapq.heapify(heap)
+        with self._lock:
+            self._expiry_heap = heap
+            self._heap_loaded = True
+    
+    def sweep_expired(self) -> int:
+        """Downgrade subscriptions whose period has ended; returns how many"""
+        self._sync_changes()
+        if not self._heap_loaded:
+            self._load_heap()
+        
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                due.append(heapq.heappop(self._expiry_heap)[1])
+        if not due:
+            return 0
+        
+        expired = []
+        with file_lock(USERS_FILE):
+            users = load_json(USERS_FILE)
+            for user_id_str in set(due):
+                user = users.get(user_id_str)
+                if not user or user["subscription"] == "free":
+                    continue
+                # A renewal since indexing has its later expiry in the heap too
+                expires_at = _expiry_ts(user.get("subscription_expires_at"))
+                if expires_at and expires_at <= now:
+                    user["subscription"] = "free"
+                    user["subscription_expires_at"] = None
+                    expired.append(user_id_str)
+            if expired:
+                save_json(USERS_FILE, users)
+        
+        if expired:
+            self._log_change(expired)
+            with self._lock:
+                for user_id_str in expired:
+                    self._tiers[user_id_str] = ("free", None)
+            logger.info(f"Subscriptions expired: {len(expired)}")
+        return len(expired)
+
+
+subscriptions = SubscriptionService()
+
+
+async def refresh_tier(update, context):
+    """TypeHandler callback: refresh the user's tier off the event loop before the handlers run"""
+    if update.effective_user:
+        await executors.run_io(subscriptions.refresh, update.effective_user.id)
+
+
+async def expiry_loop():
+    """Run the expiry sweep periodically in the I/O pool"""
+    while True:
+        try:
+            await executors.run_io(subscriptions.sweep_expired)
+        except Exception as e:
+            logger.error(f"Subscription expiry sweep failed: {e}", exc_info=True)
+        await asyncio.sleep(SUBSCRIPTION_SWEEP_INTERVAL)
+
+
+def start_expiry_sweep(application):
+    """Schedule the expiry sweep on the application's event loop"""
+    application.create_task(expiry_loop())
@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from utils.database import DATA_DIR
+from utils.i18n import CATALOGS, DEFAULT_LOCALE
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_DB = os.path.join(DATA_DIR, "telemetry.sqlite3")
+# Raw per-call rows are kept this many days; daily rollups are kept forever
+RETENTION_DAYS = int(os.getenv("TELEMETRY_RETENTION_DAYS", 7))
+
+# USD per 1M tokens (input, output) for spend estimates
+MODEL_PRICES = {
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# Date suffix of pinned model snapshots, e.g. gpt-4.1-mini-2025-04-14
+_SNAPSHOT_SUFFIX = re.compile(r"-\d{4}-\d{2}-\d{2}$")
+
+# Tier of the user a generation runs for; set by the LLM scheduler and
+# carried into worker threads by asyncio.to_thread
+current_tier: ContextVar[str] = ContextVar("current_tier", default="unknown")
+
+# Tokens of the LLM calls made for the current handler, appended from the
+# worker threads (the list is shared, not copied); see count_tokens()
+tokens_spent: ContextVar[Optional[List[int]]] = ContextVar("tokens_spent", default=None)
+
+
+def count_tokens() -> List[int]:
+    """Collect tokens of the LLM calls made from here on; sum() the list when recording usage"""
+    spent = []
+    tokens_spent.set(spent)
+    return spent
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    cached INTEGER NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_calls_day ON llm_calls (day);
+CREATE TABLE IF NOT EXISTS llm_daily (
+    day TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, feature, tier, model)
+);
+"""
+
+_ROLLUP = """
+INSERT INTO llm_daily (day, feature, tier, model, calls, cache_hits, errors, prompt_tokens, completion_tokens, latency_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, feature, tier, model) DO UPDATE SET
+    calls = calls + excluded.calls,
+    cache_hits = cache_hits + excluded.cache_hits,
+    errors = errors + excluded.errors,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    latency_ms = latency_ms + excluded.latency_ms
+"""
+
+
+class Telemetry:
+    """Per-call LLM usage in SQLite with a daily rollup for cheap aggregates.
+
+    Every record goes to `llm_calls` (pruned after RETENTION_DAYS) and is
+    folded into `llm_daily` in the same transaction, so /stats reads a
+    handful of rollup rows instead of scanning raw calls.
+    """
+
+    _conn = None
+    _lock = threading.Lock()
+    _pruned_day = None
+
+    @staticmethod
+    def _connect():
+        if Telemetry._conn is None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            conn = sqlite3.connect(TELEMETRY_DB, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            Telemetry._conn = conn
+        return Telemetry._conn
+
+    @staticmethod
+    def record(feature: str, model: str = "-", usage=None, latency: float = 0.0,
+               cached: bool = False, ok: bool = True, tier: Optional[str] = None):
+        """Store one LLM call or cache hit; never raises"""
+        tier = tier or current_tier.get()
+        model = base_model(model)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        latency_ms = int(latency * 1000)
+        spent = tokens_spent.get()
+        if spent is not None and not cached:
+            spent.append(prompt_tokens + completion_tokens)
+        today = date.today().isoformat()
+
+        try:
+            with Telemetry._lock:
+                conn = Telemetry._connect()
+                with conn:
+                    conn.execute(
+                        "INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (time.time(), today, feature, tier, model, prompt_tokens, completion_tokens,
+                         latency_ms, int(cached), int(ok))
+                    )
+                    conn.execute(
+                        _ROLLUP,
+                        (today, feature, tier, model, 0 if cached else 1, int(cached), int(not ok),
+                         prompt_tokens, completion_tokens, latency_ms)
+                    )
+                if Telemetry._pruned_day != today:
+                    Telemetry._prune(conn, today)
+        except sqlite3.Error as e:
+            logger.warning(f"Telemetry write failed: {e}")
+
+    @staticmethod
+    def _prune(conn, today: str):
+        """Drop raw rows past retention, once per day"""
+        cutoff = (date.fromisoformat(today) - timedelta(days=RETENTION_DAYS)).isoformat()
+        with conn:
+            conn.execute("DELETE FROM llm_calls WHERE day < ?", (cutoff,))
+        Telemetry._pruned_day = today
+
+    @staticmethod
+    def aggregate(days: int) -> List[Dict]:
+        """Totals per feature and tier over the last `days` days"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        with Telemetry._lock:
+            rows = Telemetry._connect().execute(
+                "SELECT feature, tier, model, SUM(calls), SUM(cache_hits), SUM(errors), "
+                "SUM(prompt_tokens), SUM(completion_tokens), SUM(latency_ms) "
+                "FROM llm_daily WHERE day >= ? GROUP BY feature, tier, model",
+                (since,)
+            ).fetchall()
+
+        totals = {}
+        for feature, tier, model, calls, hits, errors, p_tokens, c_tokens, latency_ms in rows:
+            item = totals.setdefault((feature, tier), {
+                "feature": feature, "tier": tier, "calls": 0, "cache_hits": 0, "errors": 0,
+                "tokens": 0, "cost": 0.0, "latency_ms": 0
+            })
+            item["calls"] += calls
+            item["cache_hits"] += hits
+            item["errors"] += errors
+            item["tokens"] += p_tokens + c_tokens
+            item["cost"] += estimate_cost(model, p_tokens, c_tokens)
+            item["latency_ms"] += latency_ms
+
+        for item in totals.values():
+            item["latency_avg"] = item["latency_ms"] / item["calls"] / 1000 if item["calls"] else 0.0
+        return sorted(totals.values(), key=lambda i: i["cost"], reverse=True)
+
+
+def base_model(model: str) -> str:
+    """Model family as priced in MODEL_PRICES; the API reports dated snapshot names"""
+    return _SNAPSHOT_SUFFIX.sub("", model)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Approximate spend in USD; unknown models count as free"""
+    price_in, price_out = MODEL_PRICES.get(base_model(model), (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+def format_stats(locale: str = DEFAULT_LOCALE, windows=(1, 7, 30)) -> str:
+    """Plain-text report for the admin /stats command"""
+    messages = CATALOGS.get(locale, CATALOGS[DEFAULT_LOCALE])["messages"]
+    lines = [messages["STATS_TITLE"]]
+    for days in windows:
+        rows = Telemetry.aggregate(days)
+        total = sum(r["cost"] for r in rows)
+        lines.append("\n" + messages["STATS_WINDOW_TEMPLATE"].format(days=days, total=total))
+        for r in rows:
+            lines.append(
+                messages["STATS_ROW_TEMPLATE"].format(**r)
+                + (messages["STATS_ERRORS_TEMPLATE"].format(errors=r["errors"]) if r["errors"] else "")
+            )
+    return "\n".join(lines)
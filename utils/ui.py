@@ -0,0 +1,186 @@
+# Prebuilt keyboards and static message texts, one set per locale.
+# Telegram markup objects are immutable, so one instance is shared by all
+# updates; handlers pick a catalog by the user's locale and a variant by
+# tier key instead of rebuilding it.
+
+import math
+from typing import Dict
+
+from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+
+from utils.i18n import CATALOGS as _MESSAGE_CATALOGS, DEFAULT_LOCALE, locale_for
+
+
+def _inline(*rows):
+    """Build inline keyboard from rows of (text, callback_data)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in rows
+    ])
+
+
+def paid_key(is_paid: bool) -> str:
+    return "paid" if is_paid else "free"
+
+
+def premium_key(is_premium: bool) -> str:
+    return "premium" if is_premium else "free"
+
+
+class Catalog:
+    """Texts and keyboards of one locale.
+
+    Every message of the locale file becomes an attribute (WELCOME_TEXT,
+    DIARY_MENU_TEMPLATE, ...); keyboards are built here from its BUTTONS
+    labels. Built once at import.
+    """
+    
+    def __init__(self, locale: str, messages: Dict):
+        self.locale = locale
+        self.__dict__.update(messages)
+        b = messages["BUTTONS"]
+        locked = b["locked"]
+        
+        # ============================================
+        # KEYBOARDS
+        # ============================================
+        
+        self.MAIN_MENU = ReplyKeyboardMarkup(
+            [
+                [b["daily_energy"], b["tarot"]],
+                [b["diary"], b["notifications"]],
+                [b["subscription"]]
+            ],
+            resize_keyboard=True
+        )
+        
+        self.START_KEYBOARD = _inline(
+            [(b["daily_energy"], "daily_energy")],
+            [(b["tarot"], "tarot")],
+            [(b["diary"], "diary")],
+            [(b["how_it_works"], "how_it_works")]
+        )
+        
+        self.DAILY_ENERGY_KEYBOARDS = {
+            "paid": _inline(
+                [(b["save_to_diary"], "diary_save_daily")],
+                [(b["ask_tarot"], "tarot")],
+                [(b["notify_daily"], "notify_daily")],
+                [(b["deepen"], "deepen_daily")]
+            ),
+            "free": _inline(
+                [(b["save_to_diary"], "diary_save_daily")],
+                [(b["ask_tarot"], "tarot")],
+                [(b["notify_daily"], "notify_daily")],
+                [(b["deepen"] + locked, "upgrade_needed")]
+            ),
+        }
+        
+        self.TAROT_MENU_KEYBOARDS = {
+            "premium": _inline(
+                [(b["tarot_bot"], "tarot_bot")],
+                [(b["tarot_own"], "tarot_own")]
+            ),
+            "free": _inline(
+                [(b["tarot_bot"], "tarot_bot")],
+                [(b["tarot_own"] + locked, "upgrade_premium")]
+            ),
+        }
+        
+        self.TAROT_SPREAD_KEYBOARDS = {
+            "paid": _inline(
+                [(b["spread_1card"], "tarot_1card")],
+                [(b["spread_3cards"], "tarot_3cards")],
+                [(b["spread_5cards"], "tarot_5cards")],
+                [(b["spread_celtic"], "tarot_celtic")]
+            ),
+            "free": _inline(
+                [(b["spread_1card"], "tarot_1card")],
+                [(b["spread_3cards"], "tarot_3cards")],
+                [(b["spread_5cards"] + locked, "upgrade_needed")],
+                [(b["spread_celtic"] + locked, "upgrade_needed")]
+            ),
+        }
+        
+        self.TAROT_RESULT_KEYBOARDS = {
+            "paid": _inline(
+                [(b["save_to_diary"], "diary_save_tarot")],
+                [(b["deepen_reading"], "deepen_tarot")],
+                [(b["another_question"], "tarot")],
+                [(b["daily_energy"], "daily_energy")]
+            ),
+            "free": _inline(
+                [(b["save_to_diary"], "diary_save_tarot")],
+                [(b["deepen_reading"] + locked, "upgrade_needed")],
+                [(b["another_question"], "tarot")],
+                [(b["daily_energy"], "daily_energy")]
+            ),
+        }
+        
+        self.OWN_DECK_LAYOUT_KEYBOARD = _inline(
+            [(b["spread_1card"], "own_1card")],
+            [(b["spread_2cards"], "own_2cards")],
+            [(b["spread_3cards"], "own_3cards")]
+        )
+        
+        self.OWN_DECK_RESULT_KEYBOARD = _inline(
+            [(b["save_to_diary"], "diary_save_tarot")],
+            [(b["continue_dialog"], "continue_own_deck")],
+            [(b["new_layout"], "tarot_own")]
+        )
+        
+        self.DIARY_MENU_KEYBOARDS = {
+            "paid": _inline(
+                [(b["diary_new"], "diary_new")],
+                [(b["diary_view"], "diary_view")],
+                [(b["diary_themes"], "diary_themes")],
+                [(b["diary_patterns"], "diary_patterns")]
+            ),
+            "free": _inline(
+                [(b["diary_new"], "diary_new")],
+                [(b["diary_view"], "diary_view")],
+                [(b["diary_themes"] + locked, "upgrade_needed")],
+                [(b["diary_patterns"] + locked, "upgrade_needed")]
+            ),
+        }
+        
+        self.NOTIFICATIONS_KEYBOARD = _inline(
+            [(b["daily_energy"], "toggle_daily_notif")],
+            [(b["diary_reminder"], "toggle_diary_notif")],
+            [(b["disable_all_notif"], "disable_all_notif")]
+        )
+        
+        self.SUBSCRIPTION_KEYBOARDS = {
+            "paid": _inline(
+                [(b["subscribe_base"], "subscribe_base")],
+                [(b["subscribe_premium"], "subscribe_premium")],
+                [(b["cancel_subscription"], "cancel_subscription")]
+            ),
+            "free": _inline(
+                [(b["subscribe_base"], "subscribe_base")],
+                [(b["subscribe_premium"], "subscribe_premium")]
+            ),
+        }
+        
+        self.PLANS_KEYBOARD = _inline(
+            [(b["view_plans"], "subscription")]
+        )
+    
+    def format_wait(self, seconds: int) -> str:
+        """Wait rounded up to whole minutes, as hours and minutes of this locale"""
+        hours, minutes = divmod(max(math.ceil(seconds / 60), 1), 60)
+        if hours:
+            return self.WAIT_TEMPLATES["hours"].format(hours=hours, minutes=minutes)
+        return self.WAIT_TEMPLATES["minutes"].format(minutes=minutes)
+
+
+# Locale -> compiled catalog
+CATALOGS = {locale: Catalog(locale, catalog["messages"]) for locale, catalog in _MESSAGE_CATALOGS.items()}
+
+
+def get(locale: str) -> Catalog:
+    return CATALOGS.get(locale, CATALOGS[DEFAULT_LOCALE])
+
+
+def for_update(update) -> Catalog:
+    """Catalog in the language of the update's user"""
+    return CATALOGS[locale_for(update.effective_user)]
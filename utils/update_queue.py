@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.database import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Webhook ingress enqueues updates instead of processing them (see worker.py)
+UPDATE_QUEUE_MODE = os.getenv("UPDATE_QUEUE_MODE", "0") == "1"
+UPDATE_QUEUE_DB = os.getenv("UPDATE_QUEUE_DB", os.path.join(DATA_DIR, "updates.sqlite3"))
+# A claimed update not acked within this many seconds is handed out again
+VISIBILITY_TIMEOUT = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 300))
+# Failed updates are retried this many times before being dropped
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 3))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    update_id INTEGER UNIQUE,
+    user_key INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS updates_user ON updates (user_key, id);
+CREATE INDEX IF NOT EXISTS updates_state ON updates (state, id);
+"""
+
+# Head of each user's line that nobody is working on yet
+_CLAIMABLE = """
+SELECT id FROM updates AS u
+WHERE state = 'pending'
+  AND abs(user_key) % ? = ?
+  AND id = (SELECT MIN(id) FROM updates WHERE user_key = u.user_key)
+ORDER BY id
+LIMIT ?
+"""
+
+
+def update_user_key(payload: Dict) -> int:
+    """User (or chat) an update belongs to; unrelated updates get a unique key"""
+    for key, value in payload.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user") or value.get("chat")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return -payload.get("update_id", 0)
+
+
+class DurableUpdateQueue:
+    """SQLite-backed queue of raw Telegram updates shared between processes.
+
+    Updates of one user are handed out strictly one at a time and in
+    arrival order: only the oldest row of a user is claimable, and it
+    stays in the table until acked. Workers take a fixed shard of users
+    (abs(user_key) % shard_count), so a user's conversation state always
+    lives in the same worker process.
+    """
+    
+    def __init__(self, path: str = UPDATE_QUEUE_DB):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    def enqueue(self, payload: Dict) -> bool:
+        """Store an update; False if this update_id was already queued"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT OR IGNORE INTO updates (update_id, user_key, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (payload.get("update_id"), update_user_key(payload), json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            return cursor.rowcount == 1
+    
+    def claim(self, worker: str, limit: int, shard: int = 0, shard_count: int = 1) -> List[Tuple[int, Dict]]:
+        """Lease up to `limit` updates of this shard to the worker"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in conn.execute(_CLAIMABLE, (shard_count, shard, limit))]
+                if not ids:
+                    conn.execute("COMMIT")
+                    return []
+                marks = ",".join("?" * len(ids))
+                conn.execute(
+                    f"UPDATE updates SET state = 'processing', worker = ?, claimed_at = ?, attempts = attempts + 1 "
+                    f"WHERE id IN ({marks})",
+                    (worker, time.time(), *ids)
+                )
+                rows = conn.execute(f"SELECT id, payload FROM updates WHERE id IN ({marks}) ORDER BY id", ids).fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+    
+    def ack(self, row_id: int):
+        """Remove a processed update, unblocking the user's next one"""
+        with self._lock:
+            self._connect().execute("DELETE FROM updates WHERE id = ?", (row_id,))
+    
+    def fail(self, row_id: int):
+        """Put a failed update back, or drop it after MAX_ATTEMPTS"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT attempts, update_id FROM updates WHERE id = ?", (row_id,)).fetchone()
+            if row is None:
+                return
+            if row[0] >= MAX_ATTEMPTS:
+                logger.error(f"Dropping update {row[1]} after {row[0]} failed attempts")
+                conn.execute("DELETE FROM updates WHERE id = ?", (row_id,))
+            else:
+                conn.execute("UPDATE updates SET state = 'pending', worker = NULL WHERE id = ?", (row_id,))
+    
+    def requeue_stale(self, timeout: float = VISIBILITY_TIMEOUT) -> int:
+        """Release leases of workers that died mid-update"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE updates SET state = 'pending', worker = NULL WHERE state = 'processing' AND claimed_at < ?",
+                (time.time() - timeout,)
+            )
+            if cursor.rowcount:
+                logger.warning(f"Requeued {cursor.rowcount} stale updates")
+            return cursor.rowcount
+    
+    def release_worker(self, worker: str):
+        """Hand back everything a worker holds, e.g. on shutdown"""
+        with self._lock:
+            self._connect().execute(
+                "UPDATE updates SET state = 'pending', worker = NULL, attempts = attempts - 1 "
+                "WHERE state = 'processing' AND worker = ?",
+                (worker,)
+            )
+    
+    def depth(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM updates").fetchone()[0]
+    
+    def oldest_age(self) -> Optional[float]:
+        """Seconds the oldest queued update has been waiting"""
+        with self._lock:
+            row = self._connect().execute("SELECT MIN(enqueued_at) FROM updates").fetchone()
+        return time.time() - row[0] if row and row[0] else None
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Queue worker for the scaled deployment mode.
+
+bot_webhook.py with UPDATE_QUEUE_MODE=1 only stores incoming updates in
+the durable queue; each worker process runs the handlers for its shard
+of users (WORKER_INDEX of WORKER_COUNT). Add workers to add throughput.
+"""
+import os
+import socket
+import signal
+import sqlite3
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+from telegram import Update
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import bot
+from utils.logs import setup_logging
+from utils.messaging import build_application, write_calls
+from utils.retention import start_retention
+from utils.subscriptions import start_expiry_sweep
+from utils.update_queue import DurableUpdateQueue, VISIBILITY_TIMEOUT
+
+# Structured logging through a background writer thread
+setup_logging()
+logger = logging.getLogger(__name__)
+
+TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 1))
+# Updates processed at once by this worker (different users only)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 16))
+# Idle wait between queue polls, seconds
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 0.2))
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{WORKER_INDEX}"
+
+# Errors raised by the handlers of the queued update being processed.
+# process_update hands them to the error handlers instead of re-raising,
+# so they are collected here; each process_row task has its own list
+handler_errors: ContextVar[Optional[list]] = ContextVar("handler_errors", default=None)
+
+# Errors that may pass on their own (BadRequest is a NetworkError but permanent)
+TRANSIENT_ERRORS = (NetworkError, RetryAfter, TimeoutError, sqlite3.OperationalError)
+
+
+def is_retryable(errors: list, writes: list) -> bool:
+    """Whether running the handlers again is safe and may succeed.
+
+    Handlers are not idempotent: a retry after a message went out would
+    send it again and record the usage twice. So only transient errors
+    raised before any Bot API write qualify; a write that failed may
+    still have reached the user, so it counts too.
+    """
+    if writes:
+        return False
+    return all(isinstance(e, TRANSIENT_ERRORS) and not isinstance(e, BadRequest) for e in errors)
+
+
+async def record_handler_error(update, context):
+    """Error handler: log the failure and hand it to process_row"""
+    errors = handler_errors.get()
+    # A background task that outlives its row appends to a list nobody reads any more
+    if errors is not None:
+        errors.append(context.error)
+    update_id = getattr(update, "update_id", None)
+    logger.error(f"Handler failed: {context.error}", exc_info=context.error, extra={"update_id": update_id})
+
+
+async def process_row(application, queue: DurableUpdateQueue, row_id: int, payload: dict):
+    """Run handlers for one queued update and ack it, or fail it for a retry"""
+    update_id = payload.get("update_id")
+    errors, writes = [], []
+    handler_errors.set(errors)
+    write_calls.set(writes)
+    try:
+        update = Update.de_json(payload, application.bot)
+        await application.process_update(update)
+    except Exception as e:
+        logger.error(f"Error processing update: {e}", exc_info=True, extra={"update_id": update_id})
+        errors.append(e)
+    
+    if errors and is_retryable(errors, writes):
+        await asyncio.to_thread(queue.fail, row_id)
+    else:
+        if errors:
+            logger.warning(f"Not retrying failed update (Bot API writes: {writes or 'none'})",
+                           extra={"update_id": update_id})
+        await asyncio.to_thread(queue.ack, row_id)
+
+
+async def run_worker():
+    """Claim updates of this shard and process them until stopped"""
+    queue = DurableUpdateQueue()
+    application = build_application(TOKEN)
+    bot.register_handlers(application)
+    application.add_error_handler(record_handler_error)
+    await application.initialize()
+    await application.start()
+    start_retention(application)
+    start_expiry_sweep(application)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    logger.info(f"Worker {WORKER_ID} serving shard {WORKER_INDEX}/{WORKER_COUNT}")
+    running = set()
+    last_sweep = 0.0
+    
+    try:
+        while not stop.is_set():
+            if loop.time() - last_sweep > VISIBILITY_TIMEOUT / 2:
+                await asyncio.to_thread(queue.requeue_stale)
+                last_sweep = loop.time()
+            
+            free_slots = WORKER_CONCURRENCY - len(running)
+            rows = []
+            if free_slots > 0:
+                rows = await asyncio.to_thread(queue.claim, WORKER_ID, free_slots, WORKER_INDEX, WORKER_COUNT)
+            
+            for row_id, payload in rows:
+                task = asyncio.create_task(process_row(application, queue, row_id, payload))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            
+            if not rows:
+                # Wake early when a slot frees up or on shutdown
+                waiters = [asyncio.ensure_future(stop.wait())]
+                if running and free_slots <= 0:
+                    waiters.extend(running)
+                await asyncio.wait(waiters, timeout=WORKER_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                waiters[0].cancel()
+    finally:
+        logger.info(f"Worker {WORKER_ID} stopping, waiting for {len(running)} updates")
+        if running:
+            await asyncio.wait(running, timeout=30)
+        await asyncio.to_thread(queue.release_worker, WORKER_ID)
+        await application.stop()
+        await application.shutdown()
+
+
+def main():
+    """Start the worker"""
+    if not TOKEN:
+        print("Error: TELEGRAM_BOT_TOKEN environment variable not set")
+        return
+    
+    asyncio.run(run_worker())
+
+
+if __name__ == '__main__':
+    main()